@@ -0,0 +1,239 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def retry_after(seconds: float) -> str:
+    """``Retry-After`` takes whole seconds; never advertise less than one."""
+    return str(max(1, math.ceil(seconds)))
+
+
+class RateLimiter:
+    """Token buckets keyed by client address or stream name.
+
+    Each key refills ``rate`` tokens per second up to ``burst``. Buckets are
+    refilled lazily when a key is seen, so idle keys cost nothing; the least
+    recently seen keys are evicted beyond ``max_keys``. ``rate <= 0``
+    disables the limiter.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst if burst else max(1.0, rate)
+        self.max_keys = max_keys
+        # key -> [tokens, last refill]
+        self._buckets: 'OrderedDict[str, List[float]]' = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _bucket(self, key: str, now: float) -> List[float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def wait_time(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Seconds until ``key`` has ``cost`` tokens; 0 if it has them now."""
+        if not self.enabled:
+            return 0.0
+        tokens = self._bucket(key, time.monotonic() if now is None else now)[0]
+        return 0.0 if tokens >= cost else (cost - tokens) / self.rate
+
+    def take(self, key: str, cost: float = 1.0) -> None:
+        """Spend tokens checked with :meth:`wait_time`."""
+        if self.enabled:
+            self._bucket(key, time.monotonic())[0] -= cost
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class LoopMonitor:
+    """Tracks event-loop lag: how late a short periodic sleep wakes up.
+
+    The reported lag jumps to a new peak at once and decays over a few
+    intervals, so one slow callback trips shedding briefly rather than
+    for good.
+    """
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.lag = lag if lag > self.lag else self.lag * 0.7 + lag * 0.3
+            self.max_lag = max(self.max_lag, lag)
+
+
+class QueryGate:
+    """Caps concurrent expensive queries; a bounded number may wait briefly for a slot."""
+
+    def __init__(self, concurrency: int, max_waiting: int, wait_timeout: float):
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.running = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> bool:
+        """Return True once a slot is held, False if the query should be rejected."""
+        if self.concurrency <= 0:
+            self.running += 1
+            return True
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.running += 1
+        return True
+
+    def release(self) -> None:
+        self.running -= 1
+        if self._semaphore is not None and self.concurrency > 0:
+            self._semaphore.release()
+
+
+class AdmissionControl:
+    """Admission decisions for annotation ingest and query requests.
+
+    Requests are checked cheapest first: load shedding (event-loop lag or a
+    watched queue over its limit) answers 503, per-client and per-stream
+    token buckets answer 429, and queries must then get a slot from the
+    :class:`QueryGate`. Every decision is counted for the admin endpoint.
+    """
+
+    def __init__(self, ingest_client: RateLimiter, ingest_stream: RateLimiter, query_client: RateLimiter,
+                 gate: QueryGate, max_loop_lag: float = 0.5, monitor: Optional[LoopMonitor] = None):
+        self.ingest_client = ingest_client
+        self.ingest_stream = ingest_stream
+        self.query_client = query_client
+        self.gate = gate
+        self.max_loop_lag = max_loop_lag
+        self.monitor = monitor or LoopMonitor()
+        # name -> (depth probe, limit)
+        self.queues: Dict[str, Tuple[Callable[[], int], int]] = {}
+        self.counters: Dict[str, Dict[str, int]] = {
+            kind: {"admitted": 0, "rate_limited": 0, "shed": 0}
+            for kind in ('ingest', 'query', 'export')
+        }
+        self.counters['query']['rejected'] = 0
+        self.shed_reasons: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionControl':
+        return cls(
+            ingest_client=RateLimiter(float(os.getenv('RATE_LIMIT_INGEST', 100)),
+                                      float(os.getenv('RATE_LIMIT_INGEST_BURST', 0))),
+            ingest_stream=RateLimiter(float(os.getenv('RATE_LIMIT_STREAM', 500)),
+                                      float(os.getenv('RATE_LIMIT_STREAM_BURST', 0))),
+            query_client=RateLimiter(float(os.getenv('RATE_LIMIT_QUERY', 20)),
+                                     float(os.getenv('RATE_LIMIT_QUERY_BURST', 0))),
+            gate=QueryGate(
+                int(os.getenv('QUERY_CONCURRENCY', 4)),
+                int(os.getenv('QUERY_MAX_WAITING', 16)),
+                float(os.getenv('QUERY_WAIT_TIMEOUT', 2))
+            ),
+            max_loop_lag=float(os.getenv('SHED_LOOP_LAG', 0.5))
+        )
+
+    def watch_queue(self, name: str, probe: Callable[[], int], limit: int) -> None:
+        """Shed load while ``probe()`` reports more than ``limit`` queued items (0 disables)."""
+        if limit > 0:
+            self.queues[name] = (probe, limit)
+
+    def shed_reason(self) -> Optional[str]:
+        if self.max_loop_lag > 0 and self.monitor.lag > self.max_loop_lag:
+            return 'loop_lag'
+        for name, (probe, limit) in self.queues.items():
+            if probe() > limit:
+                return name
+        return None
+
+    def shed(self, kind: str) -> Optional[Tuple[str, float]]:
+        """Return ``(reason, retry after)`` if ``kind`` requests are being shed."""
+        reason = self.shed_reason()
+        if reason is None:
+            return None
+        self.counters[kind]['shed'] += 1
+        self.shed_reasons[reason] = self.shed_reasons.get(reason, 0) + 1
+        return reason, max(1.0, self.monitor.lag * 2)
+
+    def limit(self, kind: str, client: str, stream: Optional[str] = None) -> float:
+        """Spend one token for the client (and, for ingest, the stream); returns the wait if limited.
+
+        Queries and exports share the per-client query bucket.
+        """
+        if kind == 'ingest':
+            wait = self.ingest_client.wait_time(client)
+            if stream is not None:
+                wait = max(wait, self.ingest_stream.wait_time(stream))
+        else:
+            wait = self.query_client.wait_time(client)
+        if wait > 0:
+            self.counters[kind]['rate_limited'] += 1
+            return wait
+
+        if kind == 'ingest':
+            self.ingest_client.take(client)
+            if stream is not None:
+                self.ingest_stream.take(stream)
+        else:
+            self.query_client.take(client)
+        return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loop_lag_ms": round(self.monitor.lag * 1000, 3),
+            "max_loop_lag_ms": round(self.monitor.max_lag * 1000, 3),
+            "shedding": self.shed_reason(),
+            "queues": {
+                name: {"depth": probe(), "limit": limit}
+                for name, (probe, limit) in self.queues.items()
+            },
+            "queries": {
+                "running": self.gate.running,
+                "waiting": self.gate.waiting,
+                "concurrency": self.gate.concurrency
+            },
+            "tracked_keys": {
+                "ingest_client": len(self.ingest_client),
+                "ingest_stream": len(self.ingest_stream),
+                "query_client": len(self.query_client)
+            },
+            "limits": {
+                "ingest_per_client": [self.ingest_client.rate, self.ingest_client.burst],
+                "ingest_per_stream": [self.ingest_stream.rate, self.ingest_stream.burst],
+                "query_per_client": [self.query_client.rate, self.query_client.burst],
+                "max_loop_lag_ms": self.max_loop_lag * 1000
+            },
+            "counters": self.counters,
+            "shed_reasons": self.shed_reasons
+        }
@@ -0,0 +1,260 @@
+"""Scripted load generators for the RTAP HTTP, WebSocket and HLS endpoints."""
+
+import asyncio
+import json
+import random
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+SEVERITIES = ['low', 'medium', 'high', 'critical']
+AREAS = ['entrance', 'parking', 'lobby', 'corridor']
+
+
+class Recorder:
+    """Collects request latencies and errors for one scenario."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, seconds: float, size: int = 0) -> None:
+        self.latencies.append(seconds)
+        self.bytes += size
+
+    def stop(self) -> None:
+        self.finished = time.perf_counter()
+
+    def result(self, **extra: Any) -> Dict[str, Any]:
+        duration = (self.finished or time.perf_counter()) - self.started
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))
+            return round(latencies[index] * 1000, 3)
+
+        result = {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(latencies) / duration, 2) if duration else 0,
+            "bytes": self.bytes,
+            "latency_ms": {
+                "p50": percentile(50),
+                "p90": percentile(90),
+                "p99": percentile(99),
+                "max": percentile(100),
+            },
+        }
+        result.update(extra)
+        return result
+
+
+def make_annotation(index: int, base: datetime) -> Dict[str, Any]:
+    timestamp = base + timedelta(milliseconds=index * 10)
+    return {
+        "timestamp": timestamp.isoformat().replace('+00:00', 'Z'),
+        "severity": SEVERITIES[index % len(SEVERITIES)],
+        "confidence": round(random.random(), 3),
+        "frame": index,
+        "location": {"area": AREAS[index % len(AREAS)]},
+        "sent_at": time.time(),
+    }
+
+
+async def _run_workers(concurrency: int, worker) -> None:
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+
+async def ingest(base_url: str, stream: str, count: int, concurrency: int = 32,
+                 annotation_type: str = 'event', name: str = 'ingest') -> Dict[str, Any]:
+    """POST ``count`` annotations as fast as ``concurrency`` connections allow."""
+    recorder = Recorder(name)
+    url = f"{base_url}/api/streams/{stream}/annotations/{annotation_type}"
+    base = datetime.now(timezone.utc) - timedelta(hours=1)
+    counter = iter(range(count))
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        async def worker(_):
+            for index in counter:
+                payload = make_annotation(index, base)
+                started = time.perf_counter()
+                try:
+                    async with session.post(url, json=payload) as response:
+                        body = await response.read()
+                        if response.status != 200:
+                            recorder.errors += 1
+                            continue
+                        recorder.record(time.perf_counter() - started, len(body))
+                except aiohttp.ClientError:
+                    recorder.errors += 1
+
+        await _run_workers(concurrency, worker)
+
+    recorder.stop()
+    return recorder.result(concurrency=concurrency)
+
+
+QUERIES = [
+    {},
+    {"severity": "high"},
+    {"location.area": "parking"},
+    {"type": "event", "severity": "critical"},
+]
+
+
+async def query(base_url: str, stream: str, duration: float, concurrency: int = 8) -> Dict[str, Any]:
+    """Issue filtered GET queries (including time windows) for ``duration`` seconds."""
+    recorder = Recorder('query')
+    url = f"{base_url}/api/streams/{stream}/annotations"
+    now = datetime.now(timezone.utc)
+    deadline = time.perf_counter() + duration
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        async def worker(index):
+            while time.perf_counter() < deadline:
+                params = dict(QUERIES[index % len(QUERIES)])
+                window_start = now - timedelta(minutes=random.randint(5, 60))
+                params["start"] = window_start.isoformat()
+                params["end"] = (window_start + timedelta(minutes=5)).isoformat()
+                index += 1
+                started = time.perf_counter()
+                try:
+                    async with session.get(url, params=params) as response:
+                        body = await response.read()
+                        if response.status != 200:
+                            recorder.errors += 1
+                            continue
+                        recorder.record(time.perf_counter() - started, len(body))
+                except aiohttp.ClientError:
+                    recorder.errors += 1
+
+        await _run_workers(concurrency, worker)
+
+    recorder.stop()
+    return recorder.result(concurrency=concurrency)
+
+
+async def websocket_fanout(base_url: str, stream: str, clients: int, messages: int,
+                           rate: float = 100.0) -> Dict[str, Any]:
+    """Connect ``clients`` WebSocket listeners and measure delivery latency.
+
+    A producer posts ``messages`` annotations at ``rate`` per second; each
+    carries its send time so listeners can compute end-to-end latency.
+    """
+    recorder = Recorder('websocket_fanout')
+    ws_url = base_url.replace('http', 'ws', 1) + '/ws'
+    received = [0] * clients
+    done = asyncio.Event()
+
+    async with aiohttp.ClientSession() as session:
+        sockets = await asyncio.gather(*(session.ws_connect(ws_url) for _ in range(clients)))
+
+        async def listen(index, ws):
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                for item in _decode_messages(message.data):
+                    data = item.get("annotation", {}).get("data", {})
+                    if item.get("stream_name") != stream or "sent_at" not in data:
+                        continue
+                    recorder.record(time.time() - data["sent_at"])
+                    received[index] += 1
+                if done.is_set() and received[index] >= messages:
+                    break
+
+        listeners = [asyncio.create_task(listen(i, ws)) for i, ws in enumerate(sockets)]
+
+        url = f"{base_url}/api/streams/{stream}/annotations/event"
+        base = datetime.now(timezone.utc)
+        for index in range(messages):
+            try:
+                async with session.post(url, json=make_annotation(index, base)) as response:
+                    await response.read()
+            except aiohttp.ClientError:
+                recorder.errors += 1
+            await asyncio.sleep(1 / rate)
+        done.set()
+
+        try:
+            await asyncio.wait_for(asyncio.gather(*listeners), timeout=10)
+        except asyncio.TimeoutError:
+            for task in listeners:
+                task.cancel()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(ws.close() for ws in sockets)), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+
+    recorder.stop()
+    expected = clients * messages
+    return recorder.result(
+        clients=clients,
+        messages=messages,
+        delivered=sum(received),
+        delivery_ratio=round(sum(received) / expected, 4) if expected else None,
+    )
+
+
+def _decode_messages(text: str) -> List[Dict[str, Any]]:
+    payload = json.loads(text)
+    return payload if isinstance(payload, list) else [payload]
+
+
+SEGMENT_RE = re.compile(r'^[^#\s].*$', re.MULTILINE)
+
+
+async def hls_players(base_url: str, stream: str, players: int, duration: float,
+                      poll_interval: float = 2.0) -> Dict[str, Any]:
+    """Simulate ``players`` HLS clients polling the playlist and pulling new segments."""
+    recorder = Recorder('hls_players')
+    playlist_url = f"{base_url}/hls/{stream}/stream.m3u8"
+    deadline = time.perf_counter() + duration
+    segments_fetched = 0
+
+    async with aiohttp.ClientSession() as session:
+        async def player(index):
+            nonlocal segments_fetched
+            seen = set()
+            await asyncio.sleep(random.random() * poll_interval)
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    async with session.get(playlist_url) as response:
+                        text = await response.text()
+                        if response.status != 200:
+                            recorder.errors += 1
+                            await asyncio.sleep(poll_interval)
+                            continue
+                        recorder.record(time.perf_counter() - started, len(text))
+
+                    base = playlist_url.rsplit('/', 1)[0]
+                    for uri in SEGMENT_RE.findall(text):
+                        if uri in seen:
+                            continue
+                        seen.add(uri)
+                        started = time.perf_counter()
+                        async with session.get(f"{base}/{uri}") as response:
+                            body = await response.read()
+                            if response.status != 200:
+                                recorder.errors += 1
+                                continue
+                            recorder.record(time.perf_counter() - started, len(body))
+                            segments_fetched += 1
+                except aiohttp.ClientError:
+                    recorder.errors += 1
+                await asyncio.sleep(poll_interval)
+
+        await _run_workers(players, player)
+
+    recorder.stop()
+    return recorder.result(players=players, segments_fetched=segments_fetched)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""Reproducible RTAP benchmark harness.
+
+Starts a local server (or targets ``--url``), feeds it synthetic video clips
+through a file source or a local RTSP stand-in, runs the load generators and
+writes throughput, latency percentiles and server RSS to a JSON report.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+import loadgen
+from synth import PRESETS, ensure_clip
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Metrics where a higher value is a regression; everything else is "higher is better"
+LOWER_IS_BETTER = ('latency_ms', 'rss_mb', 'errors')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class RSSSampler:
+    """Samples a process's resident set size in the background."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            rss = read_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.pid:
+            self._task = asyncio.create_task(self._run())
+
+    def mark(self) -> Optional[float]:
+        rss = read_rss_mb(self.pid) if self.pid else None
+        return round(rss, 1) if rss is not None else None
+
+    async def stop(self) -> Dict[str, Optional[float]]:
+        if self._task:
+            self._task.cancel()
+        if not self.samples:
+            return {"start": None, "peak": None, "end": None}
+        return {
+            "start": round(self.samples[0], 1),
+            "peak": round(max(self.samples), 1),
+            "end": round(self.samples[-1], 1),
+        }
+
+
+def start_server(port: int, log_path: Path) -> subprocess.Popen:
+    # Load generators drive one client address far past the default rate limits;
+    # set RATE_LIMIT_* in the environment to benchmark with limits on
+    env = dict(RATE_LIMIT_INGEST='0', RATE_LIMIT_STREAM='0', RATE_LIMIT_QUERY='0')
+    env.update(os.environ, RTAP_PORT=str(port), RTAP_HOST='127.0.0.1')
+    log = open(log_path, 'w')
+    return subprocess.Popen([sys.executable, 'rtap.py'], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def publish_rtsp(clip: Path, url: str) -> subprocess.Popen:
+    """Loop ``clip`` in real time to an RTSP server (e.g. rtsp-simple-server) with ffmpeg."""
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise RuntimeError('ffmpeg is required for --rtsp-base')
+    return subprocess.Popen(
+        [ffmpeg, '-loglevel', 'error', '-re', '-stream_loop', '-1', '-i', str(clip),
+         '-c', 'copy', '-f', 'rtsp', '-rtsp_transport', 'tcp', url],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_ready(base_url: str, timeout: float = 30) -> None:
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() < deadline:
+            try:
+                async with session.get(f"{base_url}/api/streams") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+async def add_streams(base_url: str, sources: Dict[str, str]) -> None:
+    async with aiohttp.ClientSession() as session:
+        for name, url in sources.items():
+            async with session.post(f"{base_url}/api/streams", json={
+                "name": name,
+                "url": url,
+                "description": "benchmark source"
+            }) as response:
+                if response.status not in (200, 409):
+                    raise RuntimeError(f"Could not add stream {name}: {await response.text()}")
+
+
+async def run_suite(args, base_url: str, pid: Optional[int], sources: Dict[str, str]) -> Dict[str, Any]:
+    sampler = RSSSampler(pid)
+    sampler.start()
+    await add_streams(base_url, sources)
+
+    stream = next(iter(sources))
+    scenarios: Dict[str, Any] = {}
+    selected = set(args.scenario or ['ingest', 'query', 'websocket', 'hls'])
+
+    if 'ingest' in selected:
+        scenarios['ingest'] = await loadgen.ingest(base_url, stream, args.ingest_count, args.concurrency)
+        scenarios['ingest']['rss_mb'] = sampler.mark()
+
+    if 'query' in selected:
+        if args.seed_annotations:
+            scenarios['seed'] = await loadgen.ingest(
+                base_url, stream, args.seed_annotations, args.concurrency * 2, name='seed'
+            )
+        scenarios['query'] = await loadgen.query(base_url, stream, args.duration, args.query_concurrency)
+        scenarios['query']['rss_mb'] = sampler.mark()
+
+    if 'websocket' in selected:
+        scenarios['websocket_fanout'] = await loadgen.websocket_fanout(
+            base_url, stream, args.ws_clients, args.ws_messages, args.ws_rate
+        )
+        scenarios['websocket_fanout']['rss_mb'] = sampler.mark()
+
+    if 'hls' in selected:
+        scenarios['hls_players'] = await loadgen.hls_players(base_url, stream, args.hls_players, args.duration)
+        scenarios['hls_players']['rss_mb'] = sampler.mark()
+
+    return {"scenarios": scenarios, "rss_mb": await sampler.stop()}
+
+
+def flatten(prefix: str, value: Any, out: Dict[str, float]) -> None:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten(f"{prefix}.{key}" if prefix else key, item, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = float(value)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return human readable regressions beyond ``tolerance`` (fractional)."""
+    now: Dict[str, float] = {}
+    before: Dict[str, float] = {}
+    tracked = ('throughput_rps', 'latency_ms.p99', 'rss_mb', 'errors', 'delivery_ratio')
+    flatten('', {"scenarios": current["scenarios"], "rss_mb": current["rss_mb"]}, now)
+    flatten('', {"scenarios": baseline.get("scenarios", {}), "rss_mb": baseline.get("rss_mb", {})}, before)
+
+    regressions = []
+    for key, old in before.items():
+        if key not in now or not any(t in key for t in tracked):
+            continue
+        new = now[key]
+        lower_is_better = any(t in key for t in LOWER_IS_BETTER)
+        if old == 0:
+            # No relative change from zero; errors appearing at all is the regression
+            if lower_is_better and new > 0:
+                regressions.append(f"{key}: 0 -> {new:g}")
+            continue
+        change = (new - old) / abs(old)
+        worse = change > tolerance if lower_is_better else change < -tolerance
+        if worse:
+            regressions.append(f"{key}: {old:g} -> {new:g} ({change:+.1%})")
+    return regressions
+
+
+async def main_async(args) -> int:
+    media_dir = Path(args.media)
+    clips = {
+        f"bench_{preset}_{fps}": ensure_clip(media_dir, preset, fps, args.clip_seconds)
+        for preset in args.preset
+        for fps in args.fps
+    }
+
+    publishers: List[subprocess.Popen] = []
+    if args.rtsp_base:
+        sources = {}
+        for name, clip in clips.items():
+            url = f"{args.rtsp_base.rstrip('/')}/{name}"
+            publishers.append(publish_rtsp(clip, url))
+            sources[name] = url
+        await asyncio.sleep(2)
+    else:
+        sources = {name: str(clip.resolve()) for name, clip in clips.items()}
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        pid = args.pid
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(port, Path(args.server_log))
+        pid = server.pid
+
+    try:
+        await wait_ready(base_url)
+        report = await run_suite(args, base_url, pid, sources)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+        for publisher in publishers:
+            publisher.terminate()
+
+    report["meta"] = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "source": "rtsp" if args.rtsp_base else "file",
+        "streams": list(sources),
+        "args": {k: v for k, v in vars(args).items() if k not in ('baseline',)},
+    }
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the RTAP benchmark suite')
+    parser.add_argument('--url', help='Benchmark an already running server instead of starting one')
+    parser.add_argument('--pid', type=int, help='PID of the server given by --url, for RSS sampling')
+    parser.add_argument('--rtsp-base', help='Publish clips to this RTSP server (e.g. rtsp://localhost:8554) '
+                                            'instead of using file sources')
+    parser.add_argument('--media', default=str(ROOT / 'benchmarks' / 'media'), help='Directory for synthetic clips')
+    parser.add_argument('--preset', action='append', choices=sorted(PRESETS), default=None,
+                        help='Clip resolution preset (default: 720p)')
+    parser.add_argument('--fps', type=int, action='append', default=None, help='Clip frame rate (default: 30)')
+    parser.add_argument('--clip-seconds', type=float, default=20)
+    parser.add_argument('--scenario', action='append', choices=['ingest', 'query', 'websocket', 'hls'])
+    parser.add_argument('--duration', type=float, default=15, help='Seconds for the query and HLS scenarios')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--ingest-count', type=int, default=20000)
+    parser.add_argument('--seed-annotations', type=int, default=100000,
+                        help='Annotations to load before the query scenario (use 1000000+ for large-store runs)')
+    parser.add_argument('--query-concurrency', type=int, default=8)
+    parser.add_argument('--ws-clients', type=int, default=100)
+    parser.add_argument('--ws-messages', type=int, default=500)
+    parser.add_argument('--ws-rate', type=float, default=100)
+    parser.add_argument('--hls-players', type=int, default=20)
+    parser.add_argument('--server-log', default=str(ROOT / 'benchmarks' / 'results' / 'server.log'))
+    parser.add_argument('--output', default=str(ROOT / 'benchmarks' / 'results' /
+                                                 f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"))
+    parser.add_argument('--baseline', help='Previous results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed fractional regression')
+    args = parser.parse_args()
+    args.preset = args.preset or ['720p']
+    args.fps = args.fps or [30]
+
+    Path(args.server_log).parent.mkdir(parents=True, exist_ok=True)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Generate synthetic test-pattern videos for benchmarking RTAP.
+
+The clips are encoded with PyAV so the benchmark does not depend on external
+footage. Each frame contains a moving gradient and a bright block that
+alternates every second, so ``detect_motion`` fires on a predictable share of
+frames.
+"""
+
+import argparse
+from pathlib import Path
+
+import av
+import numpy as np
+
+PRESETS = {
+    '360p': (640, 360),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+
+def render_frame(index: int, width: int, height: int, fps: int) -> np.ndarray:
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    shift = (index * 4) % 256
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[..., 0] = (x + shift) % 256
+    frame[..., 1] = (y + shift) % 256
+    frame[..., 2] = (x[None, :] + y) / 2 % 256
+
+    # Bright block toggling once per second to drive motion annotations
+    if (index // fps) % 2 == 0:
+        bw, bh = width // 3, height // 3
+        left = (index * 8) % (width - bw)
+        frame[bh:2 * bh, left:left + bw] = 255
+    return frame
+
+
+def synthesize(path: Path, width: int, height: int, fps: int, seconds: float,
+               codec: str = 'h264') -> Path:
+    """Encode a test-pattern clip and return its path."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    container = av.open(str(path), mode='w')
+    stream = container.add_stream(codec, rate=fps)
+    stream.width = width
+    stream.height = height
+    stream.pix_fmt = 'yuv420p'
+    stream.options = {'g': str(fps * 2)}
+
+    for index in range(int(fps * seconds)):
+        frame = av.VideoFrame.from_ndarray(render_frame(index, width, height, fps), format='rgb24')
+        for packet in stream.encode(frame):
+            container.mux(packet)
+
+    for packet in stream.encode(None):
+        container.mux(packet)
+    container.close()
+    return path
+
+
+def clip_path(output_dir: Path, preset: str, fps: int) -> Path:
+    return output_dir / f'pattern_{preset}_{fps}fps.mp4'
+
+
+def ensure_clip(output_dir: Path, preset: str, fps: int, seconds: float) -> Path:
+    """Return the clip for ``preset``/``fps``, generating it if missing."""
+    path = clip_path(output_dir, preset, fps)
+    if not path.exists():
+        width, height = PRESETS[preset]
+        synthesize(path, width, height, fps, seconds)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic benchmark videos')
+    parser.add_argument('--output', default='benchmarks/media', help='Output directory')
+    parser.add_argument('--preset', action='append', choices=sorted(PRESETS),
+                        help='Resolution preset (repeatable, default: all)')
+    parser.add_argument('--fps', type=int, action='append', help='Frame rate (repeatable, default: 15 and 30)')
+    parser.add_argument('--seconds', type=float, default=20, help='Clip length in seconds')
+    parser.add_argument('--force', action='store_true', help='Regenerate existing clips')
+    args = parser.parse_args()
+
+    output_dir = Path(args.output)
+    for preset in args.preset or sorted(PRESETS):
+        for fps in args.fps or [15, 30]:
+            path = clip_path(output_dir, preset, fps)
+            if args.force and path.exists():
+                path.unlink()
+            ensure_clip(output_dir, preset, fps, args.seconds)
+            print(f"{path} ({path.stat().st_size // 1024} KiB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from aiohttp import web, ClientSession, ClientTimeout, UnixConnector, ClientError
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_HEADER = 'X-RTAP-Forwarded'
+
+# Address of the original client, so the owning worker can apply per-client limits
+CLIENT_HEADER = 'X-RTAP-Client'
+
+# Forwarded responses can be long downloads (exports, recordings): no overall
+# deadline, only a limit on how long the peer may stay silent
+FORWARD_TIMEOUT = ClientTimeout(total=None, sock_connect=30, sock_read=120)
+
+# Bytes relayed per read of a forwarded response
+FORWARD_CHUNK = 1 << 16
+
+# Headers that describe a single hop and must not be copied when proxying
+HOP_HEADERS = {
+    'host', 'connection', 'keep-alive', 'content-length', 'transfer-encoding',
+    'content-encoding', 'upgrade', 'server', 'date'
+}
+
+
+class HashRing:
+    """Consistent hash ring mapping stream names to worker ids."""
+
+    def __init__(self, nodes: List[int], replicas: int = 64):
+        self._ring: List[int] = []
+        self._owners: Dict[int, int] = {}
+        for node in nodes:
+            for replica in range(replicas):
+                point = self._hash(f"worker-{node}-{replica}")
+                self._ring.append(point)
+                self._owners[point] = node
+        self._ring.sort()
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def owner(self, key: str) -> int:
+        index = bisect.bisect(self._ring, self._hash(key)) % len(self._ring)
+        return self._owners[self._ring[index]]
+
+
+class WorkerBus:
+    """Local IPC bus between worker processes over Unix domain sockets.
+
+    Every worker serves its regular aiohttp application on a Unix socket in
+    addition to the shared TCP port, so peers can forward API requests to
+    the stream owner and fan out broadcasts with plain HTTP calls.
+
+    Broadcasts are queued without waiting on peers; :meth:`run_publisher`
+    sends everything queued within ``publish_window`` seconds as one
+    newline-delimited POST, only to peers with WebSocket subscribers. Peers
+    are assumed to have some until they report none, and announce when they
+    gain their first or lose their last.
+    """
+
+    def __init__(self, worker_id: int, workers: int, socket_dir: Path):
+        self.worker_id = worker_id
+        self.workers = workers
+        self.socket_dir = socket_dir
+        self.ring = HashRing(list(range(workers)))
+        self._sessions: Dict[int, ClientSession] = {}
+        self.publish_window = float(os.getenv('BUS_BATCH_MS', 20)) / 1000
+        self.max_pending = int(os.getenv('BUS_MAX_PENDING', 10000))
+        self.subscribed: Set[int] = set(self.peers)
+        self.dropped = 0
+        self._pending: List[bytes] = []
+        self._has_subscribers = False
+        self._announce = False
+        self._wake = asyncio.Event()
+
+    @property
+    def peers(self) -> List[int]:
+        return [i for i in range(self.workers) if i != self.worker_id]
+
+    def socket_path(self, worker_id: int) -> Path:
+        return self.socket_dir / f'worker-{worker_id}.sock'
+
+    def owner(self, stream_name: str) -> int:
+        return self.ring.owner(stream_name)
+
+    def is_local(self, stream_name: str) -> bool:
+        return self.owner(stream_name) == self.worker_id
+
+    @staticmethod
+    def is_forwarded(request: web.Request) -> bool:
+        """True for requests that arrived from a peer over the bus socket."""
+        if FORWARDED_HEADER not in request.headers or request.transport is None:
+            return False
+        return isinstance(request.transport.get_extra_info('sockname'), str)
+
+    def _session(self, worker_id: int) -> ClientSession:
+        session = self._sessions.get(worker_id)
+        if session is None or session.closed:
+            session = ClientSession(
+                connector=UnixConnector(path=str(self.socket_path(worker_id))),
+                timeout=ClientTimeout(total=30)
+            )
+            self._sessions[worker_id] = session
+        return session
+
+    def forward_headers(self, request: web.Request, client: str) -> Dict[str, str]:
+        """Headers for replaying ``request`` on a peer.
+
+        Bus headers sent by the client are dropped; ``client`` is the address
+        the forwarding worker identified, which the owner trusts.
+        """
+        bus_headers = {FORWARDED_HEADER.lower(), CLIENT_HEADER.lower()}
+        headers = {
+            k: v for k, v in request.headers.items()
+            if k.lower() not in HOP_HEADERS and k.lower() not in bus_headers
+        }
+        headers[FORWARDED_HEADER] = str(self.worker_id)
+        headers[CLIENT_HEADER] = client
+        return headers
+
+    async def forward(self, request: web.Request, worker_id: int, client: str) -> web.StreamResponse:
+        """Replay ``request`` on ``worker_id`` on behalf of ``client`` and stream back its response.
+
+        The body is relayed as it arrives, so a large export or recording is
+        never held in memory and its client sees the first bytes early.
+        """
+        body = await request.read()
+        headers = self.forward_headers(request, client)
+
+        response: Optional[web.StreamResponse] = None
+        try:
+            async with self._session(worker_id).request(
+                request.method,
+                f"http://worker{worker_id}{request.path_qs}",
+                headers=headers,
+                data=body,
+                timeout=FORWARD_TIMEOUT
+            ) as upstream:
+                response = web.StreamResponse(
+                    status=upstream.status,
+                    headers={k: v for k, v in upstream.headers.items() if k.lower() not in HOP_HEADERS}
+                )
+                # The session decodes compressed bodies, which changes their length
+                if upstream.content_length is not None and 'Content-Encoding' not in upstream.headers:
+                    response.content_length = upstream.content_length
+                await response.prepare(request)
+                async for chunk in upstream.content.iter_chunked(FORWARD_CHUNK):
+                    await response.write(chunk)
+                await response.write_eof()
+                return response
+        except (ClientError, ConnectionResetError, asyncio.TimeoutError) as e:
+            logger.error(f"Error forwarding {request.method} {request.path} to worker {worker_id}: {e}")
+            if response is not None and response.prepared:
+                # Headers are sent; the truncated body is the only signal left to the client
+                return response
+            return web.Response(
+                status=502,
+                text=json.dumps({"error": f"Worker {worker_id} unavailable"}),
+                content_type='application/json'
+            )
+
+    def queue_broadcast(self, message: bytes) -> None:
+        """Queue an encoded broadcast for peers; the oldest are dropped beyond ``max_pending``."""
+        if not self.subscribed:
+            return
+        if len(self._pending) >= self.max_pending:
+            del self._pending[0]
+            self.dropped += 1
+        self._pending.append(message)
+        self._wake.set()
+
+    def set_local_subscribers(self, count: int) -> None:
+        """Record this worker's subscriber count; peers hear when it becomes zero or non-zero."""
+        if (count > 0) != self._has_subscribers:
+            self._has_subscribers = count > 0
+            self._announce = True
+            self._wake.set()
+
+    def set_peer_subscribers(self, worker_id: int, count: int) -> None:
+        if worker_id not in self.peers:
+            return
+        if count:
+            self.subscribed.add(worker_id)
+        else:
+            self.subscribed.discard(worker_id)
+
+    async def run_publisher(self) -> None:
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.publish_window)
+            self._wake.clear()
+            if self._announce:
+                self._announce = False
+                await self.publish('/_internal/subscribers', json.dumps({
+                    "worker": self.worker_id,
+                    "subscribers": int(self._has_subscribers)
+                }).encode())
+            batch, self._pending = self._pending, []
+            if batch:
+                await self.send_broadcasts(batch)
+
+    async def send_broadcasts(self, batch: List[bytes]) -> None:
+        """POST queued broadcasts, one JSON message per line, to peers with subscribers."""
+        payload = b'\n'.join(batch)
+
+        async def send(worker_id):
+            try:
+                async with self._session(worker_id).post(
+                    f"http://worker{worker_id}/_internal/broadcast",
+                    data=payload,
+                    headers={FORWARDED_HEADER: str(self.worker_id), 'Content-Type': 'application/x-ndjson'}
+                ) as response:
+                    if response.status == 200:
+                        self.set_peer_subscribers(worker_id, (await response.json()).get('delivered', 1))
+            except (ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Error publishing broadcasts to worker {worker_id}: {e}")
+
+        await asyncio.gather(*(send(worker_id) for worker_id in sorted(self.subscribed)))
+
+    async def publish(self, path: str, payload: bytes) -> None:
+        """POST an encoded JSON ``payload`` to ``path`` on every peer, ignoring unreachable ones."""
+        async def send(worker_id):
+            try:
+                async with self._session(worker_id).post(
+                    f"http://worker{worker_id}{path}",
+                    data=payload,
+                    headers={FORWARDED_HEADER: str(self.worker_id), 'Content-Type': 'application/json'}
+                ) as response:
+                    await response.read()
+            except (ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Error publishing {path} to worker {worker_id}: {e}")
+
+        await asyncio.gather(*(send(worker_id) for worker_id in self.peers))
+
+    async def collect(self, path: str) -> List[bytes]:
+        """GET ``path`` from every peer and return the raw response bodies."""
+        async def fetch(worker_id):
+            try:
+                async with self._session(worker_id).get(
+                    f"http://worker{worker_id}{path}",
+                    headers={FORWARDED_HEADER: str(self.worker_id)}
+                ) as response:
+                    if response.status == 200:
+                        return await response.read()
+            except (ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Error collecting {path} from worker {worker_id}: {e}")
+            return None
+
+        results = await asyncio.gather(*(fetch(worker_id) for worker_id in self.peers))
+        return [result for result in results if result is not None]
+
+    async def close(self) -> None:
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+
+async def _run_worker(worker_id: int, workers: int, socket_dir: Path) -> None:
+    # rtap_server imports this module, so it is imported on use to avoid a cycle
+    from rtap_server import RTAPServer
+
+    server = RTAPServer(worker_id=worker_id, workers=workers, socket_dir=socket_dir)
+    await server.start_server()
+
+
+def _worker_entry(worker_id: int, workers: int, socket_dir: str) -> None:
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    # Ctrl+C is handled by the supervisor, which then terminates its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        asyncio.run(_run_worker(worker_id, workers, Path(socket_dir)))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_supervisor(workers: int, socket_dir: Optional[Path] = None) -> None:
+    """Start ``workers`` server processes sharing the listen port and restart any that die."""
+    socket_dir = socket_dir or Path(os.getenv('RTAP_IPC_DIR', Path(tempfile.gettempdir()) / 'rtap_ipc'))
+    if socket_dir.exists():
+        shutil.rmtree(socket_dir)
+    socket_dir.mkdir(parents=True)
+
+    # Workers share the HLS directory, so it is reset once here instead of per worker
+    hls_dir = Path(tempfile.gettempdir()) / 'rtap_hls'
+    if hls_dir.exists():
+        shutil.rmtree(hls_dir)
+    hls_dir.mkdir()
+
+    context = multiprocessing.get_context('spawn')
+    processes: Dict[int, multiprocessing.Process] = {}
+    stopping = False
+
+    def start(worker_id: int) -> None:
+        process = context.Process(
+            target=_worker_entry,
+            args=(worker_id, workers, str(socket_dir)),
+            name=f'rtap-worker-{worker_id}'
+        )
+        process.start()
+        processes[worker_id] = process
+        logger.info(f"Started worker {worker_id} (pid {process.pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for worker_id in range(workers):
+        start(worker_id)
+
+    try:
+        while not stopping:
+            for worker_id, process in list(processes.items()):
+                if not process.is_alive() and not stopping:
+                    logger.error(f"Worker {worker_id} exited with code {process.exitcode}, restarting")
+                    start(worker_id)
+            time.sleep(1)
+    finally:
+        logger.info("Stopping workers")
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=10)
+        shutil.rmtree(socket_dir, ignore_errors=True)
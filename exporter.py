@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""Bulk export of a stream's annotations as NumPy ``.npz``, CSV or NDJSON.
+
+The server streams exports from ``GET /api/streams/{name}/export``; this
+module is also a CLI that exports from annotation snapshot files offline or
+downloads from a running server:
+
+    python exporter.py snapshots/camera1_*.json --types event -o events.npz
+    python exporter.py --url http://localhost:9000 --stream camera1 \\
+        --start 2024-10-01T00:00:00 --format csv -o camera1.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import math
+import shutil
+import sys
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from models import Annotation, RTSPStream
+from models.encoding import dumps
+from models.filters import AnnotationFilter, FilterError
+
+# Format -> content type
+FORMATS = {
+    'npz': 'application/zip',
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows read, encoded and handed out per chunk
+CHUNK_ROWS = 10000
+
+# Data columns beyond this are left out of CSV and .npz exports
+MAX_COLUMNS = 256
+
+# Characters kept per value in .npz text columns, which are fixed width
+MAX_TEXT = 1024
+
+# Width a number needs once its column has to be stored as text
+NUMBER_WIDTH = 32
+
+# Bytes of a spooled .npz column kept in memory before it moves to a temporary file
+SPOOL_BYTES = 1 << 16
+
+# One annotation list of the store and how many of its items to export
+Source = Tuple[List[Annotation], int]
+
+
+def flatten(data: Dict[str, Any], path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], Any]]:
+    """Yield ``(key path, value)`` for every leaf of ``data``; lists are leaves."""
+    for key, value in data.items():
+        if isinstance(value, dict) and value:
+            yield from flatten(value, path + (key,))
+        else:
+            yield path + (key,), value
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, dict)):
+        return dumps(value).decode()
+    return str(value)
+
+
+def _lookup(data: Dict[str, Any], path: Tuple[str, ...]) -> Any:
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return None if isinstance(data, dict) and data else data
+
+
+class Schema:
+    """Data columns of the exported rows, numeric unless a value says otherwise."""
+
+    def __init__(self):
+        self.rows = 0
+        self.paths: Dict[str, Tuple[str, ...]] = {}
+        self.numeric: Dict[str, bool] = {}
+        self.widths: Dict[str, int] = {}
+        self.type_width = 1
+
+    def add(self, ann: Annotation) -> None:
+        self.rows += 1
+        self.type_width = max(self.type_width, len(ann.type))
+        for path, value in flatten(ann.data):
+            name = 'data.' + '.'.join(path)
+            if name not in self.paths:
+                if len(self.paths) >= MAX_COLUMNS:
+                    continue
+                self.paths[name] = path
+                self.numeric[name] = True
+                self.widths[name] = 1
+            if value is None:
+                continue
+            if _is_number(value):
+                self.widths[name] = max(self.widths[name], NUMBER_WIDTH)
+            else:
+                self.numeric[name] = False
+                self.widths[name] = max(self.widths[name], min(MAX_TEXT, len(_text(value))))
+
+    @property
+    def columns(self) -> List[str]:
+        return sorted(self.paths)
+
+
+class _Sink(io.RawIOBase):
+    """Unseekable file that collects what the zip writer produces."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class Export:
+    """Encodes the annotations of ``sources`` matching a filter, chunk by chunk.
+
+    :meth:`chunks` blocks and is meant to be advanced from a worker thread.
+    At most ``chunk_rows`` rows are materialised at a time. CSV and
+    ``.npz`` first scan the rows once to find their columns. ``.npz`` then
+    spools every column in a second scan and writes the columns one after
+    another, so each is a plain array: epoch seconds for ``timestamp`` and
+    ``created_at``, ``float64`` with NaN for missing numeric fields, and
+    fixed-width strings otherwise. Rows are grouped by annotation type, in
+    arrival order, and stop after the filter's ``limit``.
+    """
+
+    def __init__(self, sources: List[Source], annotation_filter: AnnotationFilter, fmt: str,
+                 chunk_rows: int = CHUNK_ROWS):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        self.sources = sources
+        self.matches = annotation_filter.matches
+        self.limit = annotation_filter.limit
+        self.format = fmt
+        self.chunk_rows = chunk_rows
+
+    @property
+    def content_type(self) -> str:
+        return FORMATS[self.format]
+
+    def rows(self) -> Iterator[List[Annotation]]:
+        """Matching annotations in chunks of at most ``chunk_rows``."""
+        matches = self.matches
+        remaining = self.limit
+        chunk = []
+        for anns, length in self.sources:
+            for start in range(0, length, self.chunk_rows):
+                for ann in anns[start:min(length, start + self.chunk_rows)]:
+                    if matches is None or matches(ann):
+                        chunk.append(ann)
+                        if remaining is not None:
+                            remaining -= 1
+                            if remaining == 0:
+                                yield chunk
+                                return
+                        if len(chunk) == self.chunk_rows:
+                            yield chunk
+                            chunk = []
+        if chunk:
+            yield chunk
+
+    def schema(self) -> Schema:
+        schema = Schema()
+        for chunk in self.rows():
+            for ann in chunk:
+                schema.add(ann)
+        return schema
+
+    def chunks(self) -> Iterator[bytes]:
+        if self.format == 'ndjson':
+            return self._ndjson()
+        if self.format == 'csv':
+            return self._csv()
+        return self._npz()
+
+    def _ndjson(self) -> Iterator[bytes]:
+        for chunk in self.rows():
+            yield b'\n'.join(ann.encoded for ann in chunk) + b'\n'
+
+    def _csv(self) -> Iterator[bytes]:
+        schema = self.schema()
+        columns = [(name, schema.paths[name]) for name in schema.columns]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['timestamp', 'epoch', 'created_at', 'type'] + [name for name, _ in columns])
+        for chunk in self.rows():
+            for ann in chunk:
+                writer.writerow(
+                    [ann.timestamp, '' if ann.epoch is None else ann.epoch, ann.created_at, ann.type] +
+                    [_text(_lookup(ann.data, path)) for _, path in columns]
+                )
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    def _npz(self) -> Iterator[bytes]:
+        import numpy as np
+
+        schema = self.schema()
+        nan = math.nan
+
+        def epoch(ann):
+            return nan if ann.epoch is None else ann.epoch
+
+        def created(ann):
+            value = Annotation.to_epoch(ann.created_at)
+            return nan if value is None else value
+
+        def number_of(path):
+            def get(ann):
+                value = _lookup(ann.data, path)
+                return float(value) if _is_number(value) else nan
+            return get
+
+        def text_of(path):
+            return lambda ann: _text(_lookup(ann.data, path))[:MAX_TEXT]
+
+        columns = [
+            ('timestamp', np.dtype('<f8'), epoch),
+            ('created_at', np.dtype('<f8'), created),
+            ('type', np.dtype(f'<U{schema.type_width}'), lambda ann: ann.type),
+        ]
+        for name in schema.columns:
+            path = schema.paths[name]
+            if schema.numeric[name]:
+                columns.append((name, np.dtype('<f8'), number_of(path)))
+            else:
+                columns.append((name, np.dtype(f'<U{schema.widths[name]}'), text_of(path)))
+
+        spools = [tempfile.SpooledTemporaryFile(SPOOL_BYTES) for _ in columns]
+        try:
+            for chunk in self.rows():
+                for (_, dtype, get), spool in zip(columns, spools):
+                    if dtype.kind == 'f':
+                        values = np.fromiter((get(ann) for ann in chunk), dtype, len(chunk))
+                    else:
+                        values = np.array([get(ann) for ann in chunk], dtype)
+                    spool.write(values.tobytes())
+                # Hand control back between chunks; nothing is ready to send yet
+                yield b''
+
+            sink = _Sink()
+            with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                for (name, dtype, _), spool in zip(columns, spools):
+                    with archive.open(name + '.npy', 'w', force_zip64=True) as entry:
+                        np.lib.format.write_array_header_1_0(entry, {
+                            'descr': np.lib.format.dtype_to_descr(dtype),
+                            'fortran_order': False,
+                            'shape': (schema.rows,)
+                        })
+                        spool.seek(0)
+                        for block in iter(lambda: spool.read(1 << 20), b''):
+                            entry.write(block)
+                            yield sink.take()
+                    spool.close()
+            yield sink.take()
+        finally:
+            for spool in spools:
+                spool.close()
+
+
+def load_snapshots(paths: List[str]) -> RTSPStream:
+    """Read annotation snapshot files written when streams are deleted into one stream."""
+    stream = RTSPStream('snapshot', '')
+    annotations = stream.annotations
+    for path in paths:
+        with open(path, 'rb') as f:
+            snapshot_data = json.load(f)
+        for annotation_type, items in snapshot_data.get('annotations', {}).items():
+            for item in items:
+                ann = Annotation(item.get('type', annotation_type), item.get('data', {}), item.get('timestamp'))
+                if item.get('created_at'):
+                    ann.created_at = item['created_at']
+                    ann.encoded = dumps(ann.to_dict())
+                annotations.setdefault(annotation_type, []).append(ann)
+    return stream
+
+
+def download(url: str, stream: str, fmt: str, query: Dict[str, str], output) -> None:
+    """Stream an export from a running server into ``output``."""
+    params = urllib.parse.urlencode({'format': fmt, **query})
+    export_url = f"{url.rstrip('/')}/api/streams/{urllib.parse.quote(stream)}/export?{params}"
+    with urllib.request.urlopen(export_url) as response:
+        shutil.copyfileobj(response, output, 1 << 20)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Export annotations as .npz, CSV or NDJSON')
+    parser.add_argument('snapshots', nargs='*', help='Annotation snapshot JSON files to export offline')
+    parser.add_argument('--url', help='Export from a running server instead, e.g. http://localhost:9000')
+    parser.add_argument('--stream', help='Stream name (with --url)')
+    parser.add_argument('--format', choices=sorted(FORMATS),
+                        help='Output format (default: from the output file extension, else ndjson)')
+    parser.add_argument('--start', help='Only annotations at or after this ISO timestamp')
+    parser.add_argument('--end', help='Only annotations at or before this ISO timestamp')
+    parser.add_argument('--types', help='Comma-separated annotation types')
+    parser.add_argument('--where', help="Filter expression, e.g. \"confidence >= 0.8\"")
+    parser.add_argument('--limit', help='Stop after this many annotations')
+    parser.add_argument('-o', '--output', default='-', help='Output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    if bool(args.url) == bool(args.snapshots) or (args.url and not args.stream):
+        parser.error('give either snapshot files or --url with --stream')
+
+    fmt = args.format
+    if fmt is None:
+        extension = args.output.rsplit('.', 1)[-1] if '.' in args.output else ''
+        fmt = extension if extension in FORMATS else 'ndjson'
+    query = {key: value for key, value in (
+        ('start', args.start), ('end', args.end), ('types', args.types), ('where', args.where),
+        ('limit', args.limit)
+    ) if value}
+
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    try:
+        if args.url:
+            download(args.url, args.stream, fmt, query, output)
+            return 0
+
+        annotation_filter = AnnotationFilter.from_query(query)
+        stream = load_snapshots(args.snapshots)
+        export = Export(stream.sources(annotation_filter), annotation_filter, fmt)
+        for chunk in export.chunks():
+            output.write(chunk)
+        return 0
+    except FilterError as e:
+        print(f"Invalid filter: {e}", file=sys.stderr)
+    except urllib.error.HTTPError as e:
+        print(f"Export failed: {e.code} {e.read().decode(errors='replace')}", file=sys.stderr)
+    except (OSError, ValueError) as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor
+from fractions import Fraction
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from models.stream import is_valid_name
+from tracing import Tracer
+
+# Preset name -> (height, video bitrate in kbit/s)
+PRESETS: Dict[str, Tuple[int, int]] = {
+    '1080p': (1080, 5000),
+    '720p': (720, 2800),
+    '480p': (480, 1400),
+    '360p': (360, 800),
+    '240p': (240, 400),
+}
+
+
+class Rendition:
+    """One rung of an HLS ladder; ``height=None`` keeps the source resolution."""
+
+    def __init__(self, name: str, height: Optional[int] = None, bitrate: Optional[int] = None):
+        self.name = name
+        self.height = height
+        self.bitrate = bitrate
+        # Resolved from the first decoded frame
+        self.width: Optional[int] = None
+        self.output_height: Optional[int] = None
+
+    def resolve(self, source_width: int, source_height: int) -> Tuple[int, int]:
+        """Scale to ``height`` keeping the aspect ratio, never upscaling; H.264 needs even sizes."""
+        height = min(self.height or source_height, source_height)
+        width = round(source_width * height / source_height)
+        self.width, self.output_height = max(2, width - width % 2), max(2, height - height % 2)
+        return self.width, self.output_height
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "height": self.height, "bitrate": self.bitrate}
+
+
+def _positive_int(entry: Dict[str, Any], key: str, default: Optional[int]) -> Optional[int]:
+    value = entry.get(key)
+    if value is None:
+        return default
+    # JSON null/objects/lists and bools are rejected rather than passed to int()
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Invalid rendition {key}: {value}")
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid rendition {key}: {value}")
+    if number <= 0:
+        raise ValueError(f"Rendition {key} must be positive")
+    return number
+
+
+def parse_renditions(value: Any) -> List[Rendition]:
+    """Parse ``parameters['renditions']``: preset names and/or ``{name, height, bitrate}`` dicts.
+
+    Raises ``ValueError`` for unknown presets or malformed entries.
+    """
+    if not value:
+        return []
+    if not isinstance(value, list):
+        raise ValueError("renditions must be a list")
+
+    renditions = []
+    for entry in value:
+        if isinstance(entry, str):
+            if entry not in PRESETS:
+                raise ValueError(f"Unknown rendition preset '{entry}' (known: {', '.join(PRESETS)})")
+            height, bitrate = PRESETS[entry]
+            renditions.append(Rendition(entry, height, bitrate))
+        elif isinstance(entry, dict) and (entry.get('name') or entry.get('height')):
+            if entry.get('name') is not None and not is_valid_name(entry['name']):
+                raise ValueError(f"Invalid rendition name '{entry['name']}': use letters, digits, '_' and '-'")
+            preset = PRESETS.get(entry.get('name'), (None, None))
+            height = _positive_int(entry, 'height', preset[0])
+            renditions.append(Rendition(
+                entry.get('name') or f"{height}p",
+                height,
+                _positive_int(entry, 'bitrate', preset[1])
+            ))
+        else:
+            raise ValueError(f"Invalid rendition entry: {entry}")
+
+    names = [rendition.name for rendition in renditions]
+    if len(set(names)) != len(names):
+        raise ValueError("Rendition names must be unique")
+    # Highest first, so the master playlist and the legacy stream.m3u8 lead with the best rung
+    renditions.sort(key=lambda rendition: rendition.height or 1 << 30, reverse=True)
+    return renditions
+
+
+def encode_segment(path: str, frames: List[Any], rendition: Rendition, frame_rate: int, tracer: Tracer,
+                   stream_name: str = '', segment_index: int = 0) -> None:
+    """Encode ``frames`` into one MPEG-TS segment; meant to run in a worker thread.
+
+    Every segment uses a fresh encoder with a GOP equal to the segment length
+    and scene-cut keyframes disabled, so each segment starts with an IDR and
+    segment boundaries line up across renditions. The file is written under a
+    temporary name and renamed once complete.
+    """
+    # Deferred like the server's other media imports
+    import av
+    from av.video.reformatter import VideoReformatter
+
+    partial = f"{path}.part"
+    with tracer.span('hls.encode_segment', 'hls', stream=stream_name, segment=segment_index,
+                     rendition=rendition.name):
+        output_container = av.open(partial, mode='w', format='mpegts')
+        try:
+            width, height = rendition.width, rendition.output_height
+            output_stream = output_container.add_stream('h264', rate=frame_rate)
+            output_stream.width = width
+            output_stream.height = height
+            output_stream.pix_fmt = 'yuv420p'
+            output_stream.codec_context.gop_size = len(frames)
+            options = {
+                'tune': 'zerolatency',
+                'preset': os.getenv('HLS_X264_PRESET', 'veryfast'),
+                'sc_threshold': '0'
+            }
+            if rendition.bitrate:
+                output_stream.bit_rate = rendition.bitrate * 1000
+                options['maxrate'] = f"{rendition.bitrate}k"
+                options['bufsize'] = f"{rendition.bitrate * 2}k"
+            output_stream.options = options
+
+            # Frames are shared by all renditions; VideoFrame.reformat caches its scaler
+            # on the frame, so each thread scales with a reformatter of its own
+            reformatter = VideoReformatter()
+            time_base = Fraction(1, frame_rate)
+            for frame in frames:
+                if frame.width != width or frame.height != height or frame.format.name != 'yuv420p':
+                    scaled = reformatter.reformat(frame, width, height, 'yuv420p')
+                    scaled.pts = frame.pts
+                    scaled.time_base = time_base
+                    frame = scaled
+                output_container.mux(output_stream.encode(frame))
+
+            # Flush encoder
+            output_container.mux(output_stream.encode(None))
+        finally:
+            output_container.close()
+    os.replace(partial, path)
+
+
+class EncodeBacklog:
+    """Counts jobs submitted to the encode pool that no worker thread has started yet."""
+
+    def __init__(self, executor: Executor):
+        self.executor = executor
+        self.queued = 0
+        self._lock = threading.Lock()
+
+    def _started(self, job: Dict[str, bool]) -> bool:
+        """Mark ``job`` as started; False if it already was."""
+        with self._lock:
+            if job['started']:
+                return False
+            job['started'] = True
+            self.queued -= 1
+            return True
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> 'asyncio.Future[Any]':
+        """Run ``fn(*args)`` on the encode pool from the event loop."""
+        job = {'started': False}
+
+        def run() -> Any:
+            self._started(job)
+            return fn(*args)
+
+        with self._lock:
+            self.queued += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, run)
+        # Jobs cancelled before a thread picked them up never run
+        future.add_done_callback(lambda _: self._started(job))
+        return future
+
+    def __len__(self) -> int:
+        return self.queued
+
+
+def resolve_ladder(renditions: List[Rendition], source_width: int, source_height: int) -> List[Rendition]:
+    """Resolve output sizes for a source, dropping rungs that collapse onto a larger one."""
+    resolved = []
+    sizes = set()
+    for rendition in renditions:
+        size = rendition.resolve(source_width, source_height)
+        if size not in sizes:
+            sizes.add(size)
+            resolved.append(rendition)
+    return resolved
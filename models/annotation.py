@@ -1,12 +1,17 @@
 from datetime import datetime
 from typing import Dict, Any, Optional
 
+from .encoding import dumps
+
 class Annotation:
     def __init__(self, annotation_type: str, data: dict, timestamp: str):
         self.type = annotation_type
         self.data = data
         self.timestamp = timestamp
         self.created_at = datetime.now().isoformat()
+        self.epoch = self.to_epoch(timestamp)
+        # Annotations are immutable once stored, so they are encoded exactly once
+        self.encoded: bytes = dumps(self.to_dict())
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -62,6 +67,14 @@ class Annotation:
         
         return str(current[last_key]).lower() == str(value).lower()
 
+    @staticmethod
+    def to_epoch(timestamp: str) -> Optional[float]:
+        """Convert an ISO timestamp to seconds since the epoch (naive means local time)."""
+        try:
+            return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+        except (ValueError, TypeError, AttributeError):
+            return None
+
     @staticmethod
     def parse_timestamp(timestamp: str) -> Optional[str]:
         """Parse and validate timestamp string."""
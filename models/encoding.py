@@ -0,0 +1,131 @@
+import json
+import struct
+from typing import Any, Iterable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional speedup
+    msgpack = None
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode ``obj`` as compact JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # e.g. non-string keys or integers beyond 64 bits
+            pass
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def join_array(fragments: Iterable[bytes]) -> bytes:
+    """Assemble a JSON array from already encoded elements."""
+    return b'[' + b','.join(fragments) + b']'
+
+
+def join_object(items: Iterable[tuple]) -> bytes:
+    """Assemble a JSON object from ``(key, encoded value)`` pairs."""
+    return b'{' + b','.join(dumps(key) + b':' + value for key, value in items) + b'}'
+
+
+def _pack(obj: Any, out: bytearray) -> None:
+    """Append the MessagePack encoding of a JSON-compatible value to ``out``."""
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xff)
+        elif 0 <= obj <= 0xffffffffffffffff:
+            if obj <= 0xff:
+                out += struct.pack('>BB', 0xcc, obj)
+            elif obj <= 0xffff:
+                out += struct.pack('>BH', 0xcd, obj)
+            elif obj <= 0xffffffff:
+                out += struct.pack('>BI', 0xce, obj)
+            else:
+                out += struct.pack('>BQ', 0xcf, obj)
+        elif -0x8000000000000000 <= obj < 0:
+            if obj >= -0x80:
+                out += struct.pack('>Bb', 0xd0, obj)
+            elif obj >= -0x8000:
+                out += struct.pack('>Bh', 0xd1, obj)
+            elif obj >= -0x80000000:
+                out += struct.pack('>Bi', 0xd2, obj)
+            else:
+                out += struct.pack('>Bq', 0xd3, obj)
+        else:
+            # JSON allows integers beyond 64 bits; MessagePack does not
+            out += struct.pack('>Bd', 0xcb, float(obj))
+    elif isinstance(obj, float):
+        out += struct.pack('>Bd', 0xcb, obj)
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        size = len(data)
+        if size < 32:
+            out.append(0xa0 | size)
+        elif size <= 0xff:
+            out += struct.pack('>BB', 0xd9, size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xda, size)
+        else:
+            out += struct.pack('>BI', 0xdb, size)
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        size = len(obj)
+        if size <= 0xff:
+            out += struct.pack('>BB', 0xc4, size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xc5, size)
+        else:
+            out += struct.pack('>BI', 0xc6, size)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        out += pack_array_header(len(obj))
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        size = len(obj)
+        if size < 16:
+            out.append(0x80 | size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xde, size)
+        else:
+            out += struct.pack('>BI', 0xdf, size)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        _pack(str(obj), out)
+
+
+def packb(obj: Any) -> bytes:
+    """Encode ``obj`` as MessagePack, using the msgpack package when it is installed."""
+    if msgpack is not None:
+        try:
+            return msgpack.packb(obj, use_bin_type=True)
+        except (TypeError, OverflowError, ValueError):
+            pass
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def pack_array_header(size: int) -> bytes:
+    """MessagePack array header; followed by ``size`` already packed elements."""
+    if size < 16:
+        return bytes((0x90 | size,))
+    if size <= 0xffff:
+        return struct.pack('>BH', 0xdc, size)
+    return struct.pack('>BI', 0xdd, size)
@@ -0,0 +1,377 @@
+import operator
+import re
+from typing import Any, Callable, List, Mapping, Optional, Set, Tuple, Union
+
+from .annotation import Annotation
+
+# Query keys that are not data fields
+RESERVED = {'where', 'format', 'bucket', 'limit'}
+
+# Fields holding ISO timestamps, compared as epoch seconds
+TIME_FIELDS = {'timestamp', 'created_at'}
+
+_MISSING = object()
+
+_ORDERING = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+
+class FilterError(ValueError):
+    """Raised for filter expressions that cannot be parsed."""
+
+
+class Condition:
+    """``field op value`` with the value typed once at parse time."""
+
+    def __init__(self, field: str, op: str, values: List[str]):
+        if op not in ('=', '!=', 'in') and op not in _ORDERING:
+            raise FilterError(f"Unknown operator '{op}'")
+        self.field = field
+        self.op = op
+        self.values = values
+        self.typed = [self._typed(value) for value in values]
+
+    def _typed(self, value: str) -> Tuple[Optional[float], str]:
+        """Return ``(number or None, lower-cased text)``; timestamps become epoch numbers."""
+        if self.field in TIME_FIELDS:
+            epoch = Annotation.to_epoch(value)
+            if epoch is None:
+                raise FilterError(f"Invalid timestamp for {self.field}: '{value}'")
+            return epoch, value.lower()
+        return _number(value), value.lower()
+
+    def __repr__(self) -> str:
+        return f"Condition({self.field!r}, {self.op!r}, {self.values!r})"
+
+
+# Predicate tree: a Condition or ('and' | 'or', [children])
+Node = Union[Condition, Tuple[str, List[Any]]]
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _field_getter(field: str) -> Callable[[Annotation], Any]:
+    if field == 'type':
+        return lambda ann: ann.type
+    if field == 'timestamp':
+        return lambda ann: ann.epoch if ann.epoch is not None else _MISSING
+    if field == 'created_at':
+        return lambda ann: Annotation.to_epoch(ann.created_at)
+
+    parts = field.split('.')
+    last = parts[-1]
+
+    def get(ann: Annotation) -> Any:
+        data = ann.data
+        # Event shorthands kept from matches_filters: 'area' is the location's area
+        # and other keys may be given with any prefix
+        if ann.type == 'event':
+            if last == 'area' and isinstance(data.get('location'), dict):
+                return data['location'].get('area', _MISSING)
+            if last in data:
+                return data[last]
+        current = data
+        for part in parts:
+            if not isinstance(current, dict) or part not in current:
+                return _MISSING
+            current = current[part]
+        return current
+
+    return get
+
+
+def _equals(actual: Any, number: Optional[float], text: str) -> bool:
+    if number is not None:
+        value = _number(actual)
+        if value is not None:
+            return value == number
+    return str(actual).lower() == text
+
+
+def _compile_condition(condition: Condition) -> Callable[[Annotation], bool]:
+    get = _field_getter(condition.field)
+    op = condition.op
+
+    if condition.field == 'type' and op in ('=', '!=', 'in'):
+        # Types compare exactly, as stored annotation lists are keyed
+        values = set(condition.values)
+        negate = op == '!='
+        return lambda ann: (ann.type in values) != negate
+
+    if op in ('=', '!='):
+        number, text = condition.typed[0]
+        negate = op == '!='
+
+        def match(ann: Annotation) -> bool:
+            actual = get(ann)
+            if actual is _MISSING or actual is None:
+                return False
+            return _equals(actual, number, text) != negate
+        return match
+
+    if op == 'in':
+        numbers = {number for number, _ in condition.typed if number is not None}
+        texts = {text for _, text in condition.typed}
+
+        def match(ann: Annotation) -> bool:
+            actual = get(ann)
+            if actual is _MISSING or actual is None:
+                return False
+            if numbers:
+                value = _number(actual)
+                if value is not None and value in numbers:
+                    return True
+            return str(actual).lower() in texts
+        return match
+
+    compare = _ORDERING[op]
+    number, text = condition.typed[0]
+    epoch = Annotation.to_epoch(condition.values[0]) if number is None else None
+
+    def match(ann: Annotation) -> bool:
+        actual = get(ann)
+        if actual is _MISSING or actual is None:
+            return False
+        if number is not None:
+            value = _number(actual)
+            return value is not None and compare(value, number)
+        if epoch is not None and isinstance(actual, str):
+            value = Annotation.to_epoch(actual)
+            if value is not None:
+                return compare(value, epoch)
+        return compare(str(actual).lower(), text)
+    return match
+
+
+def compile_tree(node: Node) -> Callable[[Annotation], bool]:
+    """Compile a predicate tree into a single closure."""
+    if isinstance(node, Condition):
+        return _compile_condition(node)
+    kind, children = node
+    predicates = [compile_tree(child) for child in children]
+    if len(predicates) == 1:
+        return predicates[0]
+    if kind == 'and':
+        def match_all(ann: Annotation) -> bool:
+            for predicate in predicates:
+                if not predicate(ann):
+                    return False
+            return True
+        return match_all
+
+    def match_any(ann: Annotation) -> bool:
+        for predicate in predicates:
+            if predicate(ann):
+                return True
+        return False
+    return match_any
+
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<string>'[^']*'|"[^"]*")
+      | (?P<op>>=|<=|!=|=|>|<|\(|\)|,)
+      | (?P<word>[^\s=!<>(),'"]+)
+    )""", re.VERBOSE)
+
+
+def _tokenize(expression: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if not match:
+            raise FilterError(f"Unexpected input at {position}: '{expression[position:]}'")
+        position = match.end()
+        if match.group('string') is not None:
+            tokens.append(('value', match.group('string')[1:-1]))
+        elif match.group('op') is not None:
+            tokens.append(('op', match.group('op')))
+        else:
+            word = match.group('word')
+            keyword = word.lower()
+            tokens.append(('keyword', keyword) if keyword in ('and', 'or', 'in') else ('value', word))
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over ``expr := term (or term)*; term := factor (and factor)*``."""
+
+    def __init__(self, expression: str):
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, kind: Optional[str] = None, value: Optional[str] = None) -> Tuple[str, str]:
+        token = self.peek()
+        if token is None or (kind and token[0] != kind) or (value and token[1] != value):
+            expected = value or kind or 'more input'
+            raise FilterError(f"Expected {expected} but found {token[1] if token else 'end of expression'}")
+        self.position += 1
+        return token
+
+    def parse(self) -> Node:
+        node = self.expression()
+        if self.peek() is not None:
+            raise FilterError(f"Unexpected '{self.peek()[1]}'")
+        return node
+
+    def expression(self) -> Node:
+        children = [self.term()]
+        while self.peek() == ('keyword', 'or'):
+            self.take()
+            children.append(self.term())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def term(self) -> Node:
+        children = [self.factor()]
+        while self.peek() == ('keyword', 'and'):
+            self.take()
+            children.append(self.factor())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def factor(self) -> Node:
+        if self.peek() == ('op', '('):
+            self.take()
+            node = self.expression()
+            self.take('op', ')')
+            return node
+
+        field = self.take('value')[1]
+        token = self.take()
+        if token == ('keyword', 'in'):
+            self.take('op', '(')
+            values = [self.take('value')[1]]
+            while self.peek() == ('op', ','):
+                self.take()
+                values.append(self.take('value')[1])
+            self.take('op', ')')
+            return _condition(field, 'in', values)
+        if token[0] != 'op' or token[1] in ('(', ')', ','):
+            raise FilterError(f"Expected an operator after '{field}'")
+        return _condition(field, token[1], [self.take('value')[1]])
+
+
+def _condition(field: str, op: str, values: List[str]) -> Condition:
+    # start/end are shorthands for the annotation timestamp bounds
+    if field == 'start':
+        return Condition('timestamp', '>=', values)
+    if field == 'end':
+        return Condition('timestamp', '<=', values)
+    return Condition(field, op, values)
+
+
+def parse_where(expression: str) -> Node:
+    return _Parser(expression).parse()
+
+
+_KEY_OPERATOR = re.compile(r'^(?P<field>[^<>!]+?)(?P<op>>=|<=|!=|>|<)(?P<value>.*)$')
+
+
+def parse_query(query: Mapping[str, str]) -> Node:
+    """Build a predicate tree from query parameters (all conditions must hold).
+
+    Plain ``key=value`` pairs are equality tests. Since ``confidence>=0.8``
+    reaches the server as key ``confidence>`` with value ``0.8``, keys ending
+    in ``>``, ``<`` or ``!`` take the matching ``>=``, ``<=`` or ``!=``
+    operator, and ``frame>10`` (no ``=``) arrives as a key with an empty
+    value. ``types`` takes a comma-separated set of annotation types, and
+    ``where`` a full expression such as
+    ``confidence >= 0.8 and severity in (high, critical)``.
+    """
+    children: List[Node] = []
+    for key, value in query.items():
+        if key == 'where':
+            if value.strip():
+                node = parse_where(value)
+                # Top-level conjunctions join the other conditions, so type tests in them narrow the scan
+                if not isinstance(node, Condition) and node[0] == 'and':
+                    children.extend(node[1])
+                else:
+                    children.append(node)
+            continue
+        if key in RESERVED:
+            continue
+        if key == 'types':
+            types = [t.strip() for t in value.split(',') if t.strip()]
+            if types:
+                children.append(Condition('type', 'in', types))
+            continue
+        if key[-1] in '<>!' and value != '':
+            children.append(_condition(key[:-1], key[-1] + '=' if key[-1] != '!' else '!=', [value]))
+            continue
+        match = _KEY_OPERATOR.match(key) if not value else None
+        if match:
+            children.append(_condition(match.group('field'), match.group('op'), [match.group('value')]))
+            continue
+        children.append(_condition(key, '=', [value]))
+    return ('and', children)
+
+
+def _is_type_test(node: Node) -> bool:
+    return isinstance(node, Condition) and node.field == 'type' and node.op in ('=', 'in')
+
+
+def type_constraint(node: Node) -> Optional[Set[str]]:
+    """Annotation types a tree can match, if it pins ``type``; empty when constraints conflict."""
+    if isinstance(node, Condition):
+        return set(node.values) if _is_type_test(node) else None
+    kind, children = node
+    if kind == 'and':
+        types = None
+        for child in children:
+            child_types = type_constraint(child)
+            if child_types is not None:
+                types = child_types if types is None else types & child_types
+        return types
+    constraints = [type_constraint(child) for child in children]
+    if children and all(types is not None for types in constraints):
+        return set().union(*constraints)
+    return None
+
+
+class AnnotationFilter:
+    """A query parsed once into a predicate tree and compiled into a closure."""
+
+    def __init__(self, tree: Node, limit: Optional[int] = None):
+        self.tree = tree
+        self.limit = limit
+        # Annotation types to scan; the caller must select exactly these lists
+        self.types = type_constraint(tree)
+        if _is_type_test(tree):
+            tree = ('and', [])
+        elif self.types is not None and tree[0] == 'and':
+            # Every top-level type test allows a superset of the intersection
+            # being scanned, so scanning only those types fully enforces it
+            tree = ('and', [child for child in tree[1] if not _is_type_test(child)])
+        self.matches = compile_tree(tree) if isinstance(tree, Condition) or tree[1] else None
+
+    @classmethod
+    def from_query(cls, query: Mapping[str, str]) -> 'AnnotationFilter':
+        limit = None
+        if query.get('limit'):
+            try:
+                limit = int(query['limit'])
+            except ValueError:
+                limit = 0
+            if limit <= 0:
+                raise FilterError(f"limit must be a positive integer, got '{query['limit']}'")
+        return cls(parse_query(query), limit)
@@ -0,0 +1,148 @@
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Bucket name -> (seconds per bucket, buckets retained)
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    '1s': (1, 900),      # 15 minutes
+    '1m': (60, 1440),    # 24 hours
+    '1h': (3600, 720),   # 30 days
+}
+
+# Distinct numeric fields tracked per type; further fields are ignored
+MAX_FIELDS = 16
+
+# Distinct annotation types rolled up per stream; further types are ignored.
+# Each type costs up to about 1.6 MB of rings, and types come from clients.
+MAX_TYPES = 32
+
+_EMPTY = -1
+
+
+def numeric_fields(data: Dict[str, Any], prefix: str = '') -> Iterator[Tuple[str, float]]:
+    """Yield ``(dotted.key, value)`` for every numeric leaf of ``data``."""
+    for key, value in data.items():
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float)):
+            yield prefix + key, float(value)
+        elif isinstance(value, dict):
+            yield from numeric_fields(value, f"{prefix}{key}.")
+
+
+class Rollup:
+    """Ring of fixed-width time buckets with count and min/max/sum per numeric field.
+
+    Bucket ``b`` (epoch seconds // resolution) lives in slot ``b % capacity``;
+    a slot is reset when a newer bucket claims it, so memory is constant and
+    updates and lookups are O(1) per bucket.
+    """
+
+    def __init__(self, resolution: int, capacity: int):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.newest = _EMPTY
+        self.buckets = array('q', [_EMPTY]) * capacity
+        self.counts = array('q', [0]) * capacity
+        # field -> interleaved (min, max, sum, n) per slot
+        self.fields: Dict[str, array] = {}
+
+    def _claim(self, bucket: int) -> Optional[int]:
+        if self.newest != _EMPTY and bucket <= self.newest - self.capacity:
+            return None  # older than the retained window
+        slot = bucket % self.capacity
+        if self.buckets[slot] != bucket:
+            if self.buckets[slot] > bucket:
+                return None
+            self.buckets[slot] = bucket
+            self.counts[slot] = 0
+            for stats in self.fields.values():
+                stats[slot * 4 + 3] = 0
+        if bucket > self.newest:
+            self.newest = bucket
+        return slot
+
+    def add(self, epoch: float, values: Iterable[Tuple[str, float]]) -> None:
+        slot = self._claim(int(epoch // self.resolution))
+        if slot is None:
+            return
+        self.counts[slot] += 1
+        for name, value in values:
+            stats = self.fields.get(name)
+            if stats is None:
+                if len(self.fields) >= MAX_FIELDS:
+                    continue
+                stats = self.fields[name] = array('d', [0.0]) * (self.capacity * 4)
+            i = slot * 4
+            if stats[i + 3] == 0:
+                stats[i] = stats[i + 1] = value
+                stats[i + 2] = 0.0
+            else:
+                if value < stats[i]:
+                    stats[i] = value
+                if value > stats[i + 1]:
+                    stats[i + 1] = value
+            stats[i + 2] += value
+            stats[i + 3] += 1
+
+    def bucket(self, bucket: int) -> Optional[Tuple[int, Dict[str, List[float]]]]:
+        """Return ``(count, {field: [min, max, sum, n]})`` for a retained bucket."""
+        slot = bucket % self.capacity
+        if self.buckets[slot] != bucket or not self.counts[slot]:
+            return None
+        i = slot * 4
+        return self.counts[slot], {
+            name: list(stats[i:i + 4])
+            for name, stats in self.fields.items()
+            if stats[i + 3]
+        }
+
+
+def make_rollups() -> Dict[str, Rollup]:
+    return {name: Rollup(resolution, capacity) for name, (resolution, capacity) in RESOLUTIONS.items()}
+
+
+def aggregate(rollups: List[Rollup], start: Optional[float] = None,
+              end: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Merge same-resolution rollups into non-empty buckets between ``start`` and ``end``."""
+    rollups = [rollup for rollup in rollups if rollup.newest != _EMPTY]
+    if not rollups:
+        return []
+    resolution = rollups[0].resolution
+    newest = max(rollup.newest for rollup in rollups)
+    first = newest - rollups[0].capacity + 1
+    last = newest
+    if start is not None:
+        first = max(first, int(start // resolution))
+    if end is not None:
+        last = min(last, int(end // resolution))
+
+    result = []
+    for bucket in range(first, last + 1):
+        count = 0
+        merged: Dict[str, List[float]] = {}
+        for rollup in rollups:
+            found = rollup.bucket(bucket)
+            if found is None:
+                continue
+            count += found[0]
+            for name, (low, high, total, n) in found[1].items():
+                stats = merged.get(name)
+                if stats is None:
+                    merged[name] = [low, high, total, n]
+                else:
+                    stats[0] = min(stats[0], low)
+                    stats[1] = max(stats[1], high)
+                    stats[2] += total
+                    stats[3] += n
+        if not count:
+            continue
+        result.append({
+            "start": datetime.fromtimestamp(bucket * resolution).isoformat(),
+            "count": count,
+            "fields": {
+                name: {"min": low, "max": high, "avg": total / n, "count": int(n)}
+                for name, (low, high, total, n) in merged.items()
+            }
+        })
+    return result
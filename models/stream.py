@@ -1,6 +1,24 @@
+import re
+import time
+from bisect import bisect_left, bisect_right
 from datetime import datetime
-from typing import Dict, Optional, List
+from itertools import islice
+from typing import Any, Dict, Optional, List, Tuple, Union
 from .annotation import Annotation
+from .encoding import dumps, join_array, join_object
+from .filters import AnnotationFilter
+from .rollup import MAX_TYPES, Rollup, make_rollups, numeric_fields
+
+# Seconds of client clock skew tolerated before an annotation is kept out of the rollups
+FUTURE_SKEW = 300
+
+# Stream and rendition names become directory names under the HLS and recording directories
+NAME_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+
+def is_valid_name(name: Any) -> bool:
+    return isinstance(name, str) and NAME_PATTERN.fullmatch(name) is not None
+
 
 class RTSPStream:
     def __init__(self, name: str, url: str, description: str = "", parameters: Optional[Dict] = None):
@@ -13,6 +31,11 @@ class RTSPStream:
         self.created_at = datetime.now().isoformat()
         self.updated_at = self.created_at
         self.annotations: Dict[str, List[Annotation]] = {}
+        # Annotations with a parseable timestamp in epoch order, for time-range lookups
+        self._epochs: List[float] = []
+        self._by_epoch: List[Annotation] = []
+        # type -> bucket name -> Rollup
+        self.rollups: Dict[str, Dict[str, Rollup]] = {}
 
     def to_dict(self) -> Dict:
         return {
@@ -30,6 +53,24 @@ class RTSPStream:
             }
         }
 
+    def to_json(self) -> bytes:
+        """Encode the stream like ``to_dict`` but reuse cached annotation JSON."""
+        head = dumps({
+            "name": self.name,
+            "url": self.url,
+            "description": self.description,
+            "parameters": self.parameters,
+            "status": self.status,
+            "last_error": self.last_error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        })
+        annotations = join_object(
+            (k, join_array(ann.encoded for ann in v))
+            for k, v in self.annotations.items()
+        )
+        return head[:-1] + b',"annotations":' + annotations + b'}'
+
     def add_annotation(self, annotation_type: str, data: dict, timestamp: str) -> Annotation:
         """Add an annotation to the stream."""
         if annotation_type not in self.annotations:
@@ -45,10 +86,37 @@ class RTSPStream:
         
         annotation = Annotation(annotation_type, processed_data, timestamp)
         self.annotations[annotation_type].append(annotation)
+        if annotation.epoch is not None:
+            # Live annotations arrive in order and land at the end
+            index = bisect_right(self._epochs, annotation.epoch)
+            self._epochs.insert(index, annotation.epoch)
+            self._by_epoch.insert(index, annotation)
+        self.update_rollups(annotation)
         return annotation
 
-    def get_annotations(self, filters: Optional[Dict] = None) -> List[Annotation]:
+    def between(self, start: float, end: float) -> List[Annotation]:
+        """Annotations with ``start <= epoch < end``, in epoch order."""
+        return self._by_epoch[bisect_left(self._epochs, start):bisect_left(self._epochs, end)]
+
+    def update_rollups(self, annotation: Annotation) -> None:
+        """Fold an annotation into the per-type time-bucket rollups."""
+        # A far-future timestamp would advance the rings past all live data
+        if annotation.epoch is None or annotation.epoch > time.time() + FUTURE_SKEW:
+            return
+        rollups = self.rollups.get(annotation.type)
+        if rollups is None:
+            if len(self.rollups) >= MAX_TYPES:
+                return
+            rollups = self.rollups[annotation.type] = make_rollups()
+        values = list(numeric_fields(annotation.data))
+        for rollup in rollups.values():
+            rollup.add(annotation.epoch, values)
+
+    def get_annotations(self, filters: Optional[Union[Dict, AnnotationFilter]] = None) -> List[Annotation]:
         """Get all annotations that match the given filters."""
+        if isinstance(filters, AnnotationFilter):
+            return self.select(filters)
+
         all_annotations = []
         for annotations in self.annotations.values():
             all_annotations.extend(annotations)
@@ -57,3 +125,26 @@ class RTSPStream:
             return all_annotations
         
         return [ann for ann in all_annotations if ann.matches_filters(filters)]
+
+    def sources(self, annotation_filter: AnnotationFilter) -> List[Tuple[List[Annotation], int]]:
+        """The lists a filter allows, with their current lengths.
+
+        Stored lists are append-only, so the first ``length`` items of each
+        stay fixed while a worker thread scans them. Call on the event loop.
+        """
+        if annotation_filter.types is None:
+            lists = list(self.annotations.values())
+        else:
+            lists = [self.annotations[t] for t in sorted(annotation_filter.types) if t in self.annotations]
+        return [(anns, len(anns)) for anns in lists]
+
+    def select(self, annotation_filter: AnnotationFilter,
+               sources: Optional[List[Tuple[List[Annotation], int]]] = None) -> List[Annotation]:
+        """Annotations matching a compiled filter, scanning only the types it allows."""
+        if sources is None:
+            sources = self.sources(annotation_filter)
+
+        matches = annotation_filter.matches
+        if matches is None:
+            return [ann for anns, length in sources for ann in islice(anns, length)]
+        return [ann for anns, length in sources for ann in islice(anns, length) if matches(ann)]
@@ -0,0 +1,192 @@
+import bisect
+import logging
+import math
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# start (epoch s), duration (s), PTS of the first frame (90 kHz), byte offset, byte length
+INDEX_RECORD = struct.Struct('<dfQQI')
+
+# Gap between recorded segments, in seconds, that starts a new discontinuity
+GAP_TOLERANCE = 0.5
+
+# (chunk, start, duration, pts, offset, length)
+Entry = Tuple['Chunk', float, float, int, int, int]
+
+
+class Chunk:
+    """One chunk file of back-to-back MPEG-TS segments and its binary index."""
+
+    __slots__ = ('path', 'start', 'end')
+
+    def __init__(self, path: Path, start: float, end: float):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    @property
+    def index_path(self) -> Path:
+        return self.path.with_suffix('.idx')
+
+    def read_index(self) -> List[Tuple[float, float, int, int, int]]:
+        try:
+            data = self.index_path.read_bytes()
+        except OSError:
+            return []
+        usable = len(data) - len(data) % INDEX_RECORD.size
+        return list(INDEX_RECORD.iter_unpack(data[:usable]))
+
+
+class Recording:
+    """Rolling on-disk recording of a stream's HLS segments.
+
+    Segments are appended unchanged to the current chunk file with one write
+    each, followed by a fixed-size index record, so the disk sees sequential
+    appends. Chunks roll over every ``chunk_seconds`` and are deleted once
+    older than ``retention`` seconds.
+    Only the open chunk's index is held in memory; closed chunks are looked
+    up by time and their index read on demand.
+    """
+
+    def __init__(self, directory: Path, chunk_seconds: float = 600, retention: float = 86400):
+        self.directory = directory
+        self.chunk_seconds = chunk_seconds
+        self.retention = retention
+        self.chunks: List[Chunk] = []
+        self._current: Optional[Chunk] = None
+        self._current_entries: List[Tuple[float, float, int, int, int]] = []
+        self._data = None
+        self._index = None
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        """Pick up chunks recorded before a restart.
+
+        A chunk without a usable index cannot be served or aged out, so it is
+        deleted rather than left on disk forever.
+        """
+        paths = {path.with_suffix('') for path in self.directory.glob('*.ts')}
+        paths |= {path.with_suffix('') for path in self.directory.glob('*.idx')}
+        for base in sorted(paths):
+            chunk = Chunk(base.with_suffix('.ts'), 0.0, 0.0)
+            records = chunk.read_index()
+            if not records or not chunk.path.exists():
+                logger.warning(f"Removing recording chunk {base} without a usable index")
+                chunk.path.unlink(missing_ok=True)
+                chunk.index_path.unlink(missing_ok=True)
+                continue
+            chunk.start = records[0][0]
+            chunk.end = records[-1][0] + records[-1][1]
+            self.chunks.append(chunk)
+        self.chunks.sort(key=lambda chunk: chunk.start)
+
+    def _roll(self, start: float) -> None:
+        self._close_files()
+        path = self.directory / f"{int(start * 1000)}.ts"
+        self._current = Chunk(path, start, start)
+        self._current_entries = []
+        # Segments are already whole writes, and each index record is written
+        # straight through so a crash loses at most the segment being appended
+        self._data = open(path, 'ab', buffering=0)
+        self._index = open(self._current.index_path, 'ab', buffering=0)
+        self.chunks.append(self._current)
+        logger.info(f"Recording to new chunk {path}")
+
+    def _close_files(self) -> None:
+        if self._data:
+            self._data.close()
+            self._data = None
+        if self._index:
+            self._index.close()
+            self._index = None
+
+    def append(self, segment_path: Path, start: float, duration: float, pts: int) -> None:
+        """Append a finished segment file; blocking, meant for a worker thread."""
+        data = segment_path.read_bytes()
+        with self._lock:
+            if self._current is None or start - self._current.start >= self.chunk_seconds:
+                self._roll(start)
+            offset = self._data.tell()
+            self._data.write(data)
+            record = (start, duration, pts, offset, len(data))
+            self._index.write(INDEX_RECORD.pack(*record))
+            self._current_entries.append(record)
+            self._current.end = start + duration
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete chunks that ended before the retention window; returns how many."""
+        cutoff = (now or time.time()) - self.retention
+        removed = 0
+        with self._lock:
+            while self.chunks and self.chunks[0].end < cutoff and self.chunks[0] is not self._current:
+                chunk = self.chunks.pop(0)
+                chunk.path.unlink(missing_ok=True)
+                chunk.index_path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def chunk(self, name: str) -> Optional[Chunk]:
+        for chunk in self.chunks:
+            if chunk.path.name == name:
+                return chunk
+        return None
+
+    def entries(self, start: float, end: float) -> List[Entry]:
+        """Recorded segments overlapping ``[start, end]``, oldest first."""
+        with self._lock:
+            chunks = list(self.chunks)
+            current, current_entries = self._current, list(self._current_entries)
+
+        # Chunks are ordered by start time; skip those that start after the window
+        last = bisect.bisect_right([chunk.start for chunk in chunks], end)
+        result = []
+        for chunk in chunks[:last]:
+            if chunk.end < start:
+                continue
+            records = current_entries if chunk is current else chunk.read_index()
+            for seg_start, duration, pts, offset, length in records:
+                if seg_start + duration >= start and seg_start <= end:
+                    result.append((chunk, seg_start, duration, pts, offset, length))
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
+            self._current = None
+
+
+def vod_playlist(entries: List[Entry], frame_clock: int = 90000) -> str:
+    """A VOD playlist addressing recorded segments by byte range inside their chunks."""
+    target = max(math.ceil(duration) for _, _, duration, _, _, _ in entries)
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:4',
+        f'#EXT-X-TARGETDURATION:{target}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+    ]
+    previous = None
+    for chunk, start, duration, pts, offset, length in entries:
+        if previous is not None:
+            _, prev_start, prev_duration, prev_pts, _, _ = previous
+            expected_pts = prev_pts + round(prev_duration * frame_clock)
+            if pts != expected_pts or start - (prev_start + prev_duration) > GAP_TOLERANCE:
+                lines.append('#EXT-X-DISCONTINUITY')
+                previous = None
+        if previous is None:
+            lines.append('#EXT-X-PROGRAM-DATE-TIME:' +
+                         datetime.fromtimestamp(start, timezone.utc).isoformat(timespec='milliseconds'))
+        lines.append(f'#EXTINF:{duration:.3f},')
+        lines.append(f'#EXT-X-BYTERANGE:{length}@{offset}')
+        lines.append(chunk.path.name)
+        previous = (chunk, start, duration, pts, offset, length)
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
@@ -1,6 +1,9 @@
+import argparse
 import asyncio
 import logging
+import os
 from rtap_server import RTAPServer
+from cluster import run_supervisor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,7 +19,15 @@ async def main():
         logger.error(f"Error in main: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='RTAP server')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('RTAP_WORKERS', 1)),
+                        help='Number of worker processes; streams are sharded across them')
+    args = parser.parse_args()
+
     try:
-        asyncio.run(main())
+        if args.workers > 1:
+            run_supervisor(args.workers)
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Application stopped by user")
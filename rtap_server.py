@@ -1,21 +1,35 @@
 import asyncio
+import importlib
 import json
-import cv2
-import numpy as np
 from datetime import datetime
 from aiohttp import web
-import av
-import yaml
 import os
 import logging
-from typing import Dict, Set, Optional, List, Any
+from typing import Dict, Set, Optional, List, Any, Tuple
 from pathlib import Path
 from dotenv import load_dotenv
 import tempfile
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
 import traceback
 
 from models import RTSPStream, Annotation
+from models.stream import is_valid_name
+from models.encoding import dumps, join_array, join_object
+from models.rollup import RESOLUTIONS, aggregate
+from models.filters import AnnotationFilter, FilterError
+from tracing import Tracer, SamplingProfiler, SORT_KEYS
+from cluster import WorkerBus, CLIENT_HEADER
+from admission import AdmissionControl, retry_after
+from settings import load_config, validate_parameters
+from supervisor import StreamSupervisor, FrameReader, Backoff, StreamStalled, FAILED, timing_parameter
+from sidecars import Segment, SegmentTimeline, MPEGTS_CLOCK, sidecar
+from ladder import EncodeBacklog, Rendition, parse_renditions, resolve_ladder, encode_segment
+from recorder import Recording, vod_playlist
+from exporter import Export, FORMATS
+from subscribers import Broadcast, Interner, Subscriber, JSON_PROTOCOL, MSGPACK_PROTOCOL
 
 # Load environment variables
 load_dotenv()
@@ -27,22 +41,97 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class LazyModule:
+    """Defers importing a heavy module until one of its attributes is used."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# Media libraries take most of the import time; load them on first use so the
+# HTTP listener comes up before any stream is opened.
+av = LazyModule('av')
+cv2 = LazyModule('cv2')
+np = LazyModule('numpy')
+
+
 class RTAPServer:
-    def __init__(self):
-        self.clients: Set[web.WebSocketResponse] = set()
+    def __init__(self, worker_id: Optional[int] = None, workers: int = 1, socket_dir: Optional[Path] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        self.config = config if config is not None else load_config()
+        self.clients: Set[Subscriber] = set()
+        self.interner = Interner()
+        self.ws_batch_ms = float(os.getenv('WS_BATCH_MS', 50))
+        self.ws_max_pending = int(os.getenv('WS_MAX_PENDING', 1000))
+        self.ws_compress = os.getenv('WS_COMPRESS', 'true').lower() == 'true'
         self.streams: Dict[str, RTSPStream] = {}
         self.running = False
-        self.port = int(os.getenv('RTAP_PORT', 9000))
-        self.host = os.getenv('RTAP_HOST', '0.0.0.0')
+        self.port = int(os.getenv('RTAP_PORT', self.config.get('port', 9000)))
+        self.host = os.getenv('RTAP_HOST', self.config.get('host', '0.0.0.0'))
+        self.open_concurrency = int(os.getenv('RTAP_OPEN_CONCURRENCY', self.config.get('open_concurrency', 8)))
+        self.open_semaphore: Optional[asyncio.Semaphore] = None
+        self.open_executor = ThreadPoolExecutor(max_workers=self.open_concurrency, thread_name_prefix='open')
+        self.open_timeout = float(os.getenv('OPEN_TIMEOUT', 10))
+        # Bounds blocking reads so decoder threads of stalled sources exit
+        self.read_timeout = float(os.getenv('STALL_TIMEOUT', 10))
         self.annotation_window = int(os.getenv('ANNOTATION_WINDOW', 5))
         self.processing_tasks = {}
         self.stream_tasks = {}
+        self.supervisors: Dict[str, StreamSupervisor] = {}
+        self.hls_on_demand = os.getenv('HLS_ON_DEMAND', 'true').lower() == 'true'
+        self.hls_idle_timeout = float(os.getenv('HLS_IDLE_TIMEOUT', 30))
+        self.hls_warmup_timeout = float(os.getenv('HLS_WARMUP_TIMEOUT', 15))
+        self.hls_last_access: Dict[str, float] = {}
+        self.hls_ready: Dict[str, asyncio.Event] = {}
+        # Idle packagers still closing their containers
+        self.hls_stopping: Dict[str, asyncio.Task] = {}
+        self.hls_timelines: Dict[str, SegmentTimeline] = {}
+        self.hls_layouts: Dict[str, List[Tuple[Rendition, Path]]] = {}
+        # Segment encodes for every stream and rendition; PyAV releases the GIL in codec work
+        self.encode_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('HLS_ENCODE_THREADS', os.cpu_count() or 4)),
+            thread_name_prefix='encode'
+        )
+        self.encode_backlog = EncodeBacklog(self.encode_executor)
+        # Bulk exports encode in their own threads, away from segment encodes and the event loop
+        self.export_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('EXPORT_THREADS', 2)),
+            thread_name_prefix='export'
+        )
+        self.hls_cue_duration = float(os.getenv('HLS_CUE_DURATION', 1))
+        self.recording_enabled = os.getenv('RECORDING_ENABLED', 'false').lower() == 'true'
+        self.recording_dir = Path(os.getenv('RECORDING_DIR', 'recordings'))
+        self.recordings: Dict[str, Recording] = {}
+        # Seconds between retention passes over recordings of deleted or non-recording streams
+        self.recording_prune_interval = float(os.getenv('RECORDING_PRUNE_INTERVAL', 600))
+        self.admission = AdmissionControl.from_env()
+        # Behind a reverse proxy, e.g. X-Forwarded-For; otherwise the peer address identifies the client
+        self.client_header = os.getenv('RATE_LIMIT_CLIENT_HEADER', '')
+        self.tracer = Tracer.from_env()
+        self.profiler = SamplingProfiler()
+        self.worker_id = worker_id
+        self.bus = WorkerBus(worker_id, workers, socket_dir) if worker_id is not None else None
         self.hls_dir = Path(tempfile.gettempdir()) / 'rtap_hls'
-        if self.hls_dir.exists():
+        # In worker mode the supervisor owns the shared HLS directory
+        if self.hls_dir.exists() and self.bus is None:
             shutil.rmtree(self.hls_dir)
         self.hls_dir.mkdir(exist_ok=True)
         logger.info(f"HLS directory created at: {self.hls_dir}")
 
+        # Segment encodes waiting for a worker thread
+        self.admission.watch_queue(
+            'hls_encode_backlog',
+            lambda: len(self.encode_backlog),
+            int(os.getenv('SHED_ENCODE_BACKLOG', 64))
+        )
+
     def create_hls_manifest(self, stream_name: str, segment_duration: int = 2) -> None:
         """Create initial HLS manifest file"""
         stream_dir = self.hls_dir / stream_name
@@ -58,12 +147,14 @@ class RTAPServer:
 
     async def cleanup_hls(self):
         """Clean up HLS segments periodically"""
+        closed_recordings_due = 0.0
         while self.running:
             try:
-                for stream_dir in self.hls_dir.iterdir():
+                for stream_name in list(self.streams):
+                    stream_dir = self.hls_dir / stream_name
                     if stream_dir.is_dir():
-                        # Keep only recent segments
-                        for file in stream_dir.glob('*.ts'):
+                        # Keep only recent segments, of every rendition
+                        for file in stream_dir.rglob('*.ts'):
                             if (datetime.now().timestamp() - file.stat().st_mtime) > 60:
                                 file.unlink()
                                 logger.debug(f"Removed old segment: {file}")
@@ -71,113 +162,479 @@ class RTAPServer:
                         # Update manifest
                         manifest_path = stream_dir / 'stream.m3u8'
                         if manifest_path.exists():
-                            segments = sorted(stream_dir.glob('*.ts'))
-                            if segments:
-                                self.update_manifest(stream_dir.name, segments)
+                            self.update_manifest(stream_dir.name)
             except Exception as e:
                 logger.error(f"Error cleaning HLS segments: {e}")
+            for name, recording in list(self.recordings.items()):
+                try:
+                    removed = recording.prune()
+                    if removed:
+                        logger.info(f"Removed {removed} expired recording chunks of {name}")
+                except Exception as e:
+                    logger.error(f"Error pruning recording of {name}: {e}")
+            # Closed recordings re-read their indexes, so they are checked less often
+            if time.monotonic() >= closed_recordings_due:
+                closed_recordings_due = time.monotonic() + self.recording_prune_interval
+                await asyncio.get_running_loop().run_in_executor(None, self.prune_closed_recordings)
+            self.stop_idle_hls_streams()
             await asyncio.sleep(10)
 
-    def update_manifest(self, stream_name: str, segments: List[Path]) -> None:
-        """Update HLS manifest with current segments"""
-        stream_dir = self.hls_dir / stream_name
-        manifest_path = stream_dir / 'stream.m3u8'
+    async def open_container(self, url: str):
+        """Open a stream source in a worker thread, bounded by ``open_concurrency``.
+
+        Connecting to a camera can block for seconds; doing it off the event
+        loop lets many streams connect in parallel without stalling the API.
+        """
+        async with self.open_semaphore:
+            future = self.open_executor.submit(
+                lambda: av.open(url, options={
+                    'rtsp_transport': 'tcp',
+                    'rtsp_flags': 'prefer_tcp',
+                    'stimeout': '5000000'
+                }, timeout=(self.open_timeout, self.read_timeout))
+            )
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # The open keeps running in its thread; close the container once it lands
+                def close_when_opened(f):
+                    if not f.cancelled() and f.exception() is None:
+                        f.result().close()
+
+                future.add_done_callback(close_when_opened)
+                raise
+
+    async def bootstrap_streams(self) -> None:
+        """Register the streams declared in the configuration file."""
+        started = time.monotonic()
+        for entry in self.config.get('streams', []):
+            try:
+                name = entry['name']
+                if self.bus and not self.bus.is_local(name):
+                    continue
+                if name in self.streams:
+                    continue
+                stream = RTSPStream(name, entry['url'], entry.get('description', ''), dict(entry['parameters']))
+                self.streams[name] = stream
+                self.start_stream_tasks(stream)
+            except Exception as e:
+                # The listener is already up; one bad entry must not take the server down
+                logger.error(f"Skipping configured stream {entry!r}: {e}")
+        logger.info(f"Bootstrapped {len(self.streams)} configured streams in {time.monotonic() - started:.3f}s")
+
+    @staticmethod
+    def parameter_flag(value: Any, default: bool) -> bool:
+        """Read a boolean stream parameter; strings such as "false" or "0" are false."""
+        if value is None:
+            return default
+        if isinstance(value, str):
+            return value.strip().lower() in ('true', '1', 'yes', 'on')
+        return bool(value)
+
+    def is_hls_on_demand(self, stream: RTSPStream) -> bool:
+        # Recording needs segments whether or not anyone is watching
+        if self.is_recording(stream):
+            return False
+        return self.parameter_flag(stream.parameters.get('hls_on_demand'), self.hls_on_demand)
+
+    def is_recording(self, stream: RTSPStream) -> bool:
+        return self.parameter_flag(stream.parameters.get('record'), self.recording_enabled)
+
+    async def recording_for(self, stream: RTSPStream) -> Recording:
+        """The stream's rolling recording, opened (and earlier chunks loaded) on first use.
+
+        Loading reads every chunk index, so it runs in a worker thread.
+        """
+        recording = self.recordings.get(stream.name)
+        if recording is None:
+            retention = timing_parameter(stream.parameters, 'record_retention')
+            recording = await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: Recording(
+                    self.recording_dir / stream.name,
+                    chunk_seconds=float(os.getenv('RECORDING_CHUNK_SECONDS', 600)),
+                    retention=retention
+                )
+            )
+            # A concurrent caller may have opened it first; nothing is open until the first append
+            recording = self.recordings.setdefault(stream.name, recording)
+        return recording
+
+    def prune_closed_recordings(self) -> None:
+        """Age out recordings nobody has open; blocking, meant for a worker thread.
+
+        These belong to deleted streams, or to streams no longer recording.
+        Footage of a deleted stream is kept for ``RECORDING_RETENTION``
+        seconds in case it is added again; then the emptied directory goes too.
+        """
+        if not self.recording_dir.is_dir():
+            return
+        for directory in self.recording_dir.iterdir():
+            name = directory.name
+            if not directory.is_dir() or name in self.recordings:
+                continue
+            # In worker mode each worker ages out the streams it would own
+            if self.bus and not self.bus.is_local(name):
+                continue
+            stream = self.streams.get(name)
+            try:
+                recording = Recording(
+                    directory, retention=timing_parameter(stream.parameters if stream else {}, 'record_retention')
+                )
+                removed = recording.prune()
+                recording.close()
+                if removed:
+                    logger.info(f"Removed {removed} expired recording chunks of {name}")
+                if not recording.chunks and name not in self.streams:
+                    directory.rmdir()
+                    logger.info(f"Removed recording directory of deleted stream {name}")
+            except Exception as e:
+                logger.error(f"Error pruning recording of {name}: {e}")
+
+    def ensure_hls_stream(self, stream: RTSPStream) -> asyncio.Event:
+        """Start HLS packaging for a stream unless it is already running.
+
+        Returns the event that is set once the first segment is available.
+        """
+        task = self.stream_tasks.get(stream.name)
+        if task is None or task.done():
+            logger.info(f"Starting HLS packaging for {stream.name}")
+            self.hls_ready[stream.name] = asyncio.Event()
+            stopping = self.hls_stopping.get(stream.name)
+            if stopping:
+                # The idle session still owns the stream directory until its container closes
+                self.stream_tasks[stream.name] = asyncio.create_task(self.restart_hls_stream(stream, stopping))
+            else:
+                self.stream_tasks[stream.name] = asyncio.create_task(self.start_hls_stream(stream))
+        return self.hls_ready[stream.name]
+
+    async def restart_hls_stream(self, stream: RTSPStream, stopping: asyncio.Task) -> None:
+        """Start HLS packaging once the previous session has stopped."""
+        await asyncio.wait({stopping})
+        await self.start_hls_stream(stream)
+
+    async def stop_hls_stream(self, name: str) -> None:
+        """Cancel HLS packaging for a stream and wait for its container to close."""
+        task = self.stream_tasks.pop(name, None)
+        self.hls_ready.pop(name, None)
+        if task:
+            task.cancel()
+        stopping = self.hls_stopping.get(name)
+        if stopping:
+            await asyncio.wait({stopping})
+        await self.close_hls_session(name, task)
+
+    async def close_hls_session(self, name: str, task: Optional[asyncio.Task]) -> None:
+        """Wait for a cancelled packager to close its container, then drop its timeline."""
+        if task:
+            await asyncio.gather(task, return_exceptions=True)
+        # A session started meanwhile has its own timeline
+        if name not in self.stream_tasks:
+            self.hls_timelines.pop(name, None)
+            self.hls_layouts.pop(name, None)
+
+    def stop_idle_hls_streams(self) -> None:
+        """Stop on-demand HLS packaging for streams nobody has fetched recently."""
+        now = time.monotonic()
+        for name, task in list(self.stream_tasks.items()):
+            stream = self.streams.get(name)
+            if task.done() or stream is None or not self.is_hls_on_demand(stream) or name in self.hls_stopping:
+                continue
+            idle = now - self.hls_last_access.get(name, 0)
+            if idle > self.hls_idle_timeout:
+                logger.info(f"Stopping HLS packaging for {name} after {idle:.0f}s without viewers")
+                task.cancel()
+                del self.stream_tasks[name]
+                self.hls_ready.pop(name, None)
+                stopping = self.hls_stopping[name] = asyncio.create_task(self.close_hls_session(name, task))
+                stopping.add_done_callback(lambda _, name=name: self.hls_stopping.pop(name, None))
+
+    def remove_hls_dir(self, name: str) -> None:
+        """Delete a stream's HLS directory, refusing any path outside ``hls_dir``."""
+        path = self.hls_dir / name
+        if path.resolve().parent != self.hls_dir.resolve():
+            logger.error(f"Not removing {path}: it is not a stream directory under {self.hls_dir}")
+            return
+        shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def segment_number(segment: Path) -> int:
+        """Numeric index of a ``segment_N.ts`` file, used for ordering."""
+        try:
+            return int(segment.stem.rsplit('_', 1)[-1])
+        except ValueError:
+            return -1
+
+    def rendition_layout(self, stream: RTSPStream) -> List[Tuple[Rendition, Path]]:
+        """Renditions to package with their segment directories.
+
+        Without a configured ladder the single source-resolution rendition
+        keeps the flat ``/hls/{name}/segment_N.ts`` layout.
+        """
+        stream_dir = self.hls_dir / stream.name
+        try:
+            ladder = parse_renditions(stream.parameters.get('renditions'))
+        except (ValueError, TypeError) as e:
+            logger.error(f"Ignoring renditions of {stream.name}: {e}")
+            ladder = []
+        if not ladder:
+            return [(Rendition('source'), stream_dir)]
+        return [(rendition, stream_dir / rendition.name) for rendition in ladder]
+
+    def media_playlist(self, stream_name: str, segments: List[Path], prefix: str = '',
+                       sidecar_prefix: str = '') -> str:
+        """Render a live media playlist for ``segments``; URIs are relative to the playlist."""
+        timeline = self.hls_timelines.get(stream_name)
         
         manifest_content = f"""#EXTM3U
 #EXT-X-VERSION:3
 #EXT-X-TARGETDURATION:2
-#EXT-X-MEDIA-SEQUENCE:{max(0, len(segments) - 3)}
+#EXT-X-MEDIA-SEQUENCE:{self.segment_number(segments[0]) if segments else 0}
 """
         
-        # Add recent segments
-        for segment in segments[-3:]:
+        for segment in segments:
+            timing = timeline.get(self.segment_number(segment)) if timeline else None
+            if timing:
+                # Wall-clock anchor plus a pointer to the segment's annotation sidecar
+                manifest_content += f"""#EXT-X-PROGRAM-DATE-TIME:{timing.program_date_time}
+#EXT-X-DATERANGE:ID="{segment.stem}",START-DATE="{timing.program_date_time}",DURATION={timing.duration:.3f},X-RTAP-ANNOTATIONS="{sidecar_prefix}{segment.stem}.json"
+"""
             manifest_content += f"""#EXTINF:2.0,
-{segment.name}
+{prefix}{segment.name}
 """
-        
-        manifest_path.write_text(manifest_content)
-        logger.debug(f"Updated manifest for {stream_name} with {len(segments[-3:])} segments")
+        return manifest_content
+
+    def update_manifest(self, stream_name: str) -> None:
+        """Update HLS manifests with current segments"""
+        stream_dir = self.hls_dir / stream_name
+        layout = self.hls_layouts.get(stream_name)
+        if not layout:
+            return
+        timeline = self.hls_timelines.get(stream_name)
+
+        variants = []
+        for rendition, directory in layout:
+            segments = sorted(directory.glob('*.ts'), key=self.segment_number)[-3:]
+            if not segments:
+                continue
+            if directory != stream_dir:
+                (directory / 'stream.m3u8').write_text(
+                    self.media_playlist(stream_name, segments, sidecar_prefix='../')
+                )
+            variants.append((rendition, directory, segments))
+        if not variants:
+            return
+
+        # stream.m3u8 stays the entry point for players without ABR support
+        rendition, directory, segments = variants[0]
+        prefix = '' if directory == stream_dir else f"{rendition.name}/"
+        (stream_dir / 'stream.m3u8').write_text(self.media_playlist(stream_name, segments, prefix))
+
+        subtitles_content = f"""#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:2
+#EXT-X-MEDIA-SEQUENCE:{self.segment_number(segments[0])}
+"""
+        for segment in segments:
+            timing = timeline.get(self.segment_number(segment)) if timeline else None
+            if timing:
+                subtitles_content += f"""#EXTINF:{timing.duration:.3f},
+{segment.stem}.vtt
+"""
+        (stream_dir / 'annotations.m3u8').write_text(subtitles_content)
+        self.write_master_playlist(stream_dir, variants)
+        logger.debug(f"Updated manifests for {stream_name} with {len(variants)} renditions")
+
+    def write_master_playlist(self, stream_dir: Path, variants: List[Tuple[Rendition, Path, List[Path]]]) -> None:
+        """Master playlist listing every rendition, paired with the annotation subtitle track."""
+        master_content = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="annotations",NAME="Annotations",LANGUAGE="und",DEFAULT=NO,AUTOSELECT=NO,URI="annotations.m3u8"
+"""
+        for rendition, directory, segments in variants:
+            try:
+                bandwidth = max(1, int(segments[-1].stat().st_size * 8 / 2.0))
+            except OSError:
+                continue
+            if rendition.bitrate:
+                bandwidth = max(bandwidth, rendition.bitrate * 1000)
+            resolution = f",RESOLUTION={rendition.width}x{rendition.output_height}" if rendition.width else ''
+            uri = 'stream.m3u8' if directory == stream_dir else f"{rendition.name}/stream.m3u8"
+            master_content += f"""#EXT-X-STREAM-INF:BANDWIDTH={bandwidth}{resolution},SUBTITLES="annotations"
+{uri}
+"""
+        (stream_dir / 'master.m3u8').write_text(master_content)
+
+    async def write_hls_segment(self, stream: RTSPStream, layout: List[Tuple[Rendition, Path]],
+                                segment: Segment, frames: List[Any], frame_rate: int) -> None:
+        """Encode one segment for every rendition in parallel, then publish it."""
+        results = await asyncio.gather(*(
+            self.encode_backlog.submit(
+                encode_segment,
+                str(directory / f'segment_{segment.index}.ts'),
+                frames,
+                rendition,
+                frame_rate,
+                self.tracer,
+                stream.name,
+                segment.index
+            )
+            for rendition, directory in layout
+        ), return_exceptions=True)
+
+        failed = 0
+        for (rendition, _), result in zip(layout, results):
+            if isinstance(result, Exception):
+                failed += 1
+                logger.error(f"Error creating segment {segment.index} of {stream.name} ({rendition.name}): {result}")
+        if failed == len(layout):
+            return
+
+        if self.is_recording(stream) and not isinstance(results[0], Exception):
+            # The top rendition is recorded as encoded, without another encode pass
+            rendition, directory = layout[0]
+            try:
+                recording = await self.recording_for(stream)
+                await self.encode_backlog.submit(
+                    recording.append,
+                    directory / f'segment_{segment.index}.ts',
+                    segment.start,
+                    segment.duration,
+                    segment.pts
+                )
+            except Exception as e:
+                logger.error(f"Error recording segment {segment.index} of {stream.name}: {e}")
+
+        timeline = self.hls_timelines.get(stream.name)
+        if timeline:
+            timeline.add(segment)
+        self.update_manifest(stream.name)
+        ready = self.hls_ready.get(stream.name)
+        if ready:
+            ready.set()
 
     async def start_hls_stream(self, stream: RTSPStream) -> None:
         stream_dir = self.hls_dir / stream.name
         stream_dir.mkdir(exist_ok=True)
         logger.info(f"Created HLS directory for stream {stream.name}: {stream_dir}")
+
+        # Segments and renditions left over from a previous packaging session are stale.
+        # Only directories the ladder could have created are removed.
+        for old_segment in stream_dir.glob('*.ts'):
+            old_segment.unlink()
+        for old_rendition in stream_dir.iterdir():
+            if is_valid_name(old_rendition.name) and old_rendition.is_dir() and not old_rendition.is_symlink():
+                shutil.rmtree(old_rendition, ignore_errors=True)
+        timeline = self.hls_timelines[stream.name] = SegmentTimeline()
+        ladder = self.rendition_layout(stream)
         
         # Create initial manifest
         self.create_hls_manifest(stream.name)
         segment_index = 0
+        frame_rate = 30
+        # One GOP per segment, identical across renditions
+        segment_frames = 2 * frame_rate
+        # Frames are restamped on one continuous timeline so segments line up with
+        # their sidecars; starting at one second keeps the first DTS non-negative
+        media_frames = frame_rate
+        pending: Optional[asyncio.Task] = None
+
+        backoff = Backoff(
+            base=float(os.getenv('RECONNECT_BASE_DELAY', 1)),
+            cap=float(os.getenv('RECONNECT_MAX_DELAY', 60))
+        )
+        stall_timeout = timing_parameter(stream.parameters, 'stall_timeout')
 
-        while self.running:
-            try:
-                logger.info(f"Starting HLS stream for {stream.name} with URL: {stream.url}")
-                input_container = av.open(stream.url, options={
-                    'rtsp_transport': 'tcp',
-                    'rtsp_flags': 'prefer_tcp',
-                    'stimeout': '5000000'
-                })
-                logger.debug(f"Opened input container for {stream.name}")
-
-                frame_count = 0
-                frames_buffer = []
-                
-                for frame in input_container.decode(video=0):
-                    if not self.running:
-                        break
-                        
-                    frames_buffer.append(frame)
-                    frame_count += 1
-                    
-                    # Create new segment every 60 frames (assuming 30fps = 2 seconds)
-                    if len(frames_buffer) >= 60:
-                        segment_path = stream_dir / f'segment_{segment_index}.ts'
-                        logger.debug(f"Creating segment {segment_path}")
-                        
+        try:
+            while self.running:
+                supervisor = self.supervisors.get(stream.name)
+                if supervisor and supervisor.state == FAILED:
+                    logger.warning(f"Stream {stream.name} has failed, stopping HLS packaging")
+                    break
+
+                reader = None
+                try:
+                    logger.info(f"Starting HLS stream for {stream.name} with URL: {stream.url}")
+                    with self.tracer.span('hls.open', 'hls', stream=stream.name):
+                        input_container = await self.open_container(stream.url)
+                    logger.debug(f"Opened input container for {stream.name}")
+                    reader = FrameReader(input_container, maxsize=120, drop=False, tracer=self.tracer,
+                                         span='hls.decode', stream_name=stream.name).start()
+
+                    frame_count = 0
+                    frames_buffer = []
+                    # Wall-clock time of media time zero, taken from the first frame
+                    clock_origin = None
+                    segment_start = None
+                    layout = None
+
+                    while self.running:
                         try:
-                            output_container = av.open(
-                                str(segment_path),
-                                mode='w',
-                                format='mpegts'
+                            frame = await reader.get(stall_timeout)
+                        except asyncio.TimeoutError:
+                            raise StreamStalled(f"No frames from {stream.name} for {stall_timeout:.1f}s")
+                        if frame is None:
+                            break
+
+                        backoff.reset()
+                        if layout is None:
+                            # Output sizes follow the source, which may change between connections
+                            renditions = resolve_ladder([rendition for rendition, _ in ladder], frame.width, frame.height)
+                            layout = [(rendition, directory) for rendition, directory in ladder if rendition in renditions]
+                            for _, directory in layout:
+                                directory.mkdir(exist_ok=True)
+                            self.hls_layouts[stream.name] = layout
+                        if frame.time is not None:
+                            if clock_origin is None:
+                                clock_origin = time.time() - frame.time
+                            frame_wall_time = clock_origin + frame.time
+                        else:
+                            frame_wall_time = time.time()
+                        if segment_start is None:
+                            segment_start = frame_wall_time
+                        frame.pts = media_frames
+                        frame.time_base = Fraction(1, frame_rate)
+                        # x264 turns source I-frames into extra IDRs; GOPs are placed by the encoder
+                        frame.pict_type = av.video.frame.PictureType.NONE
+                        media_frames += 1
+                        frames_buffer.append(frame)
+                        frame_count += 1
+                        
+                        if len(frames_buffer) >= segment_frames:
+                            # Keep at most one segment encoding while the next one fills
+                            if pending:
+                                await pending
+                            segment_end = max(frame_wall_time + 1 / frame_rate, segment_start)
+                            segment = Segment(
+                                segment_index,
+                                segment_start,
+                                segment_end,
+                                len(frames_buffer) / frame_rate,
+                                frames_buffer[0].pts * MPEGTS_CLOCK // frame_rate
+                            )
+                            logger.debug(f"Creating segment {segment_index} of {stream.name}")
+                            pending = asyncio.create_task(
+                                self.write_hls_segment(stream, layout, segment, frames_buffer, frame_rate)
                             )
-                            
-                            output_stream = output_container.add_stream('h264', rate=30)
-                            output_stream.width = frame.width
-                            output_stream.height = frame.height
-                            output_stream.pix_fmt = 'yuv420p'
-                            
-                            for buffer_frame in frames_buffer:
-                                packet = output_stream.encode(buffer_frame)
-                                if packet:
-                                    output_container.mux(packet)
-                            
-                            # Flush encoder
-                            packet = output_stream.encode(None)
-                            if packet:
-                                output_container.mux(packet)
-                                
-                            output_container.close()
-                            
-                            # Update manifest with new segment
-                            segments = sorted(stream_dir.glob('*.ts'))
-                            self.update_manifest(stream.name, segments)
                             
                             segment_index += 1
                             frames_buffer = []
-                            
-                        except Exception as e:
-                            logger.error(f"Error creating segment: {e}")
-                            continue
-                    
-                    await asyncio.sleep(0.001)
-                    
-            except Exception as e:
-                logger.error(f"Error in HLS stream {stream.name}: {e}")
-                logger.error(f"Traceback: {traceback.format_exc()}")
-                await asyncio.sleep(5)  # Wait before retrying
-            finally:
-                try:
-                    input_container.close()
-                except Exception:
-                    pass
+                            segment_start = segment_end
+                        
+                        await asyncio.sleep(0.001)
+                        
+                except Exception as e:
+                    logger.error(f"Error in HLS stream {stream.name}: {e}")
+                    logger.debug(f"Traceback: {traceback.format_exc()}")
+                finally:
+                    if reader:
+                        reader.stop()
+
+                # Wait before reconnecting, with the same capped backoff as analysis
+                await asyncio.sleep(backoff.next_delay())
+        finally:
+            if pending and not pending.done():
+                pending.cancel()
 
     async def handle_hls_request(self, request: web.Request) -> web.Response:
         stream_name = request.match_info['name']
@@ -186,10 +643,37 @@ class RTAPServer:
         if stream_name not in self.streams:
             logger.warning(f"Stream not found: {stream_name}")
             raise web.HTTPNotFound()
-            
+
+        if self.streams[stream_name].status == 'paused':
+            raise web.HTTPConflict(
+                text=json.dumps({"error": f"Stream '{stream_name}' is paused"}),
+                content_type='application/json'
+            )
+
+        self.hls_last_access[stream_name] = time.monotonic()
         file_path = self.hls_dir / stream_name / file_name
+        rendition = request.match_info.get('rendition')
+        if rendition:
+            names = {r.name for r, directory in self.rendition_layout(self.streams[stream_name])
+                     if directory != self.hls_dir / stream_name}
+            if rendition not in names:
+                raise web.HTTPNotFound()
+            file_path = self.hls_dir / stream_name / rendition / file_name
         logger.debug(f"HLS request for {file_path}")
-        
+
+        if file_name.endswith('.m3u8'):
+            # Start packaging on the first playlist request and hold it until a segment exists
+            ready = self.ensure_hls_stream(self.streams[stream_name])
+            if not ready.is_set():
+                try:
+                    await asyncio.wait_for(ready.wait(), self.hls_warmup_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"HLS warm-up timed out for {stream_name}")
+                    raise web.HTTPServiceUnavailable(headers={'Retry-After': '2'})
+
+        if file_name.endswith(('.vtt', '.json')) and not rendition:
+            return self.serve_sidecar(request, self.streams[stream_name], file_path)
+
         if not file_path.exists():
             logger.warning(f"HLS file not found: {file_path}")
             raise web.HTTPNotFound()
@@ -215,28 +699,141 @@ class RTAPServer:
         else:
             raise web.HTTPNotFound()
 
+    def serve_sidecar(self, request: web.Request, stream: RTSPStream, file_path: Path) -> web.Response:
+        """Serve the WebVTT or JSON annotations overlapping one segment from the cache."""
+        timeline = self.hls_timelines.get(stream.name)
+        segment = timeline.get(self.segment_number(file_path)) if timeline else None
+        if segment is None:
+            raise web.HTTPNotFound()
 
-    def parse_query_filters(self, query: Dict[str, str]) -> Dict[str, Any]:
-        """Parse and validate query parameters into filters."""
-        filters = {}
+        kind = file_path.suffix[1:]
+        options = {'cue_duration': self.hls_cue_duration} if kind == 'vtt' else {}
+        body, etag = sidecar(stream, segment, kind, **options)
+        headers = {
+            'ETag': etag,
+            'Access-Control-Allow-Origin': '*',
+            # Late annotations can still change a sidecar, so clients revalidate
+            'Cache-Control': 'no-cache'
+        }
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(
+            body=body,
+            content_type='text/vtt' if kind == 'vtt' else 'application/json',
+            headers=headers
+        )
+
+
+    async def handle_list_recordings(self, request: web.Request) -> web.Response:
+        """Time ranges of the recorded chunks of a stream."""
+        name = request.match_info['name']
+        stream = self.streams.get(name)
+        if not stream:
+            return web.Response(
+                status=404,
+                text=json.dumps({"error": f"Stream '{name}' not found"}),
+                content_type='application/json'
+            )
 
-        # Handle special time range parameters
-        if 'start' in query:
-            start_time = Annotation.parse_timestamp(query['start'])
-            if start_time:
-                filters['start'] = start_time
+        recording = self.recordings.get(name)
+        if recording is None and (self.recording_dir / name).is_dir():
+            recording = await self.recording_for(stream)
+        chunks = recording.chunks if recording else []
+        return web.Response(
+            text=json.dumps({
+                "stream_name": name,
+                "recording": self.is_recording(stream),
+                "chunks": [
+                    {
+                        "file": chunk.path.name,
+                        "start": datetime.fromtimestamp(chunk.start).isoformat(),
+                        "end": datetime.fromtimestamp(chunk.end).isoformat()
+                    }
+                    for chunk in chunks
+                ]
+            }),
+            content_type='application/json'
+        )
+
+    async def handle_recording(self, request: web.Request) -> web.StreamResponse:
+        """Serve a VOD playlist for a time window, or a recorded chunk (with Range support).
+
+        ``vod.m3u8?start=&end=`` covers a window; ``vod.m3u8?around=<timestamp>``
+        covers ``before``/``after`` seconds (default 30) around e.g. an annotation.
+        """
+        name = request.match_info['name']
+        file_name = request.match_info['file']
+        stream = self.streams.get(name)
+        if not stream:
+            return web.Response(
+                status=404,
+                text=json.dumps({"error": f"Stream '{name}' not found"}),
+                content_type='application/json'
+            )
 
-        if 'end' in query:
-            end_time = Annotation.parse_timestamp(query['end'])
-            if end_time:
-                filters['end'] = end_time
+        recording = self.recordings.get(name)
+        if recording is None and (self.recording_dir / name).is_dir():
+            recording = await self.recording_for(stream)
+        if recording is None:
+            return web.Response(
+                status=404,
+                text=json.dumps({"error": f"No recording for stream '{name}'"}),
+                content_type='application/json'
+            )
 
-        # Handle all other parameters as data filters
-        for key, value in query.items():
-            if key not in ['start', 'end']:
-                filters[key] = value
+        if file_name.endswith('.ts'):
+            chunk = recording.chunk(file_name)
+            if chunk is None or not chunk.path.exists():
+                raise web.HTTPNotFound()
+            return web.FileResponse(
+                chunk.path,
+                headers={
+                    'Content-Type': 'video/mp2t',
+                    'Access-Control-Allow-Origin': '*',
+                    'Cache-Control': 'max-age=3600'
+                }
+            )
+        if file_name != 'vod.m3u8':
+            raise web.HTTPNotFound()
 
-        return filters
+        try:
+            if 'around' in request.query:
+                around = Annotation.to_epoch(request.query['around'])
+                if around is None:
+                    raise ValueError("Invalid around timestamp")
+                start = around - float(request.query.get('before', 30))
+                end = around + float(request.query.get('after', 30))
+            else:
+                start = Annotation.to_epoch(request.query.get('start', ''))
+                end = Annotation.to_epoch(request.query.get('end', '')) if 'end' in request.query else time.time()
+                if start is None or end is None:
+                    raise ValueError("start (and optionally end) or around is required")
+        except ValueError as e:
+            return web.Response(
+                status=400,
+                text=json.dumps({"error": str(e)}),
+                content_type='application/json'
+            )
+
+        entries = await asyncio.get_running_loop().run_in_executor(None, recording.entries, start, end)
+        if not entries:
+            return web.Response(
+                status=404,
+                text=json.dumps({"error": "No recorded footage in the requested window"}),
+                content_type='application/json'
+            )
+        return web.Response(
+            text=vod_playlist(entries),
+            headers={
+                'Content-Type': 'application/vnd.apple.mpegurl',
+                'Access-Control-Allow-Origin': '*'
+            }
+        )
+
+
+    def parse_query_filters(self, query: Dict[str, str]) -> AnnotationFilter:
+        """Parse query parameters once into a compiled filter; raises FilterError."""
+        return AnnotationFilter.from_query(query)
 
 
     async def stream_video(self, request: web.Request) -> web.StreamResponse:
@@ -290,10 +887,10 @@ class RTAPServer:
             stream = self.streams[stream_name]
             annotation = stream.add_annotation(annotation_type, data, timestamp)
 
-            await self.broadcast_annotation(stream_name, annotation.to_dict())
+            await self.broadcast_annotation(stream_name, annotation)
 
             return web.Response(
-                text=json.dumps(annotation.to_dict()),
+                body=annotation.encoded,
                 content_type='application/json'
             )
         except Exception as e:
@@ -305,6 +902,18 @@ class RTAPServer:
             )
 
 
+    @staticmethod
+    def query_annotations(stream: RTSPStream, filters: AnnotationFilter,
+                          sources: List[Tuple[List[Annotation], int]]) -> bytes:
+        """Matching annotations as a JSON array in timestamp order; runs in a worker thread."""
+        annotations = stream.select(filters, sources)
+
+        # Sort by timestamp, comparing instants rather than ISO strings
+        annotations.sort(key=lambda ann: ann.epoch if ann.epoch is not None else float('-inf'))
+        if filters.limit:
+            annotations = annotations[:filters.limit]
+        return join_array(ann.encoded for ann in annotations)
+
     async def handle_get_annotations(self, request: web.Request) -> web.Response:
         try:
             stream_name = request.match_info['name']
@@ -317,20 +926,85 @@ class RTAPServer:
                 )
 
             stream = self.streams[stream_name]
-            filters = self.parse_query_filters(dict(request.query))
+            query = dict(request.query)
+            if request.match_info.get('type'):
+                query['type'] = request.match_info['type']
+            try:
+                filters = self.parse_query_filters(query)
+            except FilterError as e:
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": f"Invalid filter: {e}"}),
+                    content_type='application/json'
+                )
 
-            annotations = stream.get_annotations(filters)
-            annotations_dict = [ann.to_dict() for ann in annotations]
+            # The admission gate stays held while a worker thread scans
+            body = await asyncio.get_running_loop().run_in_executor(
+                None, self.query_annotations, stream, filters, stream.sources(filters)
+            )
+            return web.Response(body=body, content_type='application/json')
+        except Exception as e:
+            logger.error(f"Error getting annotations: {e}")
+            return web.Response(
+                status=500,
+                text=json.dumps({"error": str(e)}),
+                content_type='application/json'
+            )
 
-            # Sort by timestamp
-            annotations_dict.sort(key=lambda x: x['timestamp'])
+
+    async def handle_get_aggregates(self, request: web.Request) -> web.Response:
+        """Per-bucket counts and numeric field stats from the incremental rollups."""
+        try:
+            stream_name = request.match_info['name']
+
+            if stream_name not in self.streams:
+                return web.Response(
+                    status=404,
+                    text=json.dumps({"error": f"Stream '{stream_name}' not found"}),
+                    content_type='application/json'
+                )
+
+            bucket = request.query.get('bucket', '1m')
+            if bucket not in RESOLUTIONS:
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": f"bucket must be one of {', '.join(RESOLUTIONS)}"}),
+                    content_type='application/json'
+                )
+
+            bounds = {}
+            for key in ('start', 'end'):
+                if key in request.query:
+                    bounds[key] = Annotation.to_epoch(request.query[key])
+                    if bounds[key] is None:
+                        return web.Response(
+                            status=400,
+                            text=json.dumps({"error": f"Invalid {key} timestamp"}),
+                            content_type='application/json'
+                        )
+
+            stream = self.streams[stream_name]
+            annotation_type = request.query.get('type')
+            if annotation_type:
+                types = [annotation_type] if annotation_type in stream.rollups else []
+            else:
+                types = list(stream.rollups)
 
             return web.Response(
-                text=json.dumps(annotations_dict),
+                body=dumps({
+                    "stream_name": stream_name,
+                    "type": annotation_type,
+                    "bucket": bucket,
+                    "buckets": aggregate(
+                        [stream.rollups[t][bucket] for t in types],
+                        bounds.get('start'),
+                        bounds.get('end')
+                    )
+                }),
                 content_type='application/json'
             )
         except Exception as e:
-            logger.error(f"Error getting annotations: {e}")
+            logger.error(f"Error getting aggregates: {e}")
             return web.Response(
                 status=500,
                 text=json.dumps({"error": str(e)}),
@@ -338,13 +1012,86 @@ class RTAPServer:
             )
 
 
+    async def handle_export(self, request: web.Request) -> web.StreamResponse:
+        """Stream a stream's annotations as .npz, CSV or NDJSON, encoded in the export threads."""
+        try:
+            stream_name = request.match_info['name']
+
+            if stream_name not in self.streams:
+                return web.Response(
+                    status=404,
+                    text=json.dumps({"error": f"Stream '{stream_name}' not found"}),
+                    content_type='application/json'
+                )
+
+            fmt = request.query.get('format', 'ndjson')
+            if fmt not in FORMATS:
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": f"format must be one of {', '.join(FORMATS)}"}),
+                    content_type='application/json'
+                )
+
+            try:
+                filters = self.parse_query_filters(dict(request.query))
+            except FilterError as e:
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": f"Invalid filter: {e}"}),
+                    content_type='application/json'
+                )
+
+            export = Export(self.streams[stream_name].sources(filters), filters, fmt)
+            response = web.StreamResponse(headers={
+                'Content-Type': export.content_type,
+                'Content-Disposition': f'attachment; filename="{stream_name}.{fmt}"'
+            })
+            await response.prepare(request)
+        except Exception as e:
+            logger.error(f"Error starting export: {e}")
+            return web.Response(
+                status=500,
+                text=json.dumps({"error": str(e)}),
+                content_type='application/json'
+            )
+
+        # Writing waits for the client to drain, so at most one chunk is held at a time
+        loop = asyncio.get_running_loop()
+        chunks = export.chunks()
+        written = 0
+        pending = None
+        try:
+            while True:
+                pending = self.export_executor.submit(next, chunks, None)
+                chunk = await asyncio.wrap_future(pending, loop=loop)
+                if chunk is None:
+                    break
+                if chunk:
+                    await response.write(chunk)
+                    written += len(chunk)
+            await response.write_eof()
+            logger.info(f"Exported {written} bytes of {stream_name} annotations as {fmt}")
+        except ConnectionResetError:
+            logger.info(f"Export of {stream_name} cancelled by the client")
+        except Exception as e:
+            # Headers are sent; the truncated body is the only signal left to the client
+            logger.error(f"Error exporting {stream_name}: {e}")
+        finally:
+            # Release spooled columns; a chunk still being built is closed once the worker is done with it
+            if pending is not None and not pending.done():
+                pending.add_done_callback(lambda _: chunks.close())
+            else:
+                chunks.close()
+        return response
+
+
     async def handle_add_stream(self, request: web.Request) -> web.Response:
         try:
             data = await request.json()
             name = data.get('name')
             url = data.get('url')
             description = data.get('description', '')
-            parameters = data.get('parameters', {})
+            parameters = data.get('parameters') or {}
 
             if not all([name, url]):
                 return web.Response(
@@ -352,6 +1099,24 @@ class RTAPServer:
                     text=json.dumps({"error": "name and url are required"}),
                     content_type='application/json'
                 )
+            if not is_valid_name(name):
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": "name may only contain letters, digits, '_' and '-'"}),
+                    content_type='application/json'
+                )
+
+            try:
+                validate_parameters(parameters)
+            except (ValueError, TypeError) as e:
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": str(e)}),
+                    content_type='application/json'
+                )
+
+            if self.bus and not self.bus.is_local(name) and not self.bus.is_forwarded(request):
+                return await self.bus.forward(request, self.bus.owner(name), self.client_id(request))
 
             if name in self.streams:
                 return web.Response(
@@ -362,14 +1127,10 @@ class RTAPServer:
 
             stream = RTSPStream(name, url, description, parameters)
             self.streams[name] = stream
-
-            # Start both HLS and processing tasks
-            logger.info(f"Starting tasks for stream {name}")
-            self.stream_tasks[name] = asyncio.create_task(self.start_hls_stream(stream))
-            self.processing_tasks[name] = asyncio.create_task(self.process_stream(stream))
+            self.start_stream_tasks(stream)
 
             return web.Response(
-                text=json.dumps(stream.to_dict()),
+                body=stream.to_json(),
                 content_type='application/json'
             )
         except Exception as e:
@@ -382,11 +1143,203 @@ class RTAPServer:
             )
 
 
+    def start_stream_tasks(self, stream: RTSPStream) -> None:
+        # Analysis always runs; HLS packaging waits for the first viewer when on-demand
+        logger.info(f"Starting tasks for stream {stream.name}")
+        if not self.is_hls_on_demand(stream):
+            self.ensure_hls_stream(stream)
+        self.processing_tasks[stream.name] = asyncio.create_task(self.process_stream(stream))
+
+    async def stop_stream_tasks(self, name: str) -> None:
+        """Cancel analysis and HLS tasks and wait until their containers are closed."""
+        logger.info(f"Stopping tasks for stream {name}")
+        task = self.processing_tasks.pop(name, None)
+        if task and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.supervisors.pop(name, None)
+        await self.stop_hls_stream(name)
+
+    async def snapshot_annotations(self, stream: RTSPStream) -> Path:
+        """Write a stream's definition and annotations to the snapshot directory."""
+        snapshot_dir = Path(os.getenv('ANNOTATION_SNAPSHOT_DIR', 'snapshots'))
+        path = snapshot_dir / f"{stream.name}_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+        body = stream.to_json()
+
+        def write():
+            snapshot_dir.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(body)
+
+        await asyncio.get_running_loop().run_in_executor(None, write)
+        logger.info(f"Saved annotation snapshot for {stream.name} to {path}")
+        return path
+
+    async def handle_delete_stream(self, request: web.Request) -> web.Response:
+        try:
+            name = request.match_info['name']
+            stream = self.streams.get(name)
+
+            if not stream:
+                return web.Response(
+                    status=404,
+                    text=json.dumps({"error": f"Stream '{name}' not found"}),
+                    content_type='application/json'
+                )
+
+            await self.stop_stream_tasks(name)
+
+            snapshot_path = None
+            if request.query.get('snapshot', 'false').lower() == 'true':
+                snapshot_path = str(await self.snapshot_annotations(stream))
+
+            del self.streams[name]
+            self.hls_last_access.pop(name, None)
+            self.hls_timelines.pop(name, None)
+            self.hls_layouts.pop(name, None)
+            # Recorded footage stays on disk and is picked up again if the stream is re-added
+            recording = self.recordings.pop(name, None)
+            if recording:
+                recording.close()
+            self.remove_hls_dir(name)
+            logger.info(f"Deleted stream {name}")
+
+            return web.Response(
+                text=json.dumps({"deleted": name, "snapshot": snapshot_path}),
+                content_type='application/json'
+            )
+        except Exception as e:
+            logger.error(f"Error deleting stream: {e}")
+            return web.Response(
+                status=500,
+                text=json.dumps({"error": str(e)}),
+                content_type='application/json'
+            )
+
+    async def handle_update_stream(self, request: web.Request) -> web.Response:
+        """Pause/resume a stream or change its url, description or parameters.
+
+        Parameters are merged; a ``null`` value removes a parameter. A running
+        stream is restarted when its url or parameters change.
+        """
+        try:
+            name = request.match_info['name']
+            stream = self.streams.get(name)
+
+            if not stream:
+                return web.Response(
+                    status=404,
+                    text=json.dumps({"error": f"Stream '{name}' not found"}),
+                    content_type='application/json'
+                )
+
+            data = await request.json()
+            action = data.get('action')
+            if action not in (None, 'pause', 'resume'):
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": "action must be 'pause' or 'resume'"}),
+                    content_type='application/json'
+                )
+            if data.get('parameters') is not None:
+                try:
+                    # Nulls, which remove parameters, pass validation
+                    validate_parameters(data['parameters'])
+                except (ValueError, TypeError) as e:
+                    return web.Response(
+                        status=400,
+                        text=json.dumps({"error": str(e)}),
+                        content_type='application/json'
+                    )
+
+            restart = False
+            if 'url' in data and data['url'] != stream.url:
+                if not data['url']:
+                    return web.Response(
+                        status=400,
+                        text=json.dumps({"error": "url must not be empty"}),
+                        content_type='application/json'
+                    )
+                stream.url = data['url']
+                restart = True
+            if 'description' in data:
+                stream.description = data['description']
+            if isinstance(data.get('parameters'), dict):
+                parameters = dict(stream.parameters)
+                for key, value in data['parameters'].items():
+                    if value is None:
+                        parameters.pop(key, None)
+                    else:
+                        parameters[key] = value
+                # Re-sending the current values must not reset the supervisor and its backoff
+                if parameters != stream.parameters:
+                    stream.parameters = parameters
+                    restart = True
+
+            paused = stream.status == 'paused'
+            if action == 'pause' and not paused:
+                await self.stop_stream_tasks(name)
+                stream.status = 'paused'
+                logger.info(f"Paused stream {name}")
+            elif action == 'resume' and paused:
+                stream.status = 'inactive'
+                self.start_stream_tasks(stream)
+                logger.info(f"Resumed stream {name}")
+            elif restart and not paused:
+                await self.stop_stream_tasks(name)
+                self.start_stream_tasks(stream)
+
+            stream.updated_at = datetime.now().isoformat()
+            return web.Response(
+                body=stream.to_json(),
+                content_type='application/json'
+            )
+        except Exception as e:
+            logger.error(f"Error updating stream: {e}")
+            return web.Response(
+                status=500,
+                text=json.dumps({"error": str(e)}),
+                content_type='application/json'
+            )
+
+    async def handle_restart_stream(self, request: web.Request) -> web.Response:
+        try:
+            name = request.match_info['name']
+            stream = self.streams.get(name)
+
+            if not stream:
+                return web.Response(
+                    status=404,
+                    text=json.dumps({"error": f"Stream '{name}' not found"}),
+                    content_type='application/json'
+                )
+
+            await self.stop_stream_tasks(name)
+            stream.status = 'inactive'
+            stream.last_error = None
+            stream.updated_at = datetime.now().isoformat()
+            self.start_stream_tasks(stream)
+
+            return web.Response(
+                body=stream.to_json(),
+                content_type='application/json'
+            )
+        except Exception as e:
+            logger.error(f"Error restarting stream: {e}")
+            return web.Response(
+                status=500,
+                text=json.dumps({"error": str(e)}),
+                content_type='application/json'
+            )
+
     async def handle_list_streams(self, request: web.Request) -> web.Response:
         try:
-            streams = {name: stream.to_dict() for name, stream in self.streams.items()}
+            body = join_object((name, stream.to_json()) for name, stream in self.streams.items())
+            if self.bus and not self.bus.is_forwarded(request):
+                # Peers answer with JSON objects too; splice their members in
+                members = [body[1:-1]] + [peer[1:-1] for peer in await self.bus.collect(request.path_qs)]
+                body = b'{' + b','.join(member for member in members if member) + b'}'
             return web.Response(
-                text=json.dumps(streams),
+                body=body,
                 content_type='application/json'
             )
         except Exception as e:
@@ -409,8 +1362,13 @@ class RTAPServer:
                     content_type='application/json'
                 )
 
+            body = stream.to_json()
+            supervisor = self.supervisors.get(name)
+            if supervisor:
+                body = body[:-1] + b',"health":' + dumps(supervisor.health()) + b'}'
+
             return web.Response(
-                text=json.dumps(stream.to_dict()),
+                body=body,
                 content_type='application/json'
             )
         except Exception as e:
@@ -422,41 +1380,63 @@ class RTAPServer:
             )
 
 
-    async def register_client(self, websocket: web.WebSocketResponse) -> None:
-        self.clients.add(websocket)
+    async def register_client(self, subscriber: Subscriber) -> None:
+        self.clients.add(subscriber)
+        if self.bus:
+            self.bus.set_local_subscribers(len(self.clients))
+        writer = asyncio.create_task(subscriber.run())
         try:
-            while not websocket.closed:
-                await asyncio.sleep(1)
+            # Reading is what answers pings and close frames; client messages are ignored
+            async for _ in subscriber.ws:
+                pass
         finally:
-            self.clients.remove(websocket)
+            writer.cancel()
+            self.clients.discard(subscriber)
+            if self.bus:
+                self.bus.set_local_subscribers(len(self.clients))
             logger.info("Client disconnected")
 
 
-    async def broadcast_annotation(self, stream_name: str, annotation: dict) -> None:
-        if self.clients:
-            disconnected_clients = set()
-            message = {
-                "stream_name": stream_name,
-                "annotation": annotation
-            }
+    async def broadcast_annotation(self, stream_name: str, annotation: Annotation) -> None:
+        # Every stored annotation passes through here; refresh sidecars it lands in
+        timeline = self.hls_timelines.get(stream_name)
+        if timeline:
+            timeline.invalidate(annotation.epoch)
+
+        # Built once from the cached annotation JSON and shared by all clients and peers
+        message = b'{"stream_name":' + dumps(stream_name) + b',"annotation":' + annotation.encoded + b'}'
+        await self.broadcast_local(message, stream_name, annotation)
+        if self.bus:
+            # Sent to peers in batches by the bus publisher, never inline with ingest or analysis
+            self.bus.queue_broadcast(message)
 
-            for client in self.clients:
-                try:
-                    await client.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error broadcasting to client: {e}")
-                    disconnected_clients.add(client)
 
-            self.clients -= disconnected_clients
+    async def broadcast_local(self, message: bytes, stream_name: Optional[str] = None,
+                              annotation: Optional[Annotation] = None) -> None:
+        """Queue an encoded message for the WebSocket clients connected to this process."""
+        if self.clients:
+            broadcast = Broadcast(message, stream_name, annotation)
+            for client in self.clients:
+                client.offer(broadcast)
 
 
     async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
-        ws = web.WebSocketResponse()
+        ws = web.WebSocketResponse(protocols=(MSGPACK_PROTOCOL, JSON_PROTOCOL), compress=self.ws_compress)
         await ws.prepare(request)
-        logger.info("New client connected")
+
+        # Browsers can set subprotocols; ?format= is for clients that cannot
+        compact = ws.ws_protocol == MSGPACK_PROTOCOL or request.query.get('format') == 'msgpack'
+        try:
+            # Compact clients are batched by default; JSON clients keep one message per frame unless asked
+            batch_ms = float(request.query.get('batch_ms', self.ws_batch_ms if compact else 0))
+        except ValueError:
+            batch_ms = 0
+        subscriber = Subscriber(ws, self.interner, compact, max(0.0, min(batch_ms, 1000)) / 1000,
+                                self.ws_max_pending)
+        logger.info(f"New client connected ({'msgpack' if compact else 'json'}, batch {batch_ms:g} ms)")
 
         try:
-            await self.register_client(ws)
+            await self.register_client(subscriber)
         except Exception as e:
             logger.error(f"Error in websocket handler: {e}")
         finally:
@@ -464,92 +1444,316 @@ class RTAPServer:
 
 
     async def process_stream(self, stream: RTSPStream) -> None:
-        retry_count = 0
-        max_retries = 3
+        """Run motion analysis under a StreamSupervisor until cancelled or failed."""
+        logger.info(f"Processing RTSP stream: {stream.name} ({stream.url})")
+        supervisor = StreamSupervisor(
+            stream,
+            self.open_container,
+            on_frame=lambda frame, frame_number: self.analyze_frame(stream, frame, frame_number),
+            on_state=self.publish_health,
+            tracer=self.tracer
+        )
+        self.supervisors[stream.name] = supervisor
+        await supervisor.run()
+
+        # Without a working source there is nothing left to package
+        await self.stop_hls_stream(stream.name)
+
+    async def analyze_frame(self, stream: RTSPStream, frame, frame_number: int) -> None:
+        timestamp = datetime.now().isoformat()
+
+        with self.tracer.span('to_ndarray', stream=stream.name):
+            frame_array = frame.to_ndarray(format='bgr24')
+        with self.tracer.span('detect_motion', stream=stream.name):
+            motion = self.detect_motion(frame_array)
+
+        if motion:
+            with self.tracer.span('add_annotation', stream=stream.name):
+                annotation = stream.add_annotation(
+                    "motion",
+                    {
+                        "frame": frame_number,
+                        "location": motion
+                    },
+                    timestamp
+                )
+            with self.tracer.span('broadcast_annotation', stream=stream.name, clients=len(self.clients)):
+                await self.broadcast_annotation(stream.name, annotation)
+
+    async def publish_health(self, stream: RTSPStream, previous: str, state: str, reason: Optional[str]) -> None:
+        """Record a supervisor state transition as a ``health`` annotation and broadcast it."""
+        annotation = stream.add_annotation(
+            "health",
+            {
+                "state": state,
+                "previous": previous,
+                "reason": reason
+            },
+            datetime.now().isoformat()
+        )
+        await self.broadcast_annotation(stream.name, annotation)
+
+
+    def detect_motion(self, frame: 'np.ndarray') -> Optional[dict]:
+        try:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            gray = cv2.GaussianBlur(gray, (21, 21), 0)
+            movement_detected = np.mean(gray) > 127
 
-        while self.running and retry_count < max_retries:
-            try:
-                logger.info(f"Processing RTSP stream: {stream.name} ({stream.url})")
-                container = av.open(stream.url, options={
-                    'rtsp_transport': 'tcp',
-                    'rtsp_flags': 'prefer_tcp',
-                    'stimeout': '5000000'
-                })
-                video_stream = container.streams.video[0]
+            if movement_detected:
+                return {
+                    "x": 0,
+                    "y": 0,
+                    "width": frame.shape[1],
+                    "height": frame.shape[0]
+                }
+        except Exception as e:
+            logger.error(f"Error in motion detection: {e}")
+        return None
 
-                stream.status = "active"
-                stream.last_error = None
-                stream.updated_at = datetime.now().isoformat()
 
-                frame_number = 0
+    async def handle_bus_broadcast(self, request: web.Request) -> web.Response:
+        """Deliver broadcasts published by a peer worker, one message per line, to local clients."""
+        if not self.bus or not self.bus.is_forwarded(request):
+            raise web.HTTPNotFound()
 
-                while self.running:
-                    try:
-                        for frame in container.decode(video=0):
-                            if not self.running:
-                                break
+        for message in (await request.read()).split(b'\n'):
+            if message:
+                await self.broadcast_local(message)
+        return web.Response(
+            text=json.dumps({"delivered": len(self.clients)}),
+            content_type='application/json'
+        )
+
+    async def handle_bus_subscribers(self, request: web.Request) -> web.Response:
+        """Record whether a peer worker has WebSocket subscribers."""
+        if not self.bus or not self.bus.is_forwarded(request):
+            raise web.HTTPNotFound()
 
-                            frame_number += 1
-                            timestamp = datetime.now().isoformat()
+        data = await request.json()
+        self.bus.set_peer_subscribers(int(data['worker']), int(data['subscribers']))
+        return web.Response(
+            text=json.dumps({"subscribers": len(self.clients)}),
+            content_type='application/json'
+        )
+
+
+    @web.middleware
+    async def route_to_owner(self, request: web.Request, handler):
+        """Forward per-stream requests to the worker owning the stream.
+
+        Admin requests can be pinned to a specific worker with ``?worker=N``.
+        """
+        if self.bus and not self.bus.is_forwarded(request):
+            stream_name = request.match_info.get('name')
+            if stream_name and not self.bus.is_local(stream_name):
+                return await self.bus.forward(request, self.bus.owner(stream_name), self.client_id(request))
+
+            worker = request.query.get('worker')
+            if request.path.startswith('/api/admin/') and worker and worker.isdigit():
+                if int(worker) != self.worker_id:
+                    return await self.bus.forward(request, int(worker), self.client_id(request))
+
+        return await handler(request)
+
+
+    # (method, route) -> admission class; other routes are not limited
+    ADMISSION_ROUTES = {
+        ('POST', '/api/streams/{name}/annotations'): 'ingest',
+        ('POST', '/api/streams/{name}/annotations/{type}'): 'ingest',
+        ('GET', '/api/streams/{name}/annotations'): 'query',
+        ('GET', '/api/streams/{name}/annotations/{type}'): 'query',
+        ('GET', '/api/streams/{name}/aggregates'): 'query',
+        ('GET', '/api/streams/{name}/export'): 'export',
+    }
+
+    def client_id(self, request: web.Request) -> str:
+        """Address the per-client limits apply to.
+
+        ``X-RTAP-Client`` is only read from requests a peer worker forwarded,
+        which overwrites whatever the client sent.
+        """
+        if self.client_header and request.headers.get(self.client_header):
+            return request.headers[self.client_header].split(',')[0].strip()
+        if self.bus and self.bus.is_forwarded(request) and request.headers.get(CLIENT_HEADER):
+            return request.headers[CLIENT_HEADER]
+        return request.remote or ''
+
+    @web.middleware
+    async def admit(self, request: web.Request, handler):
+        """Shed load, rate-limit and cap concurrency of annotation ingest and queries.
+
+        In worker mode this runs on the worker owning the stream, after
+        ``route_to_owner`` has forwarded the request.
+        """
+        route = request.match_info.route.resource
+        kind = self.ADMISSION_ROUTES.get((request.method, route.canonical)) if route else None
+        if kind is None:
+            return await handler(request)
+
+        admission = self.admission
+        shed = admission.shed(kind)
+        if shed:
+            reason, wait = shed
+            return web.Response(
+                status=503,
+                text=json.dumps({"error": f"Server overloaded ({reason}), retry later"}),
+                content_type='application/json',
+                headers={'Retry-After': retry_after(wait)}
+            )
 
-                            frame_array = frame.to_ndarray(format='bgr24')
-                            motion = self.detect_motion(frame_array)
+        wait = admission.limit(kind, self.client_id(request), request.match_info.get('name'))
+        if wait:
+            return web.Response(
+                status=429,
+                text=json.dumps({"error": "Rate limit exceeded"}),
+                content_type='application/json',
+                headers={'Retry-After': retry_after(wait)}
+            )
 
-                            if motion:
-                                annotation = stream.add_annotation(
-                                    "motion",
-                                    {
-                                        "frame": frame_number,
-                                        "location": motion
-                                    },
-                                    timestamp
-                                )
-                                await self.broadcast_annotation(stream.name, annotation.to_dict())
+        # Exports are bounded by their own thread pool rather than the query gate
+        if kind != 'query':
+            admission.counters[kind]['admitted'] += 1
+            return await handler(request)
 
-                            await asyncio.sleep(0.001)
+        if not await admission.gate.acquire():
+            admission.counters[kind]['rejected'] += 1
+            return web.Response(
+                status=503,
+                text=json.dumps({"error": "Too many concurrent queries, retry later"}),
+                content_type='application/json',
+                headers={'Retry-After': retry_after(admission.gate.wait_timeout)}
+            )
+        admission.counters[kind]['admitted'] += 1
+        try:
+            return await handler(request)
+        finally:
+            admission.gate.release()
 
-                    except av.error.EOFError:
-                        logger.warning(f"End of stream reached: {stream.name}")
-                        break
 
-            except Exception as e:
-                retry_count += 1
-                error_msg = f"Error processing stream {stream.name}: {str(e)}"
-                logger.error(error_msg)
-                stream.status = "error"
-                stream.last_error = error_msg
-                stream.updated_at = datetime.now().isoformat()
-
-                if retry_count < max_retries:
-                    await asyncio.sleep(5)
-                else:
-                    logger.error(f"Max retries reached for stream {stream.name}")
-                    break
+    async def handle_get_admission(self, request: web.Request) -> web.Response:
+        """Admission counters, current loop lag and queue depths."""
+        return web.Response(
+            text=json.dumps(self.admission.stats()),
+            content_type='application/json'
+        )
 
-        stream.status = "inactive"
-        stream.updated_at = datetime.now().isoformat()
+    async def handle_get_trace(self, request: web.Request) -> web.Response:
+        """Dump recently buffered pipeline spans as Chrome trace JSON."""
+        try:
+            if request.query.get('format') == 'summary':
+                body = {
+                    "enabled": self.tracer.enabled,
+                    "buffered": len(self.tracer.spans),
+                    "spans": self.tracer.summary()
+                }
+            else:
+                try:
+                    limit = int(request.query.get('limit', 0))
+                except ValueError:
+                    limit = -1
+                if limit < 0:
+                    return web.Response(
+                        status=400,
+                        text=json.dumps({"error": "limit must be a non-negative integer"}),
+                        content_type='application/json'
+                    )
+                body = self.tracer.to_chrome_trace(limit or None)
 
+            return web.Response(
+                text=json.dumps(body),
+                content_type='application/json'
+            )
+        except Exception as e:
+            logger.error(f"Error exporting trace: {e}")
+            return web.Response(
+                status=500,
+                text=json.dumps({"error": str(e)}),
+                content_type='application/json'
+            )
 
-    def detect_motion(self, frame: np.ndarray) -> Optional[dict]:
+    async def handle_update_trace(self, request: web.Request) -> web.Response:
+        """Enable, disable or clear span collection at runtime."""
         try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            gray = cv2.GaussianBlur(gray, (21, 21), 0)
-            movement_detected = np.mean(gray) > 127
+            data = await request.json() if request.can_read_body else {}
+            if 'enabled' in data:
+                self.tracer.enabled = bool(data['enabled'])
+            if data.get('clear'):
+                self.tracer.clear()
 
-            if movement_detected:
-                return {
-                    "x": 0,
-                    "y": 0,
-                    "width": frame.shape[1],
-                    "height": frame.shape[0]
-                }
+            logger.info(f"Tracing {'enabled' if self.tracer.enabled else 'disabled'}")
+            return web.Response(
+                text=json.dumps({
+                    "enabled": self.tracer.enabled,
+                    "buffered": len(self.tracer.spans)
+                }),
+                content_type='application/json'
+            )
         except Exception as e:
-            logger.error(f"Error in motion detection: {e}")
-        return None
+            logger.error(f"Error updating trace settings: {e}")
+            return web.Response(
+                status=500,
+                text=json.dumps({"error": str(e)}),
+                content_type='application/json'
+            )
 
+    async def handle_profile(self, request: web.Request) -> web.Response:
+        """Profile the running server for N seconds and return pstats output."""
+        try:
+            try:
+                seconds = float(request.query.get('seconds', 5))
+                limit = int(request.query.get('limit', 50))
+            except ValueError:
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": "seconds must be a number and limit an integer"}),
+                    content_type='application/json'
+                )
+            sort = request.query.get('sort', 'cumulative')
 
-    async def start_server(self) -> None:
-        app = web.Application()
+            if sort not in SORT_KEYS:
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": f"sort must be one of {', '.join(sorted(SORT_KEYS))}"}),
+                    content_type='application/json'
+                )
+
+            if limit < 1:
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": "limit must be positive"}),
+                    content_type='application/json'
+                )
+
+            if not 0 < seconds <= 300:
+                return web.Response(
+                    status=400,
+                    text=json.dumps({"error": "seconds must be between 0 and 300"}),
+                    content_type='application/json'
+                )
+
+            if self.profiler.busy:
+                return web.Response(
+                    status=409,
+                    text=json.dumps({"error": "A profile is already running"}),
+                    content_type='application/json'
+                )
+
+            logger.info(f"Profiling server for {seconds}s")
+            report = await self.profiler.run(seconds, sort, limit)
+            return web.Response(text=report, content_type='text/plain')
+        except Exception as e:
+            logger.error(f"Error profiling server: {e}")
+            return web.Response(
+                status=500,
+                text=json.dumps({"error": str(e)}),
+                content_type='application/json'
+            )
+
+
+    def create_app(self) -> web.Application:
+        middlewares = [self.route_to_owner, self.admit] if self.bus else [self.admit]
+        app = web.Application(middlewares=middlewares)
 
         # Static files
         app.router.add_static('/static', Path(__file__).parent / 'static')
@@ -560,30 +1764,67 @@ class RTAPServer:
         app.router.add_post('/api/streams', self.handle_add_stream)
         app.router.add_get('/api/streams', self.handle_list_streams)
         app.router.add_get('/api/streams/{name}', self.handle_get_stream)
+        app.router.add_patch('/api/streams/{name}', self.handle_update_stream)
+        app.router.add_delete('/api/streams/{name}', self.handle_delete_stream)
+        app.router.add_post('/api/streams/{name}/restart', self.handle_restart_stream)
 
         # HLS streaming
         app.router.add_get('/hls/{name}/{file}', self.handle_hls_request)
+        app.router.add_get('/hls/{name}/{rendition}/{file}', self.handle_hls_request)
 
         # Annotation routes
         app.router.add_post('/api/streams/{name}/annotations', self.handle_add_annotation)
         app.router.add_post('/api/streams/{name}/annotations/{type}', self.handle_add_annotation)
         app.router.add_get('/api/streams/{name}/annotations', self.handle_get_annotations)
         app.router.add_get('/api/streams/{name}/annotations/{type}', self.handle_get_annotations)
+        app.router.add_get('/api/streams/{name}/aggregates', self.handle_get_aggregates)
+        app.router.add_get('/api/streams/{name}/export', self.handle_export)
+
+        # Recorded footage
+        app.router.add_get('/api/streams/{name}/recordings', self.handle_list_recordings)
+        app.router.add_get('/api/streams/{name}/recordings/{file}', self.handle_recording)
 
         # WebSocket route
         app.router.add_get('/ws', self.handle_websocket)
 
-        runner = web.AppRunner(app)
+        # Admin diagnostics
+        app.router.add_get('/api/admin/trace', self.handle_get_trace)
+        app.router.add_post('/api/admin/trace', self.handle_update_trace)
+        app.router.add_get('/api/admin/profile', self.handle_profile)
+        app.router.add_get('/api/admin/admission', self.handle_get_admission)
+
+        # Worker bus
+        if self.bus:
+            app.router.add_post('/_internal/broadcast', self.handle_bus_broadcast)
+            app.router.add_post('/_internal/subscribers', self.handle_bus_subscribers)
+
+        return app
+
+    async def start_server(self) -> None:
+        runner = web.AppRunner(self.create_app())
         await runner.setup()
-        site = web.TCPSite(runner, self.host, self.port)
+        sites = [web.TCPSite(runner, self.host, self.port, reuse_port=self.bus is not None)]
+        if self.bus:
+            sites.append(web.UnixSite(runner, str(self.bus.socket_path(self.worker_id))))
+
+        self.open_semaphore = asyncio.Semaphore(self.open_concurrency)
 
         try:
-            await site.start()
-            logger.info(f"RTAP Server started on http://{self.host}:{self.port}")
+            for site in sites:
+                await site.start()
+            if self.bus:
+                logger.info(f"RTAP worker {self.worker_id} started on http://{self.host}:{self.port}")
+            else:
+                logger.info(f"RTAP Server started on http://{self.host}:{self.port}")
             self.running = True
 
+            # The listener is up; configured cameras connect in the background
+            await self.bootstrap_streams()
+
             # Start HLS cleanup task
             cleanup_task = asyncio.create_task(self.cleanup_hls())
+            monitor_task = asyncio.create_task(self.admission.monitor.run())
+            publisher_task = asyncio.create_task(self.bus.run_publisher()) if self.bus else None
 
             while True:
                 await asyncio.sleep(1)
@@ -597,11 +1838,21 @@ class RTAPServer:
             for task in self.stream_tasks.values():
                 task.cancel()
             cleanup_task.cancel()
+            monitor_task.cancel()
+            if self.bus:
+                publisher_task.cancel()
+                await self.bus.close()
             await runner.cleanup()
+            for recording in self.recordings.values():
+                recording.close()
 
             # Cleanup HLS directory
             try:
-                shutil.rmtree(self.hls_dir)
+                if self.bus:
+                    for name in self.streams:
+                        self.remove_hls_dir(name)
+                else:
+                    shutil.rmtree(self.hls_dir)
             except Exception as e:
                 logger.error(f"Error cleaning up HLS directory: {e}")
 
@@ -0,0 +1,74 @@
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from ladder import parse_renditions
+from models.stream import is_valid_name
+from supervisor import TIMING_PARAMETERS, timing_parameter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = Path(__file__).parent / 'config.yml'
+
+
+def load_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """Load ``config.yml`` (or ``RTAP_CONFIG``) and normalize its stream inventory."""
+    config_path = Path(path or os.getenv('RTAP_CONFIG', DEFAULT_CONFIG_PATH))
+    if not config_path.exists():
+        logger.info(f"No configuration file at {config_path}, using defaults")
+        return {"streams": []}
+
+    with open(config_path) as f:
+        config = yaml.safe_load(f) or {}
+
+    config['streams'] = _parse_streams(config.get('streams') or [])
+    logger.info(f"Loaded configuration from {config_path} ({len(config['streams'])} streams)")
+    return config
+
+
+def validate_parameters(parameters: Any) -> None:
+    """Raise ``ValueError`` for stream parameters the stream's tasks could not use."""
+    if not isinstance(parameters, dict):
+        raise ValueError("parameters must be an object")
+    parse_renditions(parameters.get('renditions'))
+    for key in TIMING_PARAMETERS:
+        if parameters.get(key) is not None:
+            timing_parameter(parameters, key)
+
+
+def _parse_streams(entries: List[Any]) -> List[Dict[str, Any]]:
+    """Normalize configured streams, skipping entries the API would reject."""
+    if not isinstance(entries, list):
+        logger.error("Ignoring 'streams' in configuration: expected a list of streams")
+        return []
+    streams = []
+    seen = set()
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get('name') or not entry.get('url'):
+            logger.error(f"Skipping invalid stream entry in configuration: {entry}")
+            continue
+        name = str(entry['name'])
+        if not is_valid_name(name):
+            logger.error(f"Skipping stream '{name}' in configuration: "
+                         f"names may only contain letters, digits, '_' and '-'")
+            continue
+        if name in seen:
+            logger.error(f"Skipping duplicate stream '{name}' in configuration")
+            continue
+        parameters = entry.get('parameters') or {}
+        try:
+            validate_parameters(parameters)
+        except (ValueError, TypeError) as e:
+            logger.error(f"Skipping stream '{name}' in configuration: {e}")
+            continue
+        seen.add(name)
+        streams.append({
+            "name": name,
+            "url": str(entry['url']),
+            "description": entry.get('description', ''),
+            "parameters": parameters
+        })
+    return streams
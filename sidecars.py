@@ -0,0 +1,125 @@
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from models import RTSPStream, Annotation
+from models.encoding import dumps, join_array
+
+# MPEG-TS presentation timestamps tick at 90 kHz
+MPEGTS_CLOCK = 90000
+
+
+class Segment:
+    """Wall-clock and media-time range of one HLS segment, plus its cached sidecars."""
+
+    __slots__ = ('index', 'start', 'end', 'duration', 'pts', 'sidecars')
+
+    def __init__(self, index: int, start: float, end: float, duration: float, pts: int):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.pts = pts
+        # Rendered payloads keyed by file extension: (body, etag)
+        self.sidecars: Dict[str, tuple] = {}
+
+    def contains(self, epoch: float) -> bool:
+        return self.start <= epoch < self.end
+
+    def media_offset(self, epoch: float) -> float:
+        """Map a wall-clock time inside the segment to seconds from the segment start."""
+        wall = self.end - self.start
+        if wall <= 0:
+            return 0.0
+        return min(self.duration, max(0.0, (epoch - self.start) * self.duration / wall))
+
+    @property
+    def program_date_time(self) -> str:
+        return datetime.fromtimestamp(self.start, timezone.utc).isoformat(timespec='milliseconds')
+
+
+class SegmentTimeline:
+    """Recently written segments of one stream, oldest first."""
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self._segments: 'OrderedDict[int, Segment]' = OrderedDict()
+
+    def add(self, segment: Segment) -> None:
+        self._segments[segment.index] = segment
+        while len(self._segments) > self.capacity:
+            self._segments.popitem(last=False)
+
+    def get(self, index: int) -> Optional[Segment]:
+        return self._segments.get(index)
+
+    def invalidate(self, epoch: Optional[float]) -> None:
+        """Drop cached sidecars of the segment covering ``epoch`` (a late annotation)."""
+        if epoch is None or not self._segments:
+            return
+        # Live annotations belong to the segment still being recorded
+        if epoch >= next(reversed(self._segments.values())).end:
+            return
+        for segment in self._segments.values():
+            if segment.contains(epoch):
+                segment.sidecars.clear()
+                break
+
+
+def segment_annotations(stream: RTSPStream, segment: Segment) -> List[Annotation]:
+    return stream.between(segment.start, segment.end)
+
+
+def render_json(stream: RTSPStream, segment: Segment) -> bytes:
+    head = dumps({
+        "stream_name": stream.name,
+        "segment": segment.index,
+        "start": segment.program_date_time,
+        "end": datetime.fromtimestamp(segment.end, timezone.utc).isoformat(timespec='milliseconds'),
+        "duration": segment.duration
+    })
+    annotations = segment_annotations(stream, segment)
+    return head[:-1] + b',"annotations":' + join_array(ann.encoded for ann in annotations) + b'}'
+
+
+def _cue_time(seconds: float) -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def render_webvtt(stream: RTSPStream, segment: Segment, cue_duration: float = 1.0) -> bytes:
+    """WebVTT metadata cues carrying each annotation's JSON, aligned to the segment's PTS."""
+    lines = [
+        b'WEBVTT',
+        f'X-TIMESTAMP-MAP=MPEGTS:{segment.pts},LOCAL:00:00:00.000'.encode(),
+        b''
+    ]
+    for number, ann in enumerate(segment_annotations(stream, segment), 1):
+        offset = segment.media_offset(ann.epoch)
+        end = min(segment.duration, offset + cue_duration)
+        lines.append(str(number).encode())
+        lines.append(f'{_cue_time(offset)} --> {_cue_time(max(end, offset + 0.001))}'.encode())
+        # "-->" would end the cue payload early; > keeps the JSON equivalent
+        lines.append(ann.encoded.replace(b'-->', b'--\\u003e'))
+        lines.append(b'')
+    return b'\n'.join(lines) + b'\n'
+
+
+RENDERERS = {
+    'json': render_json,
+    'vtt': render_webvtt
+}
+
+
+def sidecar(stream: RTSPStream, segment: Segment, kind: str, **options) -> tuple:
+    """Return the cached ``(body, etag)`` of a sidecar, rendering it on first use."""
+    cached = segment.sidecars.get(kind)
+    if cached is None:
+        body = RENDERERS[kind](stream, segment, **options)
+        cached = (body, '"' + hashlib.md5(body).hexdigest() + '"')
+        segment.sidecars[kind] = cached
+    return cached
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+from models import Annotation
+from models.encoding import join_array, packb, pack_array_header
+
+logger = logging.getLogger(__name__)
+
+# WebSocket subprotocols; clients that offer none get the JSON messages
+JSON_PROTOCOL = 'rtap.json.v1'
+MSGPACK_PROTOCOL = 'rtap.msgpack.v1'
+
+# Compact message kinds
+DEFINE = 0
+ANNOTATION = 1
+
+
+class Interner:
+    """Assigns small integer ids to stream names and annotation types."""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+
+    def id(self, name: str) -> int:
+        ident = self.ids.get(name)
+        if ident is None:
+            ident = self.ids[name] = len(self.ids)
+        return ident
+
+
+def _epoch_ms(timestamp: Any) -> Any:
+    epoch = Annotation.to_epoch(timestamp)
+    # Unparseable timestamps are passed through unchanged
+    return round(epoch * 1000) if epoch is not None else timestamp
+
+
+class Broadcast:
+    """One annotation message, encoded at most once per format for all subscribers."""
+
+    __slots__ = ('json', '_text', '_compact', '_source')
+
+    def __init__(self, message: bytes, stream_name: Optional[str] = None,
+                 annotation: Optional[Annotation] = None):
+        self.json = message
+        self._text: Optional[str] = None
+        self._compact: Optional[Tuple[List[Tuple[int, str]], bytes]] = None
+        self._source = (stream_name, annotation.to_dict()) if annotation is not None else None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.json.decode()
+        return self._text
+
+    def compact(self, interner: Interner) -> Tuple[List[Tuple[int, str]], bytes]:
+        """Return ``(interned (id, name) pairs used, packed message)``.
+
+        The message is ``[1, stream id, type id, timestamp ms, created_at ms, data]``.
+        """
+        if self._compact is None:
+            if self._source is None:
+                # Relayed by a peer worker as JSON
+                payload = json.loads(self.json)
+                self._source = (payload['stream_name'], payload['annotation'])
+            stream_name, annotation = self._source
+            names = (stream_name, annotation['type'])
+            ids = [(interner.id(name), name) for name in names]
+            self._compact = (ids, packb([
+                ANNOTATION,
+                ids[0][0],
+                ids[1][0],
+                _epoch_ms(annotation['timestamp']),
+                _epoch_ms(annotation['created_at']),
+                annotation['data']
+            ]))
+        return self._compact
+
+
+class Subscriber:
+    """A WebSocket client with its negotiated encoding and a batching writer.
+
+    Broadcasts are queued without blocking the publisher; the writer sends
+    everything queued within ``window`` seconds as one frame. Compact
+    clients get MessagePack arrays where stream names and types are
+    replaced by ids, each defined once per connection with ``[0, id, name]``.
+    JSON clients with a window get a JSON array per frame, and without one
+    the original one-object-per-frame messages. If a client falls more than
+    ``max_pending`` messages behind, the oldest are dropped.
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, interner: Interner, compact: bool = False,
+                 window: float = 0.0, max_pending: int = 1000):
+        self.ws = ws
+        self.interner = interner
+        self.compact = compact
+        self.window = window
+        self.max_pending = max_pending
+        self.pending: List[Broadcast] = []
+        self.defined: Set[int] = set()
+        self.dropped = 0
+        self._wake = asyncio.Event()
+
+    def offer(self, broadcast: Broadcast) -> None:
+        if len(self.pending) >= self.max_pending:
+            del self.pending[0]
+            self.dropped += 1
+        self.pending.append(broadcast)
+        self._wake.set()
+
+    async def run(self) -> None:
+        try:
+            while not self.ws.closed:
+                await self._wake.wait()
+                if self.window:
+                    await asyncio.sleep(self.window)
+                self._wake.clear()
+                batch, self.pending = self.pending, []
+                await self.send(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error broadcasting to client: {e}")
+            await self.ws.close()
+
+    async def send(self, batch: List[Broadcast]) -> None:
+        if self.compact:
+            items = []
+            for broadcast in batch:
+                ids, packed = broadcast.compact(self.interner)
+                for ident, name in ids:
+                    if ident not in self.defined:
+                        self.defined.add(ident)
+                        items.append(packb([DEFINE, ident, name]))
+                items.append(packed)
+            await self.ws.send_bytes(pack_array_header(len(items)) + b''.join(items))
+        elif self.window:
+            await self.ws.send_str(join_array(broadcast.json for broadcast in batch).decode())
+        else:
+            for broadcast in batch:
+                await self.ws.send_str(broadcast.text)
@@ -0,0 +1,293 @@
+import asyncio
+import concurrent.futures
+import logging
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from models import RTSPStream
+from tracing import Tracer
+
+logger = logging.getLogger(__name__)
+
+CONNECTING = 'connecting'
+ACTIVE = 'active'
+DEGRADED = 'degraded'
+BACKOFF = 'backoff'
+FAILED = 'failed'
+
+_EOF = object()
+
+# Stream parameter -> (environment variable, default, type); each parameter
+# overrides its environment variable for one stream
+TIMING_PARAMETERS: Dict[str, Tuple[str, Any, type]] = {
+    'frame_timeout': ('FRAME_TIMEOUT', 2, float),
+    'stall_timeout': ('STALL_TIMEOUT', 10, float),
+    'max_reconnects': ('MAX_RECONNECTS', 0, int),
+    'reconnect_base_delay': ('RECONNECT_BASE_DELAY', 1, float),
+    'reconnect_max_delay': ('RECONNECT_MAX_DELAY', 60, float),
+    # Read by the server when it opens the stream's recording
+    'record_retention': ('RECORDING_RETENTION', 86400, float),
+}
+
+
+def timing_parameter(params: Dict[str, Any], key: str) -> Any:
+    """Read one of :data:`TIMING_PARAMETERS` from stream parameters or the environment.
+
+    Durations must be positive numbers and ``max_reconnects`` a whole number
+    (0 retries forever); anything else raises ``ValueError``.
+    """
+    env, default, kind = TIMING_PARAMETERS[key]
+    value = params.get(key)
+    if value is None:
+        value = os.getenv(env, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{key} must be a number, got {value!r}")
+    try:
+        number = kind(value)
+    except (ValueError, OverflowError):
+        raise ValueError(f"{key} must be a {'whole ' if kind is int else ''}number, got {value!r}")
+    if kind is int and number < 0:
+        raise ValueError(f"{key} must not be negative")
+    if kind is float and not (math.isfinite(number) and number > 0):
+        raise ValueError(f"{key} must be a positive number of seconds")
+    return number
+
+
+class StreamStalled(Exception):
+    """Raised when no frame arrived within the stall deadline."""
+
+
+class Backoff:
+    """Capped exponential backoff with jitter.
+
+    Half of each delay is fixed and half is random, so streams that failed
+    together (e.g. after a switch reboot) spread their reconnects out.
+    """
+
+    def __init__(self, base: float = 1.0, cap: float = 60.0, factor: float = 2.0):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.cap, self.base * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def reset(self) -> None:
+        self.attempts = 0
+
+
+class FrameReader:
+    """Decodes video frames from a container on a dedicated thread.
+
+    Frames are handed to the event loop through a bounded queue. With
+    ``drop=True`` the oldest queued frame is discarded when the consumer
+    falls behind (analysis only needs recent frames); otherwise the reader
+    blocks until there is room. The reader thread owns the container and
+    closes it when decoding ends or :meth:`stop` is called.
+    """
+
+    def __init__(self, container, maxsize: int = 8, drop: bool = True,
+                 tracer: Optional[Tracer] = None, span: str = 'decode', stream_name: str = ''):
+        self.container = container
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.drop = drop
+        self.dropped = 0
+        self.tracer = tracer or Tracer()
+        self.span = span
+        self.stream_name = stream_name
+        self._loop = asyncio.get_running_loop()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'decode-{stream_name}', daemon=True)
+
+    def start(self) -> 'FrameReader':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def get(self, timeout: Optional[float] = None):
+        """Return the next frame, ``None`` at end of stream; re-raises decoder errors."""
+        item = await asyncio.wait_for(self.queue.get(), timeout)
+        if item is _EOF:
+            return None
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def _offer_latest(self, item) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    def _put(self, item) -> bool:
+        try:
+            if self.drop or item is _EOF or isinstance(item, Exception):
+                self._loop.call_soon_threadsafe(self._offer_latest, item)
+                return True
+
+            future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self._loop)
+            while not self._stop.is_set():
+                try:
+                    future.result(timeout=0.5)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    continue
+            future.cancel()
+        except RuntimeError:
+            # Event loop already closed during shutdown
+            pass
+        return False
+
+    def _run(self) -> None:
+        try:
+            frames = self.container.decode(video=0)
+            while not self._stop.is_set():
+                with self.tracer.span(self.span, stream=self.stream_name):
+                    frame = next(frames, None)
+                if frame is None or not self._put(frame):
+                    break
+        except Exception as e:
+            if not self._stop.is_set():
+                self._put(e)
+        finally:
+            try:
+                self.container.close()
+            except Exception:
+                pass
+            if not self._stop.is_set():
+                self._put(_EOF)
+
+
+class StreamSupervisor:
+    """Owns the connection lifecycle of one RTSPStream.
+
+    States: connecting -> active, degraded when frames are late, backoff
+    between reconnect attempts, failed once ``max_failures`` consecutive
+    attempts did not produce frames (0 retries forever). Every transition
+    updates ``stream.status`` and is reported through ``on_state``.
+    """
+
+    def __init__(self, stream: RTSPStream,
+                 open_container: Callable[[str], Awaitable[Any]],
+                 on_frame: Callable[[Any, int], Awaitable[None]],
+                 on_state: Callable[[RTSPStream, str, str, Optional[str]], Awaitable[None]],
+                 tracer: Optional[Tracer] = None):
+        self.stream = stream
+        self.open_container = open_container
+        self.on_frame = on_frame
+        self.on_state = on_state
+        self.tracer = tracer or Tracer()
+
+        params = stream.parameters
+        self.frame_timeout = timing_parameter(params, 'frame_timeout')
+        self.stall_timeout = timing_parameter(params, 'stall_timeout')
+        self.max_failures = timing_parameter(params, 'max_reconnects')
+        self.backoff = Backoff(
+            base=timing_parameter(params, 'reconnect_base_delay'),
+            cap=timing_parameter(params, 'reconnect_max_delay')
+        )
+
+        self.state = stream.status
+        self.failures = 0
+        self.frames = 0
+        self.last_frame_at: Optional[float] = None
+        self.retry_at: Optional[float] = None
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "frames": self.frames,
+            "seconds_since_frame": round(time.monotonic() - self.last_frame_at, 3) if self.last_frame_at else None,
+            "retry_in": round(max(0.0, self.retry_at - time.monotonic()), 3) if self.retry_at else None
+        }
+
+    async def set_state(self, state: str, reason: Optional[str] = None) -> None:
+        if state == self.state:
+            return
+        previous = self.state
+        self.state = state
+        self.stream.status = state
+        self.stream.updated_at = datetime.now().isoformat()
+        if state == FAILED or (state == BACKOFF and reason):
+            self.stream.last_error = reason
+        elif state == ACTIVE:
+            self.stream.last_error = None
+        logger.info(f"Stream {self.stream.name}: {previous} -> {state}" + (f" ({reason})" if reason else ""))
+        try:
+            await self.on_state(self.stream, previous, state, reason)
+        except Exception as e:
+            logger.error(f"Error publishing health of {self.stream.name}: {e}")
+
+    async def run(self) -> None:
+        while True:
+            await self.set_state(CONNECTING)
+            reason = None
+            reader = None
+            got_frames = False
+            try:
+                with self.tracer.span('open', stream=self.stream.name):
+                    container = await self.open_container(self.stream.url)
+                reader = FrameReader(container, maxsize=4, drop=True, tracer=self.tracer,
+                                     stream_name=self.stream.name).start()
+                got_frames = await self._consume(reader)
+                reason = "end of stream"
+            except StreamStalled as e:
+                reason = str(e)
+            except Exception as e:
+                reason = f"Error processing stream {self.stream.name}: {e}"
+                logger.error(reason)
+            finally:
+                if reader:
+                    reader.stop()
+
+            if got_frames:
+                self.failures = 0
+                self.backoff.reset()
+            self.failures += 1
+
+            if self.max_failures and self.failures >= self.max_failures:
+                await self.set_state(FAILED, reason)
+                logger.error(f"Giving up on stream {self.stream.name} after {self.failures} failed attempts")
+                return
+
+            delay = self.backoff.next_delay()
+            self.retry_at = time.monotonic() + delay
+            await self.set_state(BACKOFF, reason)
+            await asyncio.sleep(delay)
+            self.retry_at = None
+
+    async def _consume(self, reader: FrameReader) -> bool:
+        """Feed frames to ``on_frame`` until end of stream; returns whether any arrived."""
+        got_frames = False
+        waiting_since = time.monotonic()
+        while True:
+            try:
+                frame = await reader.get(self.frame_timeout)
+            except asyncio.TimeoutError:
+                late = time.monotonic() - (self.last_frame_at if got_frames else waiting_since)
+                if late >= self.stall_timeout:
+                    raise StreamStalled(f"No frames from {self.stream.name} for {late:.1f}s")
+                if got_frames:
+                    await self.set_state(DEGRADED, f"No frames for {late:.1f}s")
+                continue
+
+            if frame is None:
+                return got_frames
+
+            got_frames = True
+            self.frames += 1
+            self.last_frame_at = time.monotonic()
+            if self.state != ACTIVE:
+                await self.set_state(ACTIVE)
+            await self.on_frame(frame, self.frames)
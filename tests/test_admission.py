@@ -0,0 +1,95 @@
+import asyncio
+from unittest import mock
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+from admission import QueryGate, RateLimiter
+from cluster import CLIENT_HEADER, FORWARDED_HEADER
+from rtap_server import RTAPServer
+
+
+def test_bucket_allows_burst_then_refills():
+    limiter = RateLimiter(rate=2, burst=3)
+    for _ in range(3):
+        assert limiter.wait_time('a') == 0
+        limiter.take('a')
+    assert 0 < limiter.wait_time('a') <= 0.5
+    # Another client has its own bucket
+    assert limiter.wait_time('b') == 0
+
+
+def test_wait_time_is_time_to_next_token():
+    limiter = RateLimiter(rate=4, burst=1)
+    assert limiter.wait_time('a', now=10.0) == 0
+    limiter._bucket('a', 10.0)[0] -= 1
+    assert limiter.wait_time('a', now=10.0) == pytest.approx(0.25)
+    assert limiter.wait_time('a', now=10.25) == 0
+
+
+def test_disabled_limiter_never_waits():
+    limiter = RateLimiter(rate=0)
+    for _ in range(100):
+        limiter.take('a')
+    assert limiter.wait_time('a') == 0
+    assert len(limiter) == 0
+
+
+def test_idle_keys_are_evicted():
+    limiter = RateLimiter(rate=1, max_keys=2)
+    for key in ('a', 'b', 'c'):
+        limiter.wait_time(key, now=0.0)
+    assert len(limiter) == 2
+
+
+def test_query_gate_queues_then_rejects():
+    async def scenario():
+        gate = QueryGate(concurrency=1, max_waiting=1, wait_timeout=0.05)
+        assert await gate.acquire()
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        # The single waiting slot is taken
+        assert not await gate.acquire()
+        gate.release()
+        assert await waiter
+        # Nobody releases this time: the waiter times out
+        assert not await gate.acquire()
+        gate.release()
+        return gate.running, gate.waiting
+
+    assert asyncio.run(scenario()) == (0, 0)
+
+
+def request(headers, unix_socket=False):
+    transport = mock.Mock()
+    extra = {'peername': ('203.0.113.7', 5000), 'sockname': '/tmp/w0.sock' if unix_socket else ('0.0.0.0', 9000)}
+    transport.get_extra_info.side_effect = lambda name, default=None: extra.get(name, default)
+    return make_mocked_request('GET', '/api/streams/cam/annotations', headers=headers, transport=transport)
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = RTAPServer(worker_id=0, workers=2, socket_dir=tmp_path, config={})
+    server.client_header = ''
+    return server
+
+
+def test_client_header_is_ignored_unless_forwarded(server):
+    spoofed = {CLIENT_HEADER: '198.51.100.1', FORWARDED_HEADER: '1'}
+    assert server.client_id(request(spoofed)) == '203.0.113.7'
+    assert server.client_id(request(spoofed, unix_socket=True)) == '198.51.100.1'
+
+
+def test_forward_overwrites_client_header(server):
+    incoming = request({CLIENT_HEADER: '198.51.100.1', FORWARDED_HEADER: '1', 'Accept': 'text/csv'})
+    headers = server.bus.forward_headers(incoming, server.client_id(incoming))
+    assert headers[CLIENT_HEADER] == '203.0.113.7'
+    assert headers[FORWARDED_HEADER] == '0'
+    assert headers['Accept'] == 'text/csv'
+    assert [k for k in headers if k.lower() == CLIENT_HEADER.lower()] == [CLIENT_HEADER]
+
+
+def test_forward_uses_configured_proxy_header(server):
+    server.client_header = 'X-Forwarded-For'
+    incoming = request({'X-Forwarded-For': '192.0.2.9, 10.0.0.1', CLIENT_HEADER: '198.51.100.1'})
+    assert server.bus.forward_headers(incoming, server.client_id(incoming))[CLIENT_HEADER] == '192.0.2.9'
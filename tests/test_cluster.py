@@ -0,0 +1,95 @@
+import asyncio
+import json
+from itertools import count
+
+from aiohttp import ClientSession, UnixConnector, web
+from aiohttp.test_utils import TestClient, TestServer
+
+from cluster import CLIENT_HEADER
+from models import RTSPStream
+from rtap_server import RTAPServer
+
+
+async def forwarded_export(tmp_path, rows):
+    front = RTAPServer(worker_id=0, workers=2, socket_dir=tmp_path, config={})
+    owner = RTAPServer(worker_id=1, workers=2, socket_dir=tmp_path, config={})
+    name = next(f'cam{i}' for i in count() if front.bus.owner(f'cam{i}') == 1)
+    stream = owner.streams[name] = RTSPStream(name, 'rtsp://example')
+    for i in range(rows):
+        stream.add_annotation('motion', {'frame': i}, '2024-10-25T15:00:00Z')
+
+    clients = []
+    client_id = owner.client_id
+    owner.client_id = lambda request: clients.append(client_id(request)) or clients[-1]
+
+    runner = web.AppRunner(owner.create_app())
+    await runner.setup()
+    await web.UnixSite(runner, str(owner.bus.socket_path(1))).start()
+    try:
+        async with TestClient(TestServer(front.create_app())) as client:
+            response = await client.get(f'/api/streams/{name}/export?format=ndjson',
+                                        headers={CLIENT_HEADER: '198.51.100.1'})
+            body = await response.read()
+            return response, body, clients
+    finally:
+        await front.bus.close()
+        await runner.cleanup()
+
+
+def test_forwarded_export_is_streamed_for_the_real_client(tmp_path):
+    response, body, clients = asyncio.run(forwarded_export(tmp_path, 25000))
+    assert response.status == 200
+    assert response.headers['Content-Type'].startswith('application/x-ndjson')
+    assert response.headers.get('Transfer-Encoding') == 'chunked'
+    assert body.count(b'\n') == 25000
+    # The owner limits the address the front worker saw, not the spoofed header
+    assert clients == ['127.0.0.1']
+
+
+async def serve(server):
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    await web.UnixSite(runner, str(server.bus.socket_path(server.worker_id))).start()
+    return runner
+
+
+def connect(server):
+    return ClientSession(connector=UnixConnector(path=str(server.bus.socket_path(server.worker_id))))
+
+
+async def bus_broadcast(tmp_path):
+    front = RTAPServer(worker_id=0, workers=2, socket_dir=tmp_path, config={})
+    peer = RTAPServer(worker_id=1, workers=2, socket_dir=tmp_path, config={})
+    name = next(f'cam{i}' for i in count() if front.bus.owner(f'cam{i}') == 0)
+    front.streams[name] = RTSPStream(name, 'rtsp://example')
+    runners = [await serve(front), await serve(peer)]
+    publishers = [asyncio.create_task(server.bus.run_publisher()) for server in (front, peer)]
+
+    async def annotate(n):
+        async with connect(front) as session:
+            await session.post(f'http://worker0/api/streams/{name}/annotations/event', json={'n': n})
+
+    try:
+        # Until the peer reports no subscribers, it is sent broadcasts
+        await annotate(1)
+        await asyncio.sleep(0.2)
+        assert front.bus.subscribed == set()
+
+        async with connect(peer) as session, session.ws_connect('http://worker1/ws') as ws:
+            # The peer announces its first subscriber
+            await asyncio.sleep(0.2)
+            assert front.bus.subscribed == {1}
+            await annotate(2)
+            await annotate(3)
+            received = [json.loads((await ws.receive(timeout=2)).data) for _ in range(2)]
+            return [message['annotation']['data']['n'] for message in received]
+    finally:
+        for publisher in publishers:
+            publisher.cancel()
+        for server, runner in zip((front, peer), runners):
+            await server.bus.close()
+            await runner.cleanup()
+
+
+def test_broadcasts_reach_peers_with_subscribers_only(tmp_path):
+    assert asyncio.run(bus_broadcast(tmp_path)) == [2, 3]
@@ -0,0 +1,156 @@
+import asyncio
+import struct
+
+import pytest
+
+from models import Annotation
+from models.encoding import _pack, pack_array_header
+from subscribers import ANNOTATION, DEFINE, Broadcast, Interner, Subscriber
+
+
+def unpack(data):
+    """Reference MessagePack decoder, written from the spec; returns ``(value, header byte)``."""
+    value, end = _unpack(memoryview(data), 0)
+    assert end == len(data), 'trailing bytes'
+    return value, data[0]
+
+
+def _unpack(data, pos):
+    head = data[pos]
+    pos += 1
+
+    def take(fmt):
+        size = struct.calcsize(fmt)
+        return struct.unpack(fmt, data[pos:pos + size])[0], pos + size
+
+    def items(count, pos):
+        values = []
+        for _ in range(count):
+            value, pos = _unpack(data, pos)
+            values.append(value)
+        return values, pos
+
+    if head <= 0x7f:
+        return head, pos
+    if head >= 0xe0:
+        return head - 0x100, pos
+    if 0xa0 <= head <= 0xbf:
+        size = head & 0x1f
+        return bytes(data[pos:pos + size]).decode(), pos + size
+    if 0x90 <= head <= 0x9f:
+        return items(head & 0x0f, pos)
+    if 0x80 <= head <= 0x8f:
+        values, pos = items(2 * (head & 0x0f), pos)
+        return dict(zip(values[::2], values[1::2])), pos
+    if head in (0xc0, 0xc2, 0xc3):
+        return {0xc0: None, 0xc2: False, 0xc3: True}[head], pos
+    ints = {0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+            0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q', 0xcb: '>d'}
+    if head in ints:
+        return take(ints[head])
+    sizes = {0xd9: '>B', 0xda: '>H', 0xdb: '>I', 0xc4: '>B', 0xc5: '>H', 0xc6: '>I'}
+    if head in sizes:
+        size, pos = take(sizes[head])
+        raw = bytes(data[pos:pos + size])
+        return (raw if head in (0xc4, 0xc5, 0xc6) else raw.decode()), pos + size
+    if head in (0xdc, 0xdd):
+        count, pos = take('>H' if head == 0xdc else '>I')
+        return items(count, pos)
+    if head in (0xde, 0xdf):
+        count, pos = take('>H' if head == 0xde else '>I')
+        values, pos = items(2 * count, pos)
+        return dict(zip(values[::2], values[1::2])), pos
+    raise ValueError(f'unexpected header {head:#x}')
+
+
+def pack(obj):
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+@pytest.mark.parametrize('value, header', [
+    (0, 0x00), (127, 0x7f), (128, 0xcc), (255, 0xcc), (256, 0xcd), (65535, 0xcd), (65536, 0xce),
+    (2 ** 32 - 1, 0xce), (2 ** 32, 0xcf), (2 ** 64 - 1, 0xcf),
+    (-1, 0xff), (-32, 0xe0), (-33, 0xd0), (-128, 0xd0), (-129, 0xd1), (-32768, 0xd1), (-32769, 0xd2),
+    (-2 ** 31, 0xd2), (-2 ** 31 - 1, 0xd3), (-2 ** 63, 0xd3),
+    (None, 0xc0), (True, 0xc3), (False, 0xc2), (1.5, 0xcb), (b'\x00\xff', 0xc4),
+])
+def test_scalars_round_trip(value, header):
+    assert unpack(pack(value)) == (value, header)
+
+
+def test_integers_beyond_64_bits_become_floats():
+    assert unpack(pack(2 ** 64)) == (float(2 ** 64), 0xcb)
+
+
+@pytest.mark.parametrize('size, header', [
+    (0, 0xa0), (31, 0xbf), (32, 0xd9), (255, 0xd9), (256, 0xda), (65535, 0xda), (65536, 0xdb),
+])
+def test_strings_round_trip(size, header):
+    value = 'x' * size
+    assert unpack(pack(value)) == (value, header)
+
+
+def test_string_size_counts_utf8_bytes():
+    # 16 characters, 32 bytes
+    assert unpack(pack('é' * 16)) == ('é' * 16, 0xd9)
+
+
+@pytest.mark.parametrize('size, header', [(0, 0x80), (15, 0x8f), (16, 0xde), (65535, 0xde), (65536, 0xdf)])
+def test_maps_round_trip(size, header):
+    value = {f'k{i}': i for i in range(size)}
+    assert unpack(pack(value)) == (value, header)
+
+
+@pytest.mark.parametrize('size, header', [(0, 0x90), (15, 0x9f), (16, 0xdc), (65535, 0xdc), (65536, 0xdd)])
+def test_arrays_round_trip(size, header):
+    value = list(range(size))
+    assert unpack(pack(value)) == (value, header)
+    assert unpack(pack_array_header(size) + b''.join(pack(i) for i in value)) == (value, header)
+
+
+def test_nested_values_round_trip():
+    value = {'data': {'boxes': [[1, 2.5, -3], None], 'label': 'car', 'ok': True}, 'n': [{}, []]}
+    assert unpack(pack(value))[0] == value
+
+
+class FakeSocket:
+    closed = False
+
+    def __init__(self):
+        self.frames = []
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+
+def test_compact_subscriber_batches_with_definitions():
+    def broadcast(stream_name, annotation_type, n):
+        annotation = Annotation(annotation_type, {'n': n}, '2024-10-25T15:00:00Z')
+        return Broadcast(b'', stream_name, annotation)
+
+    async def scenario():
+        interner = Interner()
+        ws = FakeSocket()
+        subscriber = Subscriber(ws, interner, compact=True)
+        await subscriber.send([broadcast('cam1', 'motion', 1), broadcast('cam1', 'motion', 2),
+                               broadcast('cam2', 'motion', 3)])
+        await subscriber.send([broadcast('cam2', 'person', 4)])
+        # A second connection gets its own definitions for the shared ids
+        other = FakeSocket()
+        await Subscriber(other, interner, compact=True).send([broadcast('cam2', 'person', 5)])
+        return [unpack(frame)[0] for frame in ws.frames + other.frames]
+
+    first, second, third = asyncio.run(scenario())
+    ms = 1729868400000
+    assert first == [
+        [DEFINE, 0, 'cam1'], [DEFINE, 1, 'motion'],
+        [ANNOTATION, 0, 1, ms, first[2][4], {'n': 1}],
+        [ANNOTATION, 0, 1, ms, first[3][4], {'n': 2}],
+        [DEFINE, 2, 'cam2'],
+        [ANNOTATION, 2, 1, ms, first[5][4], {'n': 3}],
+    ]
+    assert second == [[DEFINE, 3, 'person'], [ANNOTATION, 2, 3, ms, second[1][4], {'n': 4}]]
+    assert third == [[DEFINE, 2, 'cam2'], [DEFINE, 3, 'person'], [ANNOTATION, 2, 3, ms, third[2][4], {'n': 5}]]
+    assert all(isinstance(item[4], int) for item in first + second + third if item[0] == ANNOTATION)
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+
+import pytest
+
+from exporter import Export, main
+from models import Annotation, RTSPStream
+from models.filters import AnnotationFilter
+
+
+@pytest.fixture
+def annotations():
+    store = {'event': [], 'Event': [], 'motion': []}
+    for i in range(25):
+        store['event'].append(Annotation('event', {'severity': 'high' if i % 2 else 'low', 'confidence': i / 25,
+                                                   'location': {'area': f'zone{i % 3}'}},
+                                         f'2024-10-25T15:{i:02d}:00Z'))
+    store['Event'].append(Annotation('Event', {'severity': 'high'}, '2024-10-25T16:00:00Z'))
+    store['motion'].append(Annotation('motion', {'frame': 7}, '2024-10-25T15:30:00Z'))
+    return store
+
+
+def export(annotations, fmt, chunk_rows=10, **query):
+    annotation_filter = AnnotationFilter.from_query(query)
+    stream = RTSPStream('cam', 'rtsp://example')
+    stream.annotations = annotations
+    return b''.join(Export(stream.sources(annotation_filter), annotation_filter, fmt,
+                           chunk_rows=chunk_rows).chunks())
+
+
+def test_ndjson(annotations):
+    lines = export(annotations, 'ndjson', types='event,motion').splitlines()
+    assert [json.loads(line)['type'] for line in lines] == ['event'] * 25 + ['motion']
+
+
+def test_csv_columns(annotations):
+    rows = list(csv.DictReader(io.StringIO(export(annotations, 'csv', severity='high').decode())))
+    assert len(rows) == 13
+    assert list(rows[0])[:4] == ['timestamp', 'epoch', 'created_at', 'type']
+    assert {'data.location.area', 'data.confidence', 'data.severity'} <= set(rows[0])
+    assert rows[-1]['type'] == 'Event' and rows[-1]['data.location.area'] == ''
+
+
+def test_npz_columns(annotations):
+    np = pytest.importorskip('numpy')
+    arrays = np.load(io.BytesIO(export(annotations, 'npz', type='event')))
+    assert len(arrays['type']) == 25 and set(arrays['type']) == {'event'}
+    assert arrays['data.confidence'].dtype == np.float64
+    assert arrays['data.confidence'][5] == pytest.approx(0.2)
+    assert arrays['data.location.area'][4] == 'zone1'
+    assert arrays['timestamp'][1] - arrays['timestamp'][0] == 60
+
+
+def test_npz_scans_rows_twice(annotations, monkeypatch):
+    np = pytest.importorskip('numpy')
+    scans = []
+    rows = Export.rows
+    monkeypatch.setattr(Export, 'rows', lambda self: scans.append(1) or rows(self))
+    arrays = np.load(io.BytesIO(export(annotations, 'npz')))
+    assert len(scans) == 2
+    assert len(arrays.files) == 7 and len(arrays['data.frame']) == 27
+
+
+def test_types_match_exactly(annotations):
+    assert export(annotations, 'ndjson', type='Event').count(b'\n') == 1
+
+
+def test_limit(annotations):
+    assert export(annotations, 'ndjson', limit='10').count(b'\n') == 10
+    np = pytest.importorskip('numpy')
+    assert len(np.load(io.BytesIO(export(annotations, 'npz', limit='12')))['timestamp']) == 12
+
+
+def test_cli_exports_snapshot_files(tmp_path):
+    stream = RTSPStream('cam', 'rtsp://example')
+    for i in range(3):
+        stream.add_annotation('motion' if i else 'event', {'frame': i}, f'2024-10-25T15:0{i}:00Z')
+    snapshot_file = tmp_path / 'cam.json'
+    snapshot_file.write_bytes(stream.to_json())
+    output = tmp_path / 'motion.ndjson'
+    assert main([str(snapshot_file), '--types', 'motion', '-o', str(output)]) == 0
+    assert [json.loads(line)['data']['frame'] for line in output.read_text().splitlines()] == [1, 2]
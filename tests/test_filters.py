@@ -0,0 +1,83 @@
+import pytest
+
+from models import RTSPStream
+from models.filters import AnnotationFilter, FilterError, type_constraint, parse_query
+
+
+@pytest.fixture
+def stream():
+    stream = RTSPStream('cam', 'rtsp://example')
+    stream.add_annotation('event', {'severity': 'high', 'confidence': 0.9, 'location': {'area': 'Door'}},
+                          '2024-10-25T15:00:00Z')
+    stream.add_annotation('event', {'severity': 'low', 'confidence': 0.4}, '2024-10-25T15:05:00Z')
+    stream.add_annotation('motion', {'frame': 12, 'motion_area': 300.0}, '2024-10-25T15:02:00Z')
+    stream.add_annotation('health', {'state': 'active'}, '2024-10-25T15:03:00Z')
+    stream.add_annotation('Event', {'severity': 'high'}, '2024-10-25T15:04:00Z')
+    return stream
+
+
+def select(stream, **query):
+    return stream.get_annotations(AnnotationFilter.from_query(query))
+
+
+def test_equality_is_case_insensitive_for_data(stream):
+    assert [a.data['confidence'] for a in select(stream, type='event', area='door')] == [0.9]
+
+
+def test_comparisons_are_numeric(stream):
+    # Suffix keys are how "confidence>=0.8" arrives in a query string
+    assert [a.data['confidence'] for a in select(stream, **{'confidence>': '0.8'})] == [0.9]
+    assert len(select(stream, **{'frame>10': ''})) == 1
+    assert len(select(stream, **{'severity!': 'high'})) == 1
+
+
+def test_start_and_end_compare_instants(stream):
+    found = select(stream, start='2024-10-25T17:01:00+02:00', end='2024-10-25T15:03:00Z')
+    assert sorted(a.type for a in found) == ['health', 'motion']
+
+
+def test_where_expression(stream):
+    found = select(stream, where="(type = motion or severity in (high, critical)) and timestamp < '2024-10-25T15:04:00Z'")
+    assert sorted(a.type for a in found) == ['event', 'motion']
+
+
+def test_types_are_matched_exactly(stream):
+    assert [a.type for a in select(stream, type='event')] == ['event', 'event']
+    assert [a.type for a in select(stream, type='Event')] == ['Event']
+    assert [a.type for a in select(stream, where='type = Event')] == ['Event']
+
+
+def test_conflicting_type_constraints_match_nothing(stream):
+    assert select(stream, type='motion', types='health') == []
+    assert select(stream, type='event', types='motion') == []
+    assert select(stream, types='motion', type='event') == []
+    assert select(stream, type='event', where='type = motion') == []
+
+
+def test_type_constraints_intersect(stream):
+    assert type_constraint(parse_query({'types': 'event,motion,health', 'where': 'type in (motion, health)'})) \
+        == {'motion', 'health'}
+    assert sorted(a.type for a in select(stream, types='event,motion', where='type in (motion, health)')) \
+        == ['motion']
+
+
+def test_type_under_or_is_still_evaluated(stream):
+    found = select(stream, where='type = motion or severity = low')
+    assert sorted(a.type for a in found) == ['event', 'motion']
+
+
+def test_type_inequality(stream):
+    assert sorted(a.type for a in select(stream, where='type != event')) == ['Event', 'health', 'motion']
+
+
+def test_limit():
+    assert AnnotationFilter.from_query({'limit': '10'}).limit == 10
+    for value in ('0', '-1', 'ten'):
+        with pytest.raises(FilterError):
+            AnnotationFilter.from_query({'limit': value})
+
+
+@pytest.mark.parametrize('expression', ['severity =', '(type = event', 'a ~ b', 'timestamp > yesterday'])
+def test_malformed_expressions_raise(expression):
+    with pytest.raises(FilterError):
+        AnnotationFilter.from_query({'where': expression})
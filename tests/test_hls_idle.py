@@ -0,0 +1,44 @@
+import asyncio
+
+from models import RTSPStream
+from rtap_server import RTAPServer
+
+
+def idle_restart(viewer_returns):
+    async def scenario():
+        server = RTAPServer(config={})
+        server.hls_on_demand = True
+        stream = server.streams['cam'] = RTSPStream('cam', 'rtsp://example')
+        events = []
+
+        async def start_hls_stream(stream):
+            events.append('start')
+            server.hls_timelines[stream.name] = object()
+            try:
+                await asyncio.sleep(3600)
+            finally:
+                # Closing the container takes a while
+                await asyncio.sleep(0.05)
+                events.append('closed')
+
+        server.start_hls_stream = start_hls_stream
+        server.ensure_hls_stream(stream)
+        await asyncio.sleep(0)
+        server.hls_last_access['cam'] = 0
+        server.stop_idle_hls_streams()
+        if viewer_returns:
+            server.ensure_hls_stream(stream)
+        await asyncio.sleep(0.1)
+        result = list(events), 'cam' in server.hls_timelines, dict(server.hls_stopping)
+        await server.stop_hls_stream('cam')
+        return result
+
+    return asyncio.run(scenario())
+
+
+def test_idle_stop_waits_for_the_container_and_drops_the_timeline():
+    assert idle_restart(False) == (['start', 'closed'], False, {})
+
+
+def test_restart_waits_for_the_idle_session_to_close():
+    assert idle_restart(True) == (['start', 'closed', 'start'], True, {})
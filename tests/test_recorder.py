@@ -0,0 +1,86 @@
+import time
+
+from models import RTSPStream
+from recorder import INDEX_RECORD, Recording, vod_playlist
+from rtap_server import RTAPServer
+
+
+def write_segment(tmp_path, index, size=188 * 4):
+    path = tmp_path / f"segment_{index}.ts"
+    path.write_bytes(bytes([index % 256]) * size)
+    return path
+
+
+def test_index_is_on_disk_after_each_append(tmp_path):
+    recording = Recording(tmp_path / 'rec', chunk_seconds=600, retention=3600)
+    recording.append(write_segment(tmp_path, 0), 1000.0, 2.0, 90000)
+
+    chunk = recording.chunks[0]
+    assert chunk.index_path.stat().st_size == INDEX_RECORD.size
+    assert chunk.read_index() == [(1000.0, 2.0, 90000, 0, 188 * 4)]
+
+
+def test_reload_serves_entries_recorded_before_restart(tmp_path):
+    directory = tmp_path / 'rec'
+    recording = Recording(directory, chunk_seconds=4, retention=3600)
+    for i in range(4):
+        recording.append(write_segment(tmp_path, i), 1000.0 + i * 2, 2.0, 90000 + i * 180000)
+    # No close(): a crash must not lose the index
+    reloaded = Recording(directory, chunk_seconds=4, retention=3600)
+
+    assert len(reloaded.chunks) == 2
+    entries = reloaded.entries(1001.0, 1005.0)
+    assert [start for _, start, _, _, _, _ in entries] == [1000.0, 1002.0, 1004.0]
+    chunk, _, _, _, offset, length = entries[1]
+    with open(chunk.path, 'rb') as f:
+        f.seek(offset)
+        assert f.read(length) == bytes([1]) * length
+
+    playlist = vod_playlist(entries)
+    assert playlist.count('#EXT-X-BYTERANGE') == 3
+    assert '#EXT-X-DISCONTINUITY' not in playlist
+    assert playlist.endswith('#EXT-X-ENDLIST\n')
+
+
+def test_load_removes_chunks_without_usable_index(tmp_path):
+    directory = tmp_path / 'rec'
+    directory.mkdir()
+    (directory / '5000.ts').write_bytes(b'\x47' * 188)
+    (directory / '5000.idx').write_bytes(b'')
+    (directory / '6000.ts').write_bytes(b'\x47' * 188)
+    (directory / '7000.idx').write_bytes(b'\x00' * INDEX_RECORD.size)
+
+    recording = Recording(directory)
+
+    assert recording.chunks == []
+    assert list(directory.iterdir()) == []
+
+
+def test_prune_deletes_closed_chunks_past_retention(tmp_path):
+    directory = tmp_path / 'rec'
+    recording = Recording(directory, chunk_seconds=10, retention=100)
+    recording.append(write_segment(tmp_path, 0), 1000.0, 2.0, 0)
+    recording.append(write_segment(tmp_path, 1), 1020.0, 2.0, 0)
+
+    assert recording.prune(now=1500.0) == 1
+    assert [chunk.start for chunk in recording.chunks] == [1020.0]
+    assert sorted(path.name for path in directory.iterdir()) == ['1020000.idx', '1020000.ts']
+    # The chunk being written is never pruned
+    assert recording.prune(now=5000.0) == 0
+
+
+
+def test_closed_recordings_are_aged_out(tmp_path):
+    server = RTAPServer(config={})
+    server.recording_dir = tmp_path / 'recordings'
+    for name in ('deleted', 'live'):
+        recording = Recording(server.recording_dir / name)
+        recording.append(write_segment(tmp_path, 0), time.time() - 2 * 86400, 2.0, 0)
+        recording.close()
+    server.streams['live'] = RTSPStream('live', 'rtsp://example')
+
+    server.prune_closed_recordings()
+    assert not (server.recording_dir / 'deleted').exists()
+    # The stream still exists, so only its expired chunk goes
+    assert list(server.recording_dir.iterdir()) == [server.recording_dir / 'live']
+    assert not list((server.recording_dir / 'live').iterdir())
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from models import RTSPStream
+from models.rollup import MAX_TYPES, Rollup, aggregate
+
+
+def test_claim_reuses_slots_of_expired_buckets():
+    rollup = Rollup(resolution=1, capacity=4)
+    rollup.add(10, [('score', 1.0)])
+    assert rollup.bucket(10) == (1, {'score': [1.0, 1.0, 1.0, 1.0]})
+    # Bucket 14 maps to the same slot and resets it
+    rollup.add(14, [('score', 5.0)])
+    assert rollup.bucket(10) is None
+    assert rollup.bucket(14) == (1, {'score': [5.0, 5.0, 5.0, 1.0]})
+
+
+def test_claim_rejects_buckets_outside_the_window():
+    rollup = Rollup(resolution=1, capacity=4)
+    rollup.add(20, [])
+    assert rollup._claim(16) is None
+    assert rollup._claim(17) == 17 % 4
+    rollup.add(17, [])
+    # A slot already holding a newer bucket is not handed back to an older one
+    rollup.add(21, [])
+    assert rollup._claim(17) is None
+    assert rollup.newest == 21
+
+
+def test_aggregate_across_ring_wrap_around():
+    first, second = Rollup(60, 5), Rollup(60, 5)
+    for minute in range(3, 11):
+        first.add(minute * 60 + 1, [('score', float(minute))])
+    second.add(9 * 60, [('score', 100.0)])
+    buckets = aggregate([first, second])
+    # Only the last five minutes are retained; slots have wrapped around
+    assert [b['start'] for b in buckets] == [datetime.fromtimestamp(m * 60).isoformat() for m in range(6, 11)]
+    assert [b['count'] for b in buckets] == [1, 1, 1, 2, 1]
+    assert buckets[3]['fields']['score'] == {'min': 9.0, 'max': 100.0, 'avg': 54.5, 'count': 2}
+    assert len(aggregate([first], start=8 * 60, end=9 * 60 + 59)) == 2
+
+
+def test_rolled_up_types_are_capped():
+    stream = RTSPStream('cam', 'rtsp://example')
+    now = datetime.now().isoformat()
+    for i in range(MAX_TYPES + 10):
+        stream.add_annotation(f'type{i}', {'score': 1}, now)
+    assert len(stream.rollups) == MAX_TYPES
+    assert len(stream.annotations) == MAX_TYPES + 10
@@ -0,0 +1,40 @@
+from settings import load_config
+
+
+def test_invalid_stream_entries_are_skipped(tmp_path):
+    path = tmp_path / 'config.yml'
+    path.write_text('''
+streams:
+  - name: camera1
+    url: rtsp://example/1
+    parameters:
+      renditions: ["720p"]
+      frame_timeout: 3
+  - name: 2
+    url: rtsp://example/2
+  - name: camera1
+    url: rtsp://example/dup
+  - name: ".."
+    url: rtsp://example/escape
+  - name: flat
+    url: rtsp://example/flat
+    parameters: [hls_on_demand]
+  - name: badladder
+    url: rtsp://example/ladder
+    parameters:
+      renditions: [{name: ../../evil, height: 480}]
+  - name: badtimeout
+    url: rtsp://example/timeout
+    parameters:
+      frame_timeout: abc
+  - url: rtsp://example/nameless
+''')
+    streams = load_config(str(path))['streams']
+    assert [(s['name'], s['url']) for s in streams] == [('camera1', 'rtsp://example/1'), ('2', 'rtsp://example/2')]
+    assert streams[1]['parameters'] == {}
+
+
+def test_streams_must_be_a_list(tmp_path):
+    path = tmp_path / 'config.yml'
+    path.write_text('streams:\n  camera1: rtsp://example/1\n')
+    assert load_config(str(path))['streams'] == []
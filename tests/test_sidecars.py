@@ -0,0 +1,29 @@
+import json
+
+from models import RTSPStream
+from sidecars import Segment, render_json, segment_annotations
+
+
+def stream_with(*timestamps):
+    stream = RTSPStream('cam', 'rtsp://example')
+    for i, timestamp in enumerate(timestamps):
+        stream.add_annotation('motion' if i % 2 else 'event', {'n': i}, timestamp)
+    return stream
+
+
+def test_segment_annotations_are_bounded_and_ordered():
+    # 1729868400 is 2024-10-25T15:00:00Z
+    stream = stream_with('2024-10-25T15:00:01Z', '2024-10-25T15:00:03Z', '2024-10-25T15:00:02Z',
+                         '2024-10-25T15:00:00Z', 'not a time', '2024-10-25T15:00:02.500Z')
+    segment = Segment(0, 1729868400.0, 1729868402.0, 2.0, 0)
+    assert [ann.data['n'] for ann in segment_annotations(stream, segment)] == [3, 0]
+    later = Segment(1, 1729868402.0, 1729868404.0, 2.0, 180000)
+    assert [ann.data['n'] for ann in segment_annotations(stream, later)] == [2, 5, 1]
+
+
+def test_late_annotation_reaches_its_segment():
+    stream = stream_with('2024-10-25T15:00:05Z')
+    segment = Segment(0, 1729868400.0, 1729868402.0, 2.0, 0)
+    assert json.loads(render_json(stream, segment))['annotations'] == []
+    stream.add_annotation('event', {'late': True}, '2024-10-25T15:00:01Z')
+    assert [a['data'] for a in json.loads(render_json(stream, segment))['annotations']] == [{'late': True}]
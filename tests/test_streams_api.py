@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from ladder import parse_renditions
+from models import RTSPStream
+from rtap_server import RTAPServer
+from supervisor import timing_parameter
+
+
+def request(method, path, **kwargs):
+    async def scenario():
+        server = RTAPServer(config={})
+        async with TestClient(TestServer(server.create_app())) as client:
+            response = await client.request(method, path, **kwargs)
+            return response.status, await response.json(), server
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('name', ['..', '.', 'a/b', '../../evil', 'cam 1', '', 7])
+def test_stream_names_must_be_plain(name):
+    status, body, server = request('POST', '/api/streams', json={'name': name, 'url': 'rtsp://example'})
+    assert status == 400
+    assert not server.streams
+
+
+@pytest.mark.parametrize('name', ['..', '../../evil', 'a/b', 'hd.1'])
+def test_rendition_names_must_be_plain(name):
+    with pytest.raises(ValueError):
+        parse_renditions([{'name': name, 'height': 480}])
+    status, body, server = request('POST', '/api/streams', json={
+        'name': 'cam', 'url': 'rtsp://example', 'parameters': {'renditions': [{'name': name, 'height': 480}]}
+    })
+    assert status == 400
+    assert 'rendition name' in body['error']
+
+
+def test_preset_and_generated_rendition_names_are_accepted():
+    assert [r.name for r in parse_renditions(['720p', {'height': 300}, {'name': 'low_bw-1', 'height': 200}])] \
+        == ['720p', '300p', 'low_bw-1']
+
+
+def test_remove_hls_dir_stays_under_hls_dir(tmp_path):
+    server = RTAPServer(config={})
+    server.hls_dir = tmp_path / 'rtap_hls'
+    (server.hls_dir / 'cam').mkdir(parents=True)
+    victim = tmp_path / 'victim'
+    victim.mkdir()
+    for name in ('..', '.', '../victim', 'cam/..'):
+        server.remove_hls_dir(name)
+    assert victim.exists() and (server.hls_dir / 'cam').exists()
+    server.remove_hls_dir('cam')
+    assert not (server.hls_dir / 'cam').exists()
+
+
+
+@pytest.mark.parametrize('parameters', [
+    {'frame_timeout': 'abc'}, {'stall_timeout': 0}, {'max_reconnects': 1.5e400}, {'max_reconnects': '2.5'},
+    {'reconnect_base_delay': -1}, {'reconnect_max_delay': True}, {'record_retention': [1]}, ['renditions'],
+])
+def test_unusable_parameters_are_rejected(parameters):
+    status, body, server = request('POST', '/api/streams', json={
+        'name': 'cam', 'url': 'rtsp://example', 'parameters': parameters
+    })
+    assert status == 400
+    assert not server.streams
+
+
+def test_patch_validates_parameters():
+    async def scenario():
+        server = RTAPServer(config={})
+        server.streams['cam'] = RTSPStream('cam', 'rtsp://example', parameters={'frame_timeout': 3})
+        server.streams['cam'].status = 'paused'
+        async with TestClient(TestServer(server.create_app())) as client:
+            bad = await client.patch('/api/streams/cam', json={'parameters': {'max_reconnects': 'abc'}})
+            removed = await client.patch('/api/streams/cam', json={'parameters': {'frame_timeout': None}})
+            return bad.status, removed.status, server.streams['cam'].parameters
+
+    assert asyncio.run(scenario()) == (400, 200, {})
+
+
+def test_supervisor_reads_numeric_strings():
+    assert timing_parameter({'frame_timeout': '2.5', 'max_reconnects': '3'}, 'frame_timeout') == 2.5
+    assert timing_parameter({'max_reconnects': '3'}, 'max_reconnects') == 3
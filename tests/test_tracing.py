@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from rtap_server import RTAPServer
+
+
+def get_trace(query):
+    async def scenario():
+        server = RTAPServer(config={})
+        server.tracer.enabled = True
+        for i in range(5):
+            with server.tracer.span(f'stage{i}'):
+                pass
+        async with TestClient(TestServer(server.create_app())) as client:
+            response = await client.get('/api/admin/trace', params=query)
+            return response.status, await response.json()
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('limit', ['abc', '-3', '1.5', ''])
+def test_trace_limit_must_be_non_negative_integer(limit):
+    status, body = get_trace({'limit': limit})
+    assert status == 400
+    assert 'limit' in body['error']
+
+
+def test_trace_limit_keeps_latest_spans():
+    assert [e['name'] for e in get_trace({'limit': '2'})[1]['traceEvents']] == ['stage3', 'stage4']
+    assert len(get_trace({'limit': '0'})[1]['traceEvents']) == 5
+    assert len(get_trace({})[1]['traceEvents']) == 5
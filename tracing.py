@@ -0,0 +1,125 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# (name, category, start_us, duration_us, thread_id, args)
+Span = Tuple[str, str, float, float, int, Optional[Dict[str, Any]]]
+
+
+class Tracer:
+    """Bounded in-memory buffer of timing spans for the stream pipeline.
+
+    Spans are recorded only while the tracer is enabled, so the hot paths in
+    ``process_stream`` and ``start_hls_stream`` pay a single attribute check
+    when tracing is off.
+    """
+
+    def __init__(self, enabled: bool = False, capacity: int = 100000):
+        self.enabled = enabled
+        self.spans: Deque[Span] = deque(maxlen=capacity)
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._null = nullcontext()
+
+    @classmethod
+    def from_env(cls) -> 'Tracer':
+        return cls(
+            enabled=os.getenv('RTAP_TRACE', 'false').lower() == 'true',
+            capacity=int(os.getenv('RTAP_TRACE_BUFFER', 100000))
+        )
+
+    def span(self, name: str, category: str = 'pipeline', **args):
+        """Return a context manager timing the enclosed block."""
+        if not self.enabled:
+            return self._null
+        return self._span(name, category, args or None)
+
+    @contextmanager
+    def _span(self, name: str, category: str, args: Optional[Dict[str, Any]]):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.spans.append((
+                name,
+                category,
+                (start - self._origin) * 1e6,
+                (end - start) * 1e6,
+                threading.get_ident(),
+                args
+            ))
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Aggregate buffered spans per name (count, total and max in ms)."""
+        stats: Dict[str, Dict[str, float]] = {}
+        for name, _, _, duration, _, _ in list(self.spans):
+            entry = stats.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += duration / 1000
+            entry["max_ms"] = max(entry["max_ms"], duration / 1000)
+        for entry in stats.values():
+            entry["avg_ms"] = entry["total_ms"] / entry["count"]
+        return stats
+
+    def to_chrome_trace(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Export buffered spans in Chrome trace event format."""
+        spans = list(self.spans)
+        if limit:
+            spans = spans[-limit:]
+
+        events: List[Dict[str, Any]] = []
+        for name, category, start, duration, tid, args in spans:
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round(start, 3),
+                "dur": round(duration, 3),
+                "pid": self._pid,
+                "tid": tid
+            }
+            if args:
+                event["args"] = args
+            events.append(event)
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+# Sort keys accepted by pstats.Stats.sort_stats
+SORT_KEYS = frozenset(pstats.Stats.sort_arg_dict_default)
+
+
+class SamplingProfiler:
+    """Runs cProfile against the live event loop thread for a fixed window."""
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, seconds: float, sort: str = 'cumulative', limit: int = 50) -> str:
+        async with self._lock:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()